@@ -0,0 +1,120 @@
+"""
+Load-test the API with concurrent httpx clients against local stand-ins.
+
+Redis is replaced by an in-process fakeredis and Postgres by a stand-in pool whose
+queries take --db-latency-ms. Half of the requested uids are cached in Redis and
+half fall through to Postgres. Reports p50/p99 latency and requests/sec for each
+level of concurrency.
+
+Pass --blocking to make the stand-in block the event loop while "querying", which
+is what the previous psycopg2-based handlers did:
+
+    python -m benchmarks.bench_api --clients 1 50 500
+    python -m benchmarks.bench_api --clients 1 50 500 --blocking
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from redis.asyncio import BlockingConnectionPool
+
+from benchmarks.synthetic import fake_storage_rows
+from src import async_storage, settings
+from src.api import app
+
+
+class StandInPool:
+    """Minimal asyncpg.Pool stand-in with a fixed query latency."""
+
+    def __init__(self, rows: list, latency: float, blocking: bool):
+        self.rows = rows
+        self.latency = latency
+        self.blocking = blocking
+
+    async def fetch(self, query: str, *args) -> list:
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        if args:
+            return [row for row in self.rows if row[0] == args[0]]
+        return [(row[0],) for row in self.rows]
+
+    async def close(self) -> None:
+        pass
+
+
+async def setup(users: int, latency: float, blocking: bool) -> list:
+    try:
+        from fakeredis import FakeAsyncRedis
+    except ImportError as e:
+        raise SystemExit("fakeredis is required: pip install fakeredis") from e
+
+    user_data, user_address_data = fake_storage_rows(users)
+    rows = [
+        tuple(u.values()) + tuple(a[k] for k in list(a)[1:])
+        for u, a in zip(user_data, user_address_data)
+    ]
+    async_storage._pg_pool = StandInPool(rows, latency, blocking)
+    # Same blocking pool as async_storage.open_pools
+    async_storage._redis = FakeAsyncRedis(
+        decode_responses=True,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        connection_pool_class=BlockingConnectionPool,
+    )
+
+    for user in user_data[: users // 2]:
+        await async_storage._redis.hset(
+            user["uid"], mapping={k: v for k, v in user.items() if k != "uid"}
+        )
+
+    return [user["uid"] for user in user_data]
+
+
+async def run(clients: int, requests: int, uids: list) -> tuple[list, float]:
+    latencies = []
+    remaining = iter(range(requests))
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench"
+    ) as http:
+
+        async def worker():
+            for i in remaining:
+                start = time.perf_counter()
+                response = await http.get(f"/api/v2/datapipeline/{uids[i % len(uids)]}")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+
+    return latencies, elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    parser.add_argument("--blocking", action="store_true")
+    args = parser.parse_args()
+
+    uids = await setup(args.users, args.db_latency_ms / 1000, args.blocking)
+
+    print(f"{'clients':>8} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>10}")
+    for clients in args.clients:
+        latencies, elapsed = await run(clients, args.requests, uids)
+        cuts = statistics.quantiles(latencies, n=100)
+        print(
+            f"{clients:>8} {cuts[49] * 1000:>9.2f} {cuts[98] * 1000:>9.2f} "
+            f"{len(latencies) / elapsed:>10,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""
+Benchmark a run streamed one chunk at a time (`main.run_streaming`) against the staged
+`async_pipeline.run_pipeline`, where fetching, transforming and loading overlap.
+
+Synthetic pages stand in for the API and the Redis and Postgres loaders are stubbed.
+Each is given a simulated latency, so the benchmark shows how much of the network and
+database time the staged pipeline hides, and which stage it reports as the bottleneck:
+
+    python -m benchmarks.bench_async_pipeline --users 20000 --page-ms 20 --pg-ms 50
+"""
+import argparse
+import asyncio
+import time
+from unittest.mock import patch
+
+from benchmarks.synthetic import fake_api_users
+from src import main as pipeline
+from src.async_pipeline import run_pipeline
+
+PAGE_SIZE = 100
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--chunk-size", type=int, default=1_000)
+    parser.add_argument("--page-ms", type=float, default=20)
+    parser.add_argument("--redis-ms", type=float, default=10)
+    parser.add_argument("--pg-ms", type=float, default=50)
+    parser.add_argument("--postgres-workers", type=int, default=2)
+    args = parser.parse_args()
+
+    def pages():
+        for start in range(0, args.users, PAGE_SIZE):
+            time.sleep(args.page_ms / 1000)
+            yield fake_api_users(min(PAGE_SIZE, args.users - start), start)
+
+    def stub_redis(user_data, user_address_data) -> dict:
+        time.sleep(args.redis_ms / 1000)
+        return {"keys": len(user_data), "chunk_times": []}
+
+    def stub_load(user_data, user_address_data, mode: str) -> dict:
+        time.sleep(args.pg_ms / 1000)
+        counts = {"inserted": len(user_data), "updated": 0, "skipped": 0}
+        return {"users": counts, "users_address": counts}
+
+    runs = {
+        "sequential": lambda: pipeline.run_streaming(pages(), args.chunk_size),
+        "staged": lambda: asyncio.run(
+            run_pipeline(
+                pipeline.iter_chunks(pages(), args.chunk_size),
+                pipeline.transform_chunk,
+                pipeline.cache_chunk,
+                pipeline.store_chunk,
+                postgres_workers=args.postgres_workers,
+            )
+        ),
+    }
+
+    print(f"{'mode':<12} {'seconds':>8} {'users/s':>10}  bottleneck")
+    with patch.object(pipeline, "add_user_to_redis", stub_redis), patch.object(
+        pipeline, "load_users_bulk", stub_load
+    ), patch.object(pipeline.logging, "info"):
+        for mode, run in runs.items():
+            start = time.perf_counter()
+            totals = run()
+            elapsed = time.perf_counter() - start
+
+            bottleneck = ""
+            if "stages" in totals:
+                stage = totals["stages"][totals["bottleneck"]]
+                bottleneck = f"{totals['bottleneck']} ({stage['utilization']:.0%} busy)"
+            print(
+                f"{mode:<12} {elapsed:>8.2f} {totals['users'] / elapsed:>10,.0f}"
+                f"  {bottleneck}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compare the Redis cache encodings: memory per user and read/write latency.
+
+For each encoding users are written with `add_user_to_redis`, MEMORY USAGE is sampled
+on a share of the keys, and they are read back one at a time with
+`get_user_from_redis` and in pipelines with `get_users_from_redis`. MEMORY USAGE needs
+a real redis-server, fakeredis does not implement it:
+
+    python -m benchmarks.bench_cache_encoding --host 127.0.0.1 --port 6379 --users 10000
+"""
+import argparse
+import random
+import time
+from unittest.mock import patch
+
+import redis as redis_client
+
+from benchmarks.synthetic import fake_storage_rows
+from src import storage
+
+ENCODINGS = [
+    ("hash", "none"),
+    ("json", "none"),
+    ("json", "zlib"),
+    ("msgpack", "none"),
+    ("msgpack", "zlib"),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--samples", type=int, default=1_000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    storage.redis = redis_client.Redis(host=args.host, port=args.port)
+    storage.redis.ping()
+
+    user_data, user_address_data = fake_storage_rows(args.users)
+    uids = [user["uid"] for user in user_data]
+    sample = random.Random(0).sample(uids, min(args.samples, len(uids)))
+    batches = [
+        uids[i : i + args.batch_size] for i in range(0, len(uids), args.batch_size)
+    ]
+
+    print(f"{args.users:,} users, MEMORY USAGE sampled on {len(sample):,} keys")
+    print(
+        f"{'encoding':<14} {'bytes/user':>10} {'write us/user':>14} "
+        f"{'GET us':>8} {f'MGET x{args.batch_size} us/user':>20}"
+    )
+    for encoding, compression in ENCODINGS:
+        storage.redis.flushdb()
+        start = time.perf_counter()
+        storage.add_user_to_redis(
+            user_data,
+            user_address_data,
+            ttl=3600,
+            encoding=encoding,
+            compression=compression,
+        )
+        write = (time.perf_counter() - start) / args.users * 1e6
+
+        memory = sum(
+            storage.redis.memory_usage(uid, samples=0) for uid in sample
+        ) / len(sample)
+
+        with patch.object(storage.settings, "REDIS_CACHE_ENCODING", encoding):
+            start = time.perf_counter()
+            for uid in sample:
+                storage.get_user_from_redis(uid)
+            single = (time.perf_counter() - start) / len(sample) * 1e6
+
+            start = time.perf_counter()
+            for batch in batches:
+                storage.get_users_from_redis(batch)
+            many = (time.perf_counter() - start) / args.users * 1e6
+
+        name = encoding if compression == "none" else f"{encoding}+{compression}"
+        print(
+            f"{name:<14} {memory:>10,.0f} {write:>14.1f} {single:>8.1f} {many:>20.1f}"
+        )
+    storage.redis.flushdb()
+
+
+if __name__ == "__main__":
+    main()
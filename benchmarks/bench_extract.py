@@ -0,0 +1,62 @@
+"""
+Benchmark the extract stage: the per-row `extract_*_for_storage` helpers versus the
+columnar `extract_frames`.
+
+Each extractor is timed together with rendering the rows the Redis writer and the
+bulk loader consume, since that is where the two representations are read:
+
+    python -m benchmarks.bench_extract --records 100000
+"""
+import argparse
+import logging
+import time
+
+from benchmarks.synthetic import fake_api_users
+from src.main import (
+    clean_records,
+    extract_address_data_for_storage,
+    extract_frames,
+    extract_user_data_for_storage,
+)
+from src.storage import ADDRESS_COLUMNS, USER_COLUMNS, _iter_rows
+
+
+def per_row(data: list) -> tuple:
+    return extract_user_data_for_storage(data), extract_address_data_for_storage(data)
+
+
+def consume(users, addresses) -> int:
+    rows = 0
+    for _ in _iter_rows(users, USER_COLUMNS, 0):
+        rows += 1
+    for _ in _iter_rows(addresses, ADDRESS_COLUMNS, 0):
+        rows += 1
+    return rows
+
+
+def measure(extract, data: list) -> tuple[float, float]:
+    start = time.perf_counter()
+    users, addresses = extract(data)
+    extracted = time.perf_counter() - start
+    consume(users, addresses)
+    return extracted, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    data = clean_records(fake_api_users(args.records))
+
+    print(f"{'extract':<16} {'extract s':>10} {'+ rows s':>10} {'records/s':>12}")
+    for name, extract in (("per-row dicts", per_row), ("extract_frames", extract_frames)):
+        extracted, total = measure(extract, data)
+        print(
+            f"{name:<16} {extracted:>10.3f} {total:>10.3f} {args.records / total:>12,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark PII hashing: one `hash_pii` call per value versus `hash_pii_batch` in the
+calling thread, salted and keyed, and spread over process and thread pools.
+
+Pools are started before timing, as the pipeline keeps them across batches:
+
+    python -m benchmarks.bench_hash --values 1000000 --workers 4 --chunk-size 10000
+"""
+import argparse
+import os
+import time
+
+from src.salt import close_executors, hash_pii, hash_pii_batch
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--values", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    values = [f"{i:09d}" for i in range(args.values)]
+    runs = {
+        "hash_pii per call": lambda: [hash_pii(value) for value in values],
+        "batch, inline": lambda: hash_pii_batch(
+            values, workers=1, chunk_size=args.chunk_size
+        ),
+        "batch, keyed, inline": lambda: hash_pii_batch(
+            values, workers=1, chunk_size=args.chunk_size, mode="keyed", key="bench"
+        ),
+    }
+    for executor in ("process", "thread"):
+        # Start the pool on a small batch so its start-up is not timed
+        hash_pii_batch(["0"] * 2, workers=args.workers, chunk_size=1, executor=executor)
+        runs[f"batch, {args.workers} {executor} pool"] = (
+            lambda executor=executor: hash_pii_batch(
+                values,
+                workers=args.workers,
+                chunk_size=args.chunk_size,
+                executor=executor,
+            )
+        )
+
+    print(f"{os.cpu_count()} CPUs, {args.values:,} values")
+    print(f"{'path':<24} {'seconds':>8} {'hashes/s':>12}")
+    try:
+        for name, run in runs.items():
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            print(f"{name:<24} {elapsed:>8.2f} {args.values / elapsed:>12,.0f}")
+    finally:
+        close_executors()
+
+
+if __name__ == "__main__":
+    main()
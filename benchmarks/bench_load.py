@@ -0,0 +1,78 @@
+"""
+Benchmark the Postgres load path: per-row INSERTs versus `load_users_bulk` (COPY).
+
+Reports rows/sec for each batch size. The tables are truncated before every run, so
+point POSTGRES_HOST (see src/settings.py) at a throwaway database, for example the
+docker-compose `postgres` service:
+
+    POSTGRES_HOST=localhost python -m benchmarks.bench_load --sizes 10 1000 100000 1000000
+
+The per-row path is skipped above --max-per-row users, since it needs hours at 1M.
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import fake_storage_rows
+from src.migrations import migrate
+from src.storage import (
+    get_connection,
+    insert_into_address_table,
+    insert_into_user_table,
+    load_users_bulk,
+)
+
+
+def truncate_tables() -> None:
+    with get_connection() as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE users_address, users;")
+
+
+def per_row(user_data: list, user_address_data: list) -> None:
+    for user in user_data:
+        insert_into_user_table(user)
+    for address in user_address_data:
+        insert_into_address_table(address)
+
+
+def bulk(user_data: list, user_address_data: list) -> None:
+    load_users_bulk(user_data, user_address_data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 1_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--max-per-row", type=int, default=100_000)
+    args = parser.parse_args()
+
+    migrate()
+
+    print(f"{'users':>10} {'per-row rows/s':>16} {'COPY rows/s':>14} {'speedup':>8}")
+    for size in args.sizes:
+        user_data, user_address_data = fake_storage_rows(size)
+        rows = 2 * size
+        results = {}
+
+        for name, loader in (("per_row", per_row), ("bulk", bulk)):
+            if name == "per_row" and size > args.max_per_row:
+                continue
+            truncate_tables()
+            start = time.perf_counter()
+            loader(user_data, user_address_data)
+            results[name] = rows / (time.perf_counter() - start)
+
+        truncate_tables()
+        per_row_rate = results.get("per_row")
+        if per_row_rate:
+            per_row_text = f"{per_row_rate:,.0f}"
+            speedup_text = f"{results['bulk'] / per_row_rate:.1f}x"
+        else:
+            per_row_text, speedup_text = "skipped", "-"
+        print(
+            f"{size:>10} {per_row_text:>16} {results['bulk']:>14,.0f} {speedup_text:>8}"
+        )
+
+if __name__ == "__main__":
+    main()
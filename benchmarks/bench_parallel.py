@@ -0,0 +1,89 @@
+"""
+Benchmark how the pipeline scales across worker processes with `parallel.run_parallel`.
+
+Every worker generates its partition of synthetic users and streams it through
+validation, cleanup, extraction and PII hashing. The Redis and Postgres loaders are
+stubbed, so the numbers cover the CPU-bound stages. Each worker pool is started
+before it is timed, as the pipeline keeps it between runs:
+
+    python -m benchmarks.bench_parallel --users 200000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import time
+from itertools import accumulate
+from unittest.mock import patch
+
+from benchmarks.synthetic import fake_api_users
+from src import main as pipeline
+from src.parallel import close_executor, partition_sizes, run_parallel
+
+PAGE_SIZE = 100
+
+
+def synthetic_pages(partition: tuple):
+    start, size = partition
+    for offset in range(start, start + size, PAGE_SIZE):
+        yield fake_api_users(min(PAGE_SIZE, start + size - offset), offset)
+
+
+def stub_redis(user_data, user_address_data) -> dict:
+    return {"keys": len(user_data), "chunk_times": []}
+
+
+def stub_load(user_data, user_address_data, mode: str) -> dict:
+    counts = {"inserted": len(user_data), "updated": 0, "skipped": 0}
+    return {"users": counts, "users_address": counts}
+
+
+def process(pages, chunk_size: int = 1_000) -> dict:
+    with patch.object(pipeline, "add_user_to_redis", stub_redis), patch.object(
+        pipeline, "load_users_bulk", stub_load
+    ), patch.object(pipeline.logging, "info"):
+        return pipeline.run_streaming(pages, chunk_size)
+
+
+def partitions(users: int, count: int) -> list:
+    """(first user, size) of each partition of `users` synthetic users."""
+    sizes = partition_sizes(users, count)
+    return list(zip(accumulate([0, *sizes[:-1]]), sizes))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--partitions-per-worker", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.users:,} users")
+    print(f"{'workers':>7} {'seconds':>8} {'users/s':>10} {'speed-up':>9}")
+    baseline = None
+    try:
+        for workers in args.workers:
+            # Start the pool on a small run so its start-up is not timed
+            run_parallel(
+                partitions(workers, workers), process, synthetic_pages, workers=workers
+            )
+
+            start = time.perf_counter()
+            totals = run_parallel(
+                partitions(args.users, workers * args.partitions_per_worker),
+                process,
+                synthetic_pages,
+                workers=workers,
+            )
+            elapsed = time.perf_counter() - start
+            assert totals["users"] == args.users and not totals["failed"]
+
+            rate = args.users / elapsed
+            baseline = baseline or rate
+            print(
+                f"{workers:>7} {elapsed:>8.2f} {rate:>10,.0f} {rate / baseline:>8.2f}x"
+            )
+    finally:
+        close_executor()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Micro-benchmark the Redis cache writer: one HSET + EXPIRE round-trip pair per user
+versus the pipelined `add_user_to_redis`.
+
+By default a fakeredis TCP server is started in-process (`pip install fakeredis`), so
+every command still crosses a real socket. Pass --host/--port to use a local
+redis-server instead:
+
+    python -m benchmarks.bench_redis_write --users 10000 --chunk-sizes 100 1000
+"""
+import argparse
+import threading
+import time
+
+import redis as redis_client
+
+from benchmarks.synthetic import fake_storage_rows
+from src import storage
+
+
+def start_fake_server(port: int) -> None:
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError as e:
+        raise SystemExit("fakeredis is required without --host: pip install fakeredis") from e
+
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def per_user(user_data: list, user_address_data: list) -> None:
+    """The previous writer: two round-trips for every user."""
+    for ud, uad in zip(user_data, user_address_data):
+        uid = ud["uid"]
+        storage.redis.hset(
+            uid, mapping={k: v for k, v in (ud | uad).items() if k != "uid"}
+        )
+        storage.redis.expire(uid, 120)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[100, 1_000])
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    if args.host is None:
+        start_fake_server(args.port)
+    storage.redis = redis_client.Redis(host=args.host or "127.0.0.1", port=args.port)
+    storage.redis.ping()
+
+    user_data, user_address_data = fake_storage_rows(args.users)
+
+    storage.redis.flushdb()
+    start = time.perf_counter()
+    per_user(user_data, user_address_data)
+    baseline = args.users / (time.perf_counter() - start)
+    print(f"{'per-user round-trips':<28} {baseline:>12,.0f} users/s")
+
+    for chunk_size in args.chunk_sizes:
+        storage.redis.flushdb()
+        start = time.perf_counter()
+        result = storage.add_user_to_redis(
+            user_data, user_address_data, chunk_size=chunk_size
+        )
+        rate = result["keys"] / (time.perf_counter() - start)
+        slowest = max(result["chunk_times"]) * 1000
+        print(
+            f"{f'pipelined chunk={chunk_size}':<28} {rate:>12,.0f} users/s "
+            f"{rate / baseline:>6.1f}x  {len(result['chunk_times'])} round-trips, "
+            f"slowest chunk {slowest:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Compare the users schema before and after the native type migrations.
+
+The tables are dropped and created at migration 1 (every column VARCHAR, ts an INT),
+loaded with synthetic users spread over runs two minutes apart, and measured: average
+row size, table and index sizes, and the latency of the API's queries. The schema is
+then migrated to the latest version (uuid, date, timestamptz and the new indexes) on
+the same rows and measured again. Point POSTGRES_HOST at a throwaway database:
+
+    POSTGRES_HOST=localhost python -m benchmarks.bench_schema --users 1000000
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timezone
+
+from benchmarks.synthetic import fake_storage_rows
+from src.migrations import migrate
+from src.storage import (
+    ADDRESS_COLUMNS,
+    USER_COLUMNS,
+    _copy_rows,
+    _iter_rows,
+    get_connection,
+)
+
+TABLES = ("users", "users_address")
+
+# The API's queries. The keyset and "since" positions are bound per schema version.
+QUERIES = {
+    "first page": "SELECT uid, ts FROM users ORDER BY ts DESC, uid DESC LIMIT 100;",
+    "deep page": """
+        SELECT uid, ts FROM users WHERE (ts, uid) < (%(ts)s, %(uid)s)
+        ORDER BY ts DESC, uid DESC LIMIT 100;
+    """,
+    "user by uid": """
+        SELECT * FROM users JOIN users_address UA ON users.uid = UA.uid
+        WHERE users.uid = %(uid)s;
+    """,
+    "addresses since": "SELECT count(*) FROM users_address WHERE ts >= %(since)s;",
+}
+
+
+def reset_tables() -> None:
+    with get_connection() as conn:
+        with conn.cursor() as curs:
+            curs.execute(
+                """
+                    DROP TABLE IF EXISTS users_address, users, users_quarantine,
+                        users_fingerprints, schema_migrations;
+                """
+            )
+
+
+def load_legacy(users: int, batch_size: int, start_ts: int) -> None:
+    """Load users in batches, one run every 2 minutes, into the migration 1 tables."""
+    with get_connection() as conn:
+        with conn.cursor() as curs:
+            for run, start in enumerate(range(0, users, batch_size)):
+                user_data, user_address_data = fake_storage_rows(
+                    min(batch_size, users - start), start
+                )
+                ts = start_ts + run * 120
+                _copy_rows(
+                    curs, "users", USER_COLUMNS, _iter_rows(user_data, USER_COLUMNS, ts)
+                )
+                _copy_rows(
+                    curs,
+                    "users_address",
+                    ADDRESS_COLUMNS,
+                    _iter_rows(user_address_data, ADDRESS_COLUMNS, ts),
+                )
+            curs.execute("ANALYZE users, users_address;")
+
+
+def measure(params: dict, repeat: int) -> dict:
+    """Row, table and index sizes in bytes, and median query latencies in ms."""
+    results = {}
+    with get_connection() as conn:
+        with conn.cursor() as curs:
+            for table in TABLES:
+                curs.execute(f"SELECT avg(pg_column_size(t.*)) FROM {table} t;")
+                results[f"{table} row bytes"] = float(curs.fetchone()[0])
+                curs.execute("SELECT pg_table_size(%s);", (table,))
+                results[f"{table} table bytes"] = curs.fetchone()[0]
+                curs.execute(
+                    """
+                        SELECT indexrelid::regclass::text, pg_relation_size(indexrelid)
+                        FROM pg_index WHERE indrelid = %s::regclass ORDER BY 1;
+                    """,
+                    (table,),
+                )
+                for index, size in curs.fetchall():
+                    results[f"{index} bytes"] = size
+
+            for name, query in QUERIES.items():
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    curs.execute(query, params)
+                    curs.fetchall()
+                    timings.append((time.perf_counter() - start) * 1e3)
+                results[f"{name} ms"] = statistics.median(timings)
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    reset_tables()
+    migrate(target=1)
+
+    start_ts = int(datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp())
+    load_legacy(args.users, args.batch_size, start_ts)
+
+    # A position halfway down the list, and the last tenth of the runs
+    middle_user, _ = fake_storage_rows(1, args.users // 2)
+    middle_ts = start_ts + (args.users // 2 // args.batch_size) * 120
+    runs = -(-args.users // args.batch_size)
+    since_ts = start_ts + int(runs * 0.9) * 120
+    uid = middle_user[0]["uid"]
+
+    before = measure({"ts": middle_ts, "uid": uid, "since": since_ts}, args.repeat)
+
+    start = time.perf_counter()
+    migrate()
+    migration = time.perf_counter() - start
+
+    after = measure(
+        {
+            "ts": datetime.fromtimestamp(middle_ts, timezone.utc),
+            "uid": uid,
+            "since": datetime.fromtimestamp(since_ts, timezone.utc),
+        },
+        args.repeat,
+    )
+
+    print(f"{args.users:,} users, migrated to the latest schema in {migration:.1f}s")
+    print(f"{'metric':<36} {'before':>14} {'after':>14} {'change':>8}")
+    for metric, new in after.items():
+        old = before.get(metric)
+        change = f"{(new - old) / old:+.0%}" if old else "new"
+        old_text = f"{old:,.1f}" if old is not None else "-"
+        print(f"{metric:<36} {old_text:>14} {new:>14,.1f} {change:>8}")
+    reset_tables()
+
+
+if __name__ == "__main__":
+    main()
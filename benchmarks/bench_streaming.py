@@ -0,0 +1,100 @@
+"""
+Benchmark peak memory and throughput of a run processed all at once versus streamed
+through the pipeline in chunks (`main.run_streaming`).
+
+Synthetic pages stand in for the API. The Redis and Postgres loaders are stubbed, so
+the numbers cover extraction hand-off, validation, cleanup and transformation. Each
+mode runs in its own process so peak RSS is measured independently:
+
+    python -m benchmarks.bench_streaming --users 1000000 --chunk-size 1000
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from unittest.mock import patch
+
+from benchmarks.synthetic import fake_api_users
+from src import main as pipeline
+
+PAGE_SIZE = 100
+
+
+def synthetic_pages(users: int):
+    for start in range(0, users, PAGE_SIZE):
+        yield fake_api_users(min(PAGE_SIZE, users - start), start)
+
+
+def stub_redis(user_data: list, user_address_data: list) -> dict:
+    return {"keys": len(user_data), "chunk_times": []}
+
+
+def stub_load(user_data: list, user_address_data: list, mode: str) -> dict:
+    counts = {"inserted": len(user_data), "updated": 0, "skipped": 0}
+    return {"users": counts, "users_address": counts}
+
+
+def run_mode(mode: str, users: int, chunk_size: int) -> dict:
+    with patch.object(pipeline, "add_user_to_redis", stub_redis), patch.object(
+        pipeline, "load_users_bulk", stub_load
+    ), patch.object(pipeline.logging, "info"):
+        start = time.perf_counter()
+        if mode == "materialized":
+            # What main.main did before: the whole run in memory at every stage
+            data = [user for page in synthetic_pages(users) for user in page]
+            processed = pipeline.process_batch(data)["users"]
+        else:
+            processed = pipeline.run_streaming(synthetic_pages(users), chunk_size)[
+                "users"
+            ]
+        elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "users": processed,
+        "rows_per_sec": processed / elapsed,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=1_000)
+    parser.add_argument("--mode", choices=["materialized", "streaming"])
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.users, args.chunk_size)))
+        return
+
+    print(f"{'mode':<14} {'users':>10} {'rows/s':>10} {'peak RSS MB':>12}")
+    for mode in ("materialized", "streaming"):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.bench_streaming",
+                "--mode",
+                mode,
+                "--users",
+                str(args.users),
+                "--chunk-size",
+                str(args.chunk_size),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{mode:<14} {result['users']:>10} {result['rows_per_sec']:>10,.0f} "
+            f"{result['peak_rss_mb']:>12,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
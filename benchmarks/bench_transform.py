@@ -0,0 +1,59 @@
+"""
+Benchmark the transform stage: the DataFrame -> JSON -> dict round-trip that
+`main.main` used to run versus the `clean_records` projection.
+
+Reports time and peak traced allocations (tracemalloc) for each, and checks that
+both produce the same records:
+
+    python -m benchmarks.bench_transform --records 100000
+"""
+import argparse
+import json
+import logging
+import time
+import tracemalloc
+
+from benchmarks.synthetic import fake_api_users
+from src.main import clean_records, data_clean_up
+
+
+def round_trip(data: list) -> list:
+    return json.loads(data_clean_up(data).to_json(orient="records"))
+
+
+def measure(transform, data: list) -> tuple[list, float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = transform(data)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    data = fake_api_users(args.records)
+
+    expected, old_time, old_peak = measure(round_trip, data)
+    result, new_time, new_peak = measure(clean_records, data)
+    assert result == expected, "clean_records output differs from the round-trip"
+
+    print(f"{'transform':<22} {'seconds':>8} {'records/s':>12} {'peak MB':>9}")
+    for name, elapsed, peak in (
+        ("DataFrame round-trip", old_time, old_peak),
+        ("clean_records", new_time, new_peak),
+    ):
+        print(f"{name:<22} {elapsed:>8.3f} {args.records / elapsed:>12,.0f} {peak:>9.1f}")
+    print(
+        f"speedup {old_time / new_time:.1f}x, "
+        f"{old_peak / new_peak:.1f}x less peak allocation"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark `validate_json`: the six per-part validators it used to call for every
+entry versus the single-pass `validate_entry`, and the column-wise
+`validate_columns`.
+
+Records are generated and validated in batches so a 1M-record run fits in memory;
+only the validation is timed:
+
+    python -m benchmarks.bench_validate --records 1000000 --batch 100000
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import fake_api_users
+from src.validate import (
+    validate_address,
+    validate_basic_fields,
+    validate_columns,
+    validate_coordinates,
+    validate_credit_card,
+    validate_employment,
+    validate_json,
+    validate_subscription,
+)
+
+
+def per_part(data: list) -> bool:
+    for entry in data:
+        validate_basic_fields(entry)
+        validate_address(entry.get("address", {}))
+        validate_coordinates(entry.get("address", {}).get("coordinates", {}))
+        validate_employment(entry.get("employment", {}))
+        validate_subscription(entry.get("subscription", {}))
+        validate_credit_card(entry.get("credit_card", {}))
+    return True
+
+
+VALIDATORS = {
+    "six functions": per_part,
+    "validate_json": validate_json,
+    "validate_columns": validate_columns,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=100_000)
+    args = parser.parse_args()
+
+    elapsed = dict.fromkeys(VALIDATORS, 0.0)
+    for start in range(0, args.records, args.batch):
+        data = fake_api_users(min(args.batch, args.records - start), start)
+        for name, validate in VALIDATORS.items():
+            began = time.perf_counter()
+            validate(data)
+            elapsed[name] += time.perf_counter() - began
+
+    baseline = elapsed["six functions"]
+    print(f"{'validator':<18} {'seconds':>8} {'records/s':>12} {'speedup':>8}")
+    for name, seconds in elapsed.items():
+        print(
+            f"{name:<18} {seconds:>8.2f} {args.records / seconds:>12,.0f} "
+            f"{baseline / seconds:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
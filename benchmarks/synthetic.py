@@ -0,0 +1,81 @@
+"""
+Synthetic user records for the benchmarks.
+
+`fake_api_users` builds records shaped like the random-data-api response consumed by
+`extract.iter_pages`, and `fake_storage_rows` builds the user and address dicts the
+loaders expect. Records are deterministic for a given count so runs are comparable.
+"""
+import uuid
+
+
+def fake_api_users(count: int, start: int = 0) -> list:
+    """Build `count` records in the shape returned by the random user API."""
+    users = []
+
+    for i in range(start, start + count):
+        users.append(
+            {
+                "id": i,
+                "uid": str(uuid.UUID(int=i, version=4)),
+                "password": f"password{i}",
+                "first_name": f"First{i}",
+                "last_name": f"Last{i}",
+                "username": f"user{i}",
+                "email": f"user{i}@example.com",
+                "avatar": f"https://robohash.org/user{i}.png",
+                "gender": "Agender",
+                "phone_number": f"+1-555-{i % 10000:04d}",
+                "social_insurance_number": f"{i:09d}",
+                "date_of_birth": "1990-01-01",
+                "employment": {"title": "Engineer", "key_skill": "Teamwork"},
+                "address": {
+                    "city": "New York",
+                    "street_name": "Broadway",
+                    "street_address": f"{i} Broadway",
+                    "zip_code": "10001",
+                    "state": "NY",
+                    "country": "United States",
+                    "coordinates": {"lat": 40.7128, "lng": -74.006},
+                },
+                "credit_card": {"cc_number": "4111-1111-1111-1111"},
+                "subscription": {
+                    "plan": "Basic",
+                    "status": "Active",
+                    "payment_method": "Credit card",
+                    "term": "Monthly",
+                },
+            }
+        )
+
+    return users
+
+
+def fake_storage_rows(count: int, start: int = 0) -> tuple[list, list]:
+    """Build `count` user dicts and address dicts ready for the Postgres loaders."""
+    user_data = []
+    user_address_data = []
+
+    for record in fake_api_users(count, start):
+        user_data.append(
+            {
+                "uid": record["uid"],
+                "password": record["password"],
+                "first_name": record["first_name"],
+                "last_name": record["last_name"],
+                "username": record["username"],
+                "email": record["email"],
+                "phone_number": record["phone_number"],
+                "social_insurance_number": record["social_insurance_number"],
+                "date_of_birth": record["date_of_birth"],
+            }
+        )
+        user_address_data.append(
+            {"uid": record["uid"]}
+            | {
+                key: value
+                for key, value in record["address"].items()
+                if key != "coordinates"
+            }
+        )
+
+    return user_data, user_address_data
@@ -5,66 +5,62 @@ The API endpoints are implemented using the FastAPI framework. The module
 defines the following endpoints:
 
 - `/`: Root endpoint that returns a simple message indicating that it is the root.
-- `/api/v2/datapipeline/list-users`: Endpoint to retrieve a list of users from the database.
+- `/api/v2/datapipeline/list-users`: Endpoint to retrieve a page of users from the database.
+- `/api/v2/datapipeline/export-users`: Endpoint to stream every user from the database as NDJSON.
+- `/api/v2/datapipeline/cache-stats`: Endpoint to report the read-through cache counters.
 - `/api/v2/datapipeline/{user_id}`: Endpoint to retrieve user information from the database.
 
 The module also includes a middleware to enable Cross-Origin Resource Sharing (CORS)
 and mounts the frontend static files.
 
-The module uses the `psycopg2` library to connect to the PostgreSQL database and
-retrieve user information. It also uses the `src.storage` module to check if the user
-information is available in Redis before querying the database.
+The endpoints are fully asynchronous: they use the `src.async_storage` module, built
+on `asyncpg` and `redis.asyncio`, to check if the user information is available in
+Redis before querying the database, and to write it back to Redis when it is not. The PostgreSQL pool and Redis client are opened
+when the application starts and closed when it shuts down.
 
-Note: The module assumes that the PostgreSQL database is running on the host "postgres"
-with the database name "postgres" and the user "postgres" with the password "password".
+Note: Connection details come from `src.settings` and default to the PostgreSQL
+database running on the host "postgres" with the database name "postgres" and the
+user "postgres" with the password "password".
 
 """
+import base64
+import binascii
+import json
 import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator
 
-import psycopg2
-from fastapi import FastAPI
+import asyncpg
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from src.storage import get_user_from_redis
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(message)s",
+from src import async_storage, settings
+from src.async_storage import (
+    fetch_user_page,
+    get_cache_stats,
+    get_user_read_through,
+    stream_user_ids,
 )
-
-# Rest of the code...
-import logging
-
-import psycopg2
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-
-from src.storage import get_user_from_redis
+from src.validate import is_valid_uuid
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(message)s",
 )
 
-# Rest of the code...
-import logging
 
-import psycopg2
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the PostgreSQL pool and Redis client for the lifetime of the app."""
+    await async_storage.open_pools()
+    yield
+    await async_storage.close_pools()
 
-from src.storage import get_user_from_redis
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(message)s",
-)
-
-
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -80,31 +76,99 @@ async def root():
     return {"message": "I am Root"}
 
 
+def encode_cursor(ts: datetime, uid) -> str:
+    """Encode a (ts, uid) position as an opaque pagination token."""
+    return base64.urlsafe_b64encode(
+        json.dumps([ts.isoformat(), str(uid)]).encode()
+    ).decode()
+
+
+def decode_cursor(token: str) -> tuple:
+    """Decode a pagination token back into its (ts, uid) position.
+
+    Raises:
+        HTTPException: 400 if the token is not one issued by this API.
+    """
+    try:
+        ts, uid = json.loads(base64.urlsafe_b64decode(token.encode()))
+        ts = datetime.fromisoformat(ts)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid 'after' token.")
+    # ts is a timestamptz and uid a uuid, so anything else cannot be compared to them
+    if ts.tzinfo is None or not isinstance(uid, str) or not is_valid_uuid(uid):
+        raise HTTPException(status_code=400, detail="Invalid 'after' token.")
+    return ts, uid
+
+
 @app.get("/api/v2/datapipeline/list-users")
-async def list_users():
+async def list_users(
+    limit: int = Query(settings.API_PAGE_SIZE, ge=1, le=settings.API_MAX_PAGE_SIZE),
+    after: str | None = None,
+):
     """
-    Retrieve a list of users from the database.
+    Retrieve a page of users from the database, newest first.
+
+    Args:
+        limit: The maximum number of users to return.
+        after: The `next` token of the previous page, to continue from it.
 
     Returns:
-        A list of user IDs.
+        The page of user IDs and the `next` token, which is null on the last page.
 
     Raises:
-        psycopg2.Error: If an error occurs while querying the database.
+        asyncpg.PostgresError: If an error occurs while querying the database.
     """
+    position = decode_cursor(after) if after else None
+
     try:
-        with psycopg2.connect(
-            dbname="postgres", user="postgres", password="password", host="postgres"
-        ) as conn:
-            with conn.cursor() as curs:
-                curs.execute(
-                    """
-                    SELECT uid FROM users ORDER BY ts DESC;
-                    """
-                )
-                return curs.fetchall()
-    except psycopg2.Error as e:
+        # Fetch one extra row to know whether another page follows
+        rows = await fetch_user_page(limit + 1, position)
+    except (asyncpg.PostgresError, OSError) as e:
         return {"message": str(e)}
 
+    page = rows[:limit]
+    next_token = encode_cursor(page[-1][1], page[-1][0]) if len(rows) > limit else None
+
+    return {"users": [str(uid) for uid, _ in page], "next": next_token}
+
+
+@app.get("/api/v2/datapipeline/export-users")
+async def export_users(after: str | None = None):
+    """
+    Stream every user from the database as NDJSON, newest first.
+
+    Rows are read from a server-side cursor, so memory stays flat no matter how
+    large the users table is.
+
+    Args:
+        after: A `next` token from list-users, to export only the users after it.
+
+    Returns:
+        An `application/x-ndjson` stream with one `{"uid": ..., "ts": ...}` per line.
+    """
+    position = decode_cursor(after) if after else None
+
+    async def ndjson() -> AsyncIterator[str]:
+        try:
+            async for uid, ts in stream_user_ids(position):
+                yield json.dumps({"uid": str(uid), "ts": ts.isoformat()}) + "\n"
+        except (asyncpg.PostgresError, OSError) as e:
+            # The response has already started, so the error can only be logged
+            logging.error(f"Export of users failed: {e}")
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.get("/api/v2/datapipeline/cache-stats")
+async def cache_stats():
+    """
+    Report the read-through cache counters.
+
+    Returns:
+        Redis hits, negative hits, misses, coalesced misses and the hit ratio.
+    """
+    return get_cache_stats()
+
 
 @app.get("/api/v2/datapipeline/{user_id}")
 async def get_user(user_id: str):
@@ -116,45 +180,18 @@ async def get_user(user_id: str):
 
     Returns:
         If the user is found in Redis, return the user information from Redis.
-        Otherwise, return the user information from the database.
+        Otherwise, return the user information from the database, which is also
+        cached in Redis for the next request. A user_id that is not a valid UUID
+        returns no rows without querying Redis or the database.
 
     Raises:
-        psycopg2.Error: If an error occurs while querying the database.
+        asyncpg.PostgresError: If an error occurs while querying the database.
     """
-    # Check length of Redis first before checking Postgres
-    redis = get_user_from_redis(user_id)
+    # Only v4 uids are ever stored, so anything else is unknown without a lookup
+    if not is_valid_uuid(user_id):
+        return []
 
-    if len(redis) != 0:
-        return redis
     try:
-        with psycopg2.connect(
-            dbname="postgres", user="postgres", password="password", host="postgres"
-        ) as conn:
-            with conn.cursor() as curs:
-                curs.execute(
-                    """
-                        SELECT
-                            users.uid,
-                            first_name,
-                            last_name,
-                            username,
-                            email,
-                            phone_number,
-                            social_insurance_number,
-                            date_of_birth,
-                            city,
-                            street_name,
-                            street_address,
-                            zip_code,
-                            state,
-                            country
-                        FROM users
-                        JOIN users_address UA ON users.uid = UA.uid
-                        WHERE users.uid = %s;
-                        """,
-                    (user_id,),
-                )
-
-                return curs.fetchall()
-    except psycopg2.Error as e:
+        return await get_user_read_through(user_id)
+    except (asyncpg.PostgresError, OSError) as e:
         return {"message": str(e)}
@@ -0,0 +1,283 @@
+"""
+This module runs the stages of the ETL pipeline concurrently on an asyncio event loop.
+
+Chunks of users flow through four stages joined by bounded queues:
+- extract: Pulls chunks from the extractor in a thread. The extractor has its own
+  concurrency, EXTRACT_CONCURRENCY requests in flight.
+- transform: Validates, cleans and extracts each chunk on PIPELINE_TRANSFORM_WORKERS
+  threads or processes, so CPU work does not block the loop. Processes are started
+  with "spawn", so each has its own connections instead of inheriting the parent's.
+- redis / postgres: Cache and store each transformed chunk on their own
+  PIPELINE_REDIS_WORKERS and PIPELINE_POSTGRES_WORKERS threads.
+
+Each queue holds at most PIPELINE_QUEUE_SIZE chunks. A stage that gets ahead waits
+for room downstream (backpressure), so fetching the next chunks overlaps with loading
+the previous ones without chunks piling up in memory. With more than one worker in a
+stage, chunks may complete out of order.
+
+Every stage records the chunks and users it handled, its busy time, the time it
+spent blocked on a full queue and the depth of its input queue. `get_pipeline_stats`
+reports them, live while a run is in progress, with each stage's utilization: the
+stage closest to 100% is the bottleneck.
+"""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Literal
+
+from simple_chalk import green
+
+from src import settings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(message)s",
+)
+
+STAGES = ("extract", "transform", "redis", "postgres")
+
+# Tells a stage worker there are no more chunks
+_DONE = object()
+
+# Stats of the current or last run, and the queue feeding each stage
+_stats = {}
+_queues = {}
+_started = None
+_finished = None
+
+
+def _new_stats(workers: dict) -> dict:
+    return {
+        name: {
+            "workers": workers[name],
+            "chunks": 0,
+            "users": 0,
+            "busy_time": 0.0,
+            "blocked_time": 0.0,
+            "queue_max": 0,
+            "queue_total": 0,
+        }
+        for name in STAGES
+    }
+
+
+def get_pipeline_stats() -> dict:
+    """
+    Report the stages of the current or last run of `run_pipeline`.
+
+    Returns:
+        dict: For each stage, its workers, chunks and users handled, busy and blocked
+        time in seconds, its input queue's current, mean and max depth, users per
+        second of busy time, and utilization: busy time over elapsed time and
+        workers. Also the elapsed time and the bottleneck stage.
+    """
+    if _started is None:
+        return {}
+
+    elapsed = (_finished or time.perf_counter()) - _started
+    stages = {}
+    for name, stats in _stats.items():
+        queue = _queues.get(name)
+        busy = stats["busy_time"]
+        stages[name] = {
+            **stats,
+            "queue_depth": queue.qsize() if queue is not None else 0,
+            "queue_mean": (
+                stats["queue_total"] / stats["chunks"] if stats["chunks"] else 0.0
+            ),
+            "users_per_sec": stats["users"] / busy if busy else 0.0,
+            "utilization": busy / (elapsed * stats["workers"]) if elapsed else 0.0,
+        }
+
+    return {
+        "elapsed": elapsed,
+        "stages": stages,
+        "bottleneck": max(stages, key=lambda name: stages[name]["utilization"]),
+    }
+
+
+def _with_sentinel(chunks: Iterable[list]) -> Iterator:
+    yield from chunks
+    yield _DONE
+
+
+def _transform_executor(kind: str, workers: int) -> Executor:
+    if kind == "process":
+        # Spawned rather than forked, so workers neither share the parent's Postgres
+        # pool and hashing executors nor draw the same salts from its random state
+        return ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    if kind == "thread":
+        return ThreadPoolExecutor(workers, thread_name_prefix="transform")
+    raise ValueError(f"Invalid executor '{kind}': must be 'process' or 'thread'.")
+
+
+async def run_pipeline(
+    chunks: Iterable[list],
+    transform: Callable[[list], dict],
+    cache: Callable[[dict], int],
+    store: Callable[[dict], int],
+    queue_size: int = settings.PIPELINE_QUEUE_SIZE,
+    transform_workers: int = settings.PIPELINE_TRANSFORM_WORKERS,
+    transform_executor: Literal[
+        "thread", "process"
+    ] = settings.PIPELINE_TRANSFORM_EXECUTOR,
+    redis_workers: int = settings.PIPELINE_REDIS_WORKERS,
+    postgres_workers: int = settings.PIPELINE_POSTGRES_WORKERS,
+) -> dict:
+    """
+    Run chunks of users through extract, transform and load stages concurrently.
+
+    Args:
+        chunks: Chunks of users, such as `main.iter_chunks(extract.iter_pages(), n)`
+        transform: Turns a chunk into a dict with "users", "rejected", "frames" and
+            optionally "changes" counts, such as `main.transform_chunk`. Must be
+            picklable with processes.
+        cache: Caches a transformed chunk and returns the users cached
+        store: Stores a transformed chunk and returns the users loaded
+        queue_size: Chunks each queue holds before the stage feeding it waits
+        transform_workers: Chunks transformed at once
+        transform_executor: "thread" or "process"
+        redis_workers: Chunks cached at once
+        postgres_workers: Chunks stored at once
+
+    Returns:
+        dict: Chunks processed and skipped, users received, rejected, cached and loaded,
+        the counts of the transforms' "changes", elapsed seconds and users per second,
+        as `main.run_streaming` reports them, and the stage stats of
+        `get_pipeline_stats`
+
+    Raises:
+        ValueError: If a queue size or number of workers is less than 1.
+        Exception: The first error raised by a stage, after the others are cancelled.
+    """
+    global _stats, _queues, _started, _finished
+
+    workers = {
+        "extract": 1,
+        "transform": transform_workers,
+        "redis": redis_workers,
+        "postgres": postgres_workers,
+    }
+    if queue_size < 1 or min(workers.values()) < 1:
+        raise ValueError("Invalid queue size or workers: must be at least 1.")
+
+    loop = asyncio.get_running_loop()
+    queues = {name: asyncio.Queue(queue_size) for name in STAGES[1:]}
+    totals = {
+        "chunks": 0,
+        "skipped": 0,
+        "users": 0,
+        "rejected": 0,
+        "cached": 0,
+        "loaded": 0,
+    }
+    _stats, _queues = _new_stats(workers), queues
+    _started, _finished = time.perf_counter(), None
+
+    async def put(stage: str, *targets: str, item) -> None:
+        start = time.perf_counter()
+        for target in targets:
+            queue = queues[target]
+            await queue.put(item)
+            depth = queue.qsize()
+            _stats[target]["queue_max"] = max(_stats[target]["queue_max"], depth)
+            _stats[target]["queue_total"] += depth
+        _stats[stage]["blocked_time"] += time.perf_counter() - start
+
+    async def run(stage: str, executor: Executor, func: Callable, item):
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, func, item)
+        finally:
+            _stats[stage]["busy_time"] += time.perf_counter() - start
+
+    def count(stage: str, users: int) -> None:
+        _stats[stage]["chunks"] += 1
+        _stats[stage]["users"] += users
+
+    async def extract(executor: Executor) -> None:
+        # next() cannot raise StopIteration into a future, so the end is a sentinel
+        iterator = _with_sentinel(chunks)
+        while (chunk := await run("extract", executor, next, iterator)) is not _DONE:
+            count("extract", len(chunk))
+            await put("extract", "transform", item=chunk)
+
+    async def transform_worker(executor: Executor) -> None:
+        while (chunk := await queues["transform"].get()) is not _DONE:
+            result = await run("transform", executor, transform, chunk)
+            count("transform", len(chunk))
+            totals["chunks"] += 1
+            totals["users"] += result["users"]
+            totals["rejected"] += len(result["rejected"])
+            totals["skipped"] += result["frames"] is None
+            for key, users in result.get("changes", {}).items():
+                totals[key] = totals.get(key, 0) + users
+            await put("transform", "redis", "postgres", item=result)
+
+    async def load_worker(stage: str, executor: Executor, func: Callable, key: str):
+        while (result := await queues[stage].get()) is not _DONE:
+            totals[key] += await run(stage, executor, func, result)
+            count(stage, result["users"] - len(result["rejected"]))
+
+    async def close(tasks: list, *targets: str, count: dict) -> None:
+        """Once `tasks` are done, tell every worker of the next stages to stop."""
+        await asyncio.gather(*tasks)
+        for target in targets:
+            for _ in range(count[target]):
+                await queues[target].put(_DONE)
+
+    io_workers = 1 + redis_workers + postgres_workers
+    with ThreadPoolExecutor(io_workers, thread_name_prefix="pipeline") as io, (
+        _transform_executor(transform_executor, transform_workers)
+    ) as cpu:
+        extractor = [asyncio.create_task(extract(io))]
+        transformers = [
+            asyncio.create_task(transform_worker(cpu)) for _ in range(transform_workers)
+        ]
+        loaders = [
+            asyncio.create_task(load_worker("redis", io, cache, "cached"))
+            for _ in range(redis_workers)
+        ] + [
+            asyncio.create_task(load_worker("postgres", io, store, "loaded"))
+            for _ in range(postgres_workers)
+        ]
+        tasks = [
+            *extractor,
+            *transformers,
+            *loaders,
+            asyncio.create_task(close(extractor, "transform", count=workers)),
+            asyncio.create_task(
+                close(transformers, "redis", "postgres", count=workers)
+            ),
+        ]
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            _finished = time.perf_counter()
+
+    stats = get_pipeline_stats()
+    totals["elapsed"] = stats["elapsed"]
+    totals["users_per_sec"] = (
+        totals["users"] / totals["elapsed"] if totals["elapsed"] else 0.0
+    )
+    totals["stages"] = stats["stages"]
+    totals["bottleneck"] = stats["bottleneck"]
+
+    logging.info(
+        green(
+            f"Pipeline processed {totals['users']} users "
+            f"({totals['users_per_sec']:.0f} users/s), bottleneck: "
+            f"{stats['bottleneck']} "
+            f"({stats['stages'][stats['bottleneck']]['utilization']:.0%} busy)"
+        )
+    )
+    return totals
+
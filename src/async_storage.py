@@ -0,0 +1,589 @@
+"""
+This module provides the non-blocking data layer used by the FastAPI application.
+
+It mirrors the read side of `src.storage` with `asyncpg` and `redis.asyncio`, so API
+requests never block the event loop while waiting on PostgreSQL or Redis.
+
+The module includes the following functions:
+- open_pools: Creates the PostgreSQL connection pool and the Redis client.
+- close_pools: Closes the PostgreSQL connection pool and the Redis client.
+- get_user_from_redis: Retrieves user data from Redis based on the given key.
+- get_users_from_redis: Retrieves many users from Redis in one round-trip.
+- get_user_read_through: Retrieves a user from Redis, falling back to PostgreSQL and
+  writing the result back to Redis.
+- get_cache_stats: Returns the per-tier hit/miss/coalesced counters of the read-through
+  cache.
+- fetch_user_page: Retrieves one keyset-paginated page of users, newest first.
+- stream_user_ids: Streams every user from a server-side cursor, newest first.
+- fetch_user: Retrieves a user and their address from PostgreSQL.
+
+When L1_CACHE_ENABLED is set, hot users are also kept in a bounded in-process LRU in
+front of Redis. It is invalidated by the uids the pipeline publishes on
+REDIS_INVALIDATION_CHANNEL whenever it rewrites users.
+
+The pool and client are module-level and are opened by the API at startup and closed
+at shutdown, see `src.api.lifespan`.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import AsyncIterator
+
+import asyncpg
+import redis.asyncio as aioredis
+from redis import RedisError, ResponseError
+from simple_chalk import red
+
+from src import settings
+from src.codec import (
+    decode_user,
+    is_wrong_type,
+    needs_transaction,
+    other_encoding,
+    queue_write,
+    read_user,
+    split_results,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(message)s",
+)
+
+_pg_pool: asyncpg.Pool | None = None
+_redis: aioredis.Redis | None = None
+
+# Fields of a cached user, in the column order returned by fetch_user after uid
+USER_FIELDS = (
+    "first_name",
+    "last_name",
+    "username",
+    "email",
+    "phone_number",
+    "social_insurance_number",
+    "date_of_birth",
+    "city",
+    "street_name",
+    "street_address",
+    "zip_code",
+    "state",
+    "country",
+)
+
+# Postgres loads in flight per uid, shared by concurrent misses (single-flight)
+_inflight: dict[str, asyncio.Task] = {}
+_cache_stats: dict = {
+    "l1_hits": 0,
+    "hits": 0,
+    "negative_hits": 0,
+    "misses": 0,
+    "coalesced": 0,
+}
+
+
+class _LocalCache:
+    """In-process LRU bounded by entry count and approximate size in bytes.
+
+    Every entry carries its own expiry. Only used from the event loop thread, so it
+    needs no locking.
+
+    Each invalidation is numbered. A reader takes the current `sequence` before it
+    goes to Redis and passes it to `set`, which drops the value if the uid was
+    invalidated since: the value read may predate the rewrite. The numbers of the
+    last max_entries invalidated uids are kept; older ones are folded into a floor
+    that every other uid is compared against.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.sequence = 0
+        self._floor = 0
+        self._entries: OrderedDict[str, tuple[float, int, dict]] = OrderedDict()
+        self._invalidated: OrderedDict[str, int] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def set(self, key: str, value: dict, ttl: float, since: int | None = None) -> None:
+        if since is not None and self._invalidated.get(key, self._floor) > since:
+            return
+        size = len(key) + sum(len(k) + len(v) for k, v in value.items())
+        if size > self.max_bytes or ttl <= 0:
+            return
+
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self.bytes += size
+
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        self.sequence += 1
+        self._invalidated[key] = self.sequence
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > self.max_entries:
+            _, self._floor = self._invalidated.popitem(last=False)
+
+        if self._remove(key):
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+        # Whatever was sent while unsubscribed may concern any uid
+        self.sequence += 1
+        self._floor = self.sequence
+        self._invalidated.clear()
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.bytes -= entry[1]
+        return True
+
+
+_l1: _LocalCache | None = (
+    _LocalCache(settings.L1_CACHE_MAX_ENTRIES, settings.L1_CACHE_MAX_BYTES)
+    if settings.L1_CACHE_ENABLED
+    else None
+)
+_invalidation_task: asyncio.Task | None = None
+
+
+async def open_pools() -> None:
+    """Create the PostgreSQL connection pool and the Redis client."""
+    global _pg_pool, _redis, _invalidation_task
+
+    _pg_pool = await asyncpg.create_pool(
+        database=settings.POSTGRES_DB,
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD,
+        host=settings.POSTGRES_HOST,
+        port=settings.POSTGRES_PORT,
+        min_size=settings.PG_POOL_MIN_SIZE,
+        max_size=settings.PG_POOL_MAX_SIZE,
+    )
+    _redis = aioredis.Redis(
+        connection_pool=aioredis.BlockingConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+        )
+    )
+
+    if _l1 is not None:
+        _invalidation_task = asyncio.create_task(_listen_for_invalidations())
+
+
+async def close_pools() -> None:
+    """Close the PostgreSQL connection pool and the Redis client."""
+    global _pg_pool, _redis, _invalidation_task
+
+    if _invalidation_task is not None:
+        _invalidation_task.cancel()
+        _invalidation_task = None
+    if _pg_pool is not None:
+        await _pg_pool.close()
+        _pg_pool = None
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+def _get_pg_pool() -> asyncpg.Pool:
+    if _pg_pool is None:
+        raise RuntimeError("The Postgres pool is not open, call open_pools() first")
+    return _pg_pool
+
+
+def _get_redis() -> aioredis.Redis:
+    if _redis is None:
+        raise RuntimeError("The Redis client is not open, call open_pools() first")
+    return _redis
+
+
+"""
+REDIS ----------------------------------------------------------------------------------
+"""
+
+
+async def get_user_from_redis(key: str) -> dict:
+    """
+    Retrieve user data from Redis based on the given key.
+
+    Args:
+        key (str): The key to look up in Redis.
+
+    Returns:
+        dict: The user data if the key exists; otherwise, an empty dictionary.
+
+    Raises:
+        redis.RedisError: If there's an error in executing the Redis command.
+    """
+    encoding = settings.REDIS_CACHE_ENCODING
+
+    try:
+        try:
+            raw = await read_user(_get_redis(), key, encoding)
+        except ResponseError as e:
+            if not is_wrong_type(e):
+                raise
+            raw = await read_user(_get_redis(), key, other_encoding(encoding))
+
+        data: dict = decode_user(raw)
+        if not data:
+            logging.error(f"Key {red(key)} not found in Redis. Trying Postgres...")
+
+        return data
+
+    except RedisError as e:
+        logging.error(f"General Redis error: {e}")
+        raise e
+
+
+async def get_users_from_redis(keys: list) -> dict:
+    """
+    Retrieve many users from Redis in a single pipelined round-trip.
+
+    Args:
+        keys (list): The keys to look up in Redis.
+
+    Returns:
+        dict: The user data of every key found, by key. Missing keys are left out.
+
+    Raises:
+        redis.RedisError: If there's an error in executing the Redis commands.
+    """
+    if not keys:
+        return {}
+
+    encoding = settings.REDIS_CACHE_ENCODING
+
+    try:
+        async with _get_redis().pipeline(transaction=False) as pipe:
+            for key in keys:
+                read_user(pipe, key, encoding)
+            users, retry = split_results(
+                keys, await pipe.execute(raise_on_error=False)
+            )
+
+        # Keys written with another encoding cost one more round-trip
+        if retry:
+            async with _get_redis().pipeline(transaction=False) as pipe:
+                for key in retry:
+                    read_user(pipe, key, other_encoding(encoding))
+                results = await pipe.execute(raise_on_error=False)
+            users |= split_results(retry, results)[0]
+
+        return {key: users[key] for key in keys if key in users}
+
+    except RedisError as e:
+        logging.error(f"General Redis error: {e}")
+        raise e
+
+
+"""
+POSTGRES -------------------------------------------------------------------------------
+"""
+
+
+async def fetch_user_page(limit: int, after: tuple | None = None) -> list:
+    """
+    Retrieve one page of users, newest first, using keyset pagination on (ts, uid).
+
+    The page starts right after the given (ts, uid) position, so the cost of a page
+    does not grow with how deep into the table it is. Backed by users_ts_uid_idx.
+
+    Args:
+        limit: The maximum number of users to return.
+        after: The (ts, uid) of the last user of the previous page, if any.
+
+    Returns:
+        list: (uid, ts) rows, as a UUID and a timezone-aware datetime.
+
+    Raises:
+        asyncpg.PostgresError: If an error occurs while querying the database.
+    """
+    if after is None:
+        rows = await _get_pg_pool().fetch(
+            """
+                SELECT uid, ts FROM users
+                ORDER BY ts DESC, uid DESC
+                LIMIT $1;
+            """,
+            limit,
+        )
+    else:
+        rows = await _get_pg_pool().fetch(
+            """
+                SELECT uid, ts FROM users
+                WHERE (ts, uid) < ($1, $2)
+                ORDER BY ts DESC, uid DESC
+                LIMIT $3;
+            """,
+            *after,
+            limit,
+        )
+    return [tuple(row) for row in rows]
+
+
+async def stream_user_ids(after: tuple | None = None) -> AsyncIterator[tuple]:
+    """
+    Stream every user, newest first, from a server-side cursor.
+
+    Rows are fetched PG_CURSOR_PREFETCH at a time, so memory stays flat however
+    large the users table is.
+
+    Args:
+        after: Only stream users after this (ts, uid) position, if given.
+
+    Yields:
+        (uid, ts) rows, as a UUID and a timezone-aware datetime.
+
+    Raises:
+        asyncpg.PostgresError: If an error occurs while querying the database.
+    """
+    if after is None:
+        query, args = "SELECT uid, ts FROM users ORDER BY ts DESC, uid DESC;", ()
+    else:
+        query, args = (
+            "SELECT uid, ts FROM users WHERE (ts, uid) < ($1, $2) ORDER BY ts DESC, uid DESC;",
+            after,
+        )
+
+    async with _get_pg_pool().acquire() as conn:
+        # Server-side cursors only live inside a transaction
+        async with conn.transaction():
+            async for row in conn.cursor(
+                query, *args, prefetch=settings.PG_CURSOR_PREFETCH
+            ):
+                yield tuple(row)
+
+
+async def fetch_user(user_id: str) -> list:
+    """
+    Retrieve a user and their address.
+
+    Args:
+        user_id: The ID of the user to retrieve.
+
+    Returns:
+        list: The matching rows, empty if the user is unknown.
+
+    Raises:
+        asyncpg.PostgresError: If an error occurs while querying the database.
+    """
+    rows = await _get_pg_pool().fetch(
+        """
+            SELECT
+                users.uid,
+                first_name,
+                last_name,
+                username,
+                email,
+                phone_number,
+                social_insurance_number,
+                date_of_birth,
+                city,
+                street_name,
+                street_address,
+                zip_code,
+                state,
+                country
+            FROM users
+            JOIN users_address UA ON users.uid = UA.uid
+            WHERE users.uid = $1;
+        """,
+        user_id,
+    )
+    return [tuple(row) for row in rows]
+
+
+"""
+READ-THROUGH CACHE ---------------------------------------------------------------------
+"""
+
+
+async def _write_back(user_id: str, rows: list) -> None:
+    """Cache a user loaded from Postgres, or remember that the uid is unknown."""
+    encoding = settings.REDIS_CACHE_ENCODING
+
+    try:
+        async with _get_redis().pipeline(
+            transaction=needs_transaction(encoding)
+        ) as pipe:
+            if rows:
+                queue_write(
+                    pipe,
+                    user_id,
+                    {
+                        field: "n/a" if value is None else str(value)
+                        for field, value in zip(USER_FIELDS, rows[0][1:])
+                    },
+                    settings.REDIS_READ_THROUGH_TTL,
+                    encoding,
+                    settings.REDIS_CACHE_COMPRESSION,
+                )
+            else:
+                pipe.set(
+                    f"{settings.REDIS_MISSING_PREFIX}{user_id}",
+                    1,
+                    ex=settings.REDIS_NEGATIVE_TTL,
+                )
+            await pipe.execute()
+
+    except RedisError as e:
+        # The caller still gets its answer from Postgres
+        logging.error(f"General Redis error: {e}")
+
+
+async def _load_user(user_id: str) -> list:
+    rows = await fetch_user(user_id)
+    await _write_back(user_id, rows)
+    return rows
+
+
+async def get_user_read_through(user_id: str) -> dict | list:
+    """
+    Retrieve a user from Redis, falling back to Postgres on a miss.
+
+    A user loaded from Postgres is written back to Redis with REDIS_READ_THROUGH_TTL,
+    and a uid Postgres does not know is remembered for REDIS_NEGATIVE_TTL. Concurrent
+    misses for the same uid share a single Postgres query.
+
+    Args:
+        user_id: The ID of the user to retrieve.
+
+    Returns:
+        dict | list: The cached user dict on a hit; otherwise the rows from
+        Postgres, which are empty if the user is unknown.
+
+    Raises:
+        redis.RedisError: If there's an error in executing the Redis lookup.
+        asyncpg.PostgresError: If an error occurs while querying the database.
+    """
+    if _l1 is not None:
+        data = _l1.get(user_id)
+        if data is not None:
+            _cache_stats["l1_hits"] += 1
+            return data
+
+    encoding = settings.REDIS_CACHE_ENCODING
+    # Taken before the read, so an invalidation arriving during it is not undone
+    sequence = _l1.sequence if _l1 is not None else 0
+
+    try:
+        async with _get_redis().pipeline(transaction=False) as pipe:
+            read_user(pipe, user_id, encoding)
+            pipe.exists(f"{settings.REDIS_MISSING_PREFIX}{user_id}")
+            pipe.pttl(user_id)
+            raw, missing, pttl = await pipe.execute(raise_on_error=False)
+
+        for result in (missing, pttl):
+            if isinstance(result, Exception):
+                raise result
+        if is_wrong_type(raw):
+            # Written with another encoding, so read it again with the other command
+            raw = await read_user(_get_redis(), user_id, other_encoding(encoding))
+        elif isinstance(raw, Exception):
+            raise raw
+        data = decode_user(raw)
+
+    except RedisError as e:
+        logging.error(f"General Redis error: {e}")
+        raise e
+
+    if data:
+        _cache_stats["hits"] += 1
+        if _l1 is not None:
+            # Never keep the user longer than Redis does
+            ttl = settings.L1_CACHE_TTL if pttl < 0 else pttl / 1000
+            _l1.set(user_id, data, min(ttl, settings.L1_CACHE_TTL), since=sequence)
+        return data
+    if missing:
+        _cache_stats["negative_hits"] += 1
+        return []
+
+    task = _inflight.get(user_id)
+    if task is None:
+        _cache_stats["misses"] += 1
+        logging.info(f"Key {red(user_id)} not found in Redis. Trying Postgres...")
+        task = asyncio.ensure_future(_load_user(user_id))
+        _inflight[user_id] = task
+        task.add_done_callback(lambda _: _inflight.pop(user_id, None))
+    else:
+        _cache_stats["coalesced"] += 1
+
+    # Shielded so one client going away does not cancel the load for the others
+    return await asyncio.shield(task)
+
+
+def get_cache_stats() -> dict:
+    """
+    Report the counters of the read-through cache, per tier.
+
+    Returns:
+        dict: In-process (L1) hits, Redis hits and negative hits, misses that
+        queried Postgres, misses that were coalesced onto an in-flight query, the hit
+        ratio of each tier and the size of the L1 cache.
+    """
+    stats = dict(_cache_stats)
+    lookups = sum(stats.values())
+    redis_lookups = lookups - stats["l1_hits"]
+
+    stats["l1_hit_ratio"] = stats["l1_hits"] / lookups if lookups else 0.0
+    stats["redis_hit_ratio"] = (
+        (stats["hits"] + stats["negative_hits"]) / redis_lookups
+        if redis_lookups
+        else 0.0
+    )
+    stats["hit_ratio"] = (
+        (stats["l1_hits"] + stats["hits"] + stats["negative_hits"]) / lookups
+        if lookups
+        else 0.0
+    )
+    stats["l1_entries"] = len(_l1) if _l1 is not None else 0
+    stats["l1_bytes"] = _l1.bytes if _l1 is not None else 0
+    stats["l1_evictions"] = _l1.evictions if _l1 is not None else 0
+    stats["l1_invalidations"] = _l1.invalidations if _l1 is not None else 0
+    return stats
+
+
+async def _listen_for_invalidations() -> None:
+    """Drop L1 entries for every uid the pipeline announces it has rewritten.
+
+    Invalidations sent while unsubscribed are lost, so the whole L1 cache is
+    cleared each time the subscription is (re)established.
+    """
+    while True:
+        try:
+            async with _get_redis().pubsub() as pubsub:
+                await pubsub.subscribe(settings.REDIS_INVALIDATION_CHANNEL)
+                _l1.clear()
+
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        for uid in message["data"].decode("utf-8").split(","):
+                            _l1.invalidate(uid)
+
+        except RedisError as e:
+            logging.error(f"Lost the cache invalidation subscription: {e}")
+            await asyncio.sleep(1)
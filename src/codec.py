@@ -0,0 +1,237 @@
+"""
+This module encodes and decodes the users cached in Redis.
+
+REDIS_CACHE_ENCODING picks how `storage.add_user_to_redis` and the API's read-through
+write-back store a user:
+- "hash": a Redis hash with one field per column, written with HSET.
+- "json": a single string holding the user as JSON, serialized with orjson when it is
+  installed and the standard library otherwise.
+- "msgpack": a single string holding the user packed with msgpack.
+
+REDIS_CACHE_COMPRESSION set to "zlib" compresses the json and msgpack strings.
+
+Readers do not need to know the encoding. `decode_user` tells JSON, msgpack and zlib
+strings apart by their first byte, and a read that finds a key stored with the other
+Redis type (WRONGTYPE) is retried with the other command, so the encoding can be
+changed on a live cache. Clients must not set `decode_responses`, as msgpack and zlib
+values are binary.
+
+The module includes the following functions:
+- encode_user: Serializes a user for the "json" and "msgpack" encodings.
+- decode_user: Turns whatever a read returned into a user dict.
+- queue_write: Queues the commands that store a user on a pipeline.
+- needs_transaction: Whether the pipeline of those commands must run in MULTI/EXEC.
+- read_user: Sends or queues the command that reads a user, on a client or pipeline.
+- is_wrong_type / other_encoding: Detect a read of the other Redis type and pick the
+  command to read it again with.
+- split_results: Decodes pipelined reads and finds the keys to read again.
+"""
+import json
+import zlib
+from typing import Literal
+
+from redis import ResponseError
+
+from src import settings
+
+try:
+    import orjson
+except ImportError:  # the standard library is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # only needed for the "msgpack" encoding
+    msgpack = None
+
+ENCODINGS = ("hash", "json", "msgpack")
+COMPRESSIONS = ("none", "zlib")
+
+# First byte of a zlib stream at the default window size, of a JSON object, and of
+# the msgpack map formats (fixmap, map 16, map 32)
+_ZLIB_HEADER = 0x78
+_JSON_HEADER = ord("{")
+_MSGPACK_MAP_HEADERS = frozenset([*range(0x80, 0x90), 0xDE, 0xDF])
+
+
+def _msgpack():
+    if msgpack is None:
+        raise RuntimeError("The 'msgpack' cache encoding needs msgpack installed.")
+    return msgpack
+
+
+def _text(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def encode_user(
+    user: dict,
+    encoding: Literal["json", "msgpack"] = settings.REDIS_CACHE_ENCODING,
+    compression: Literal["none", "zlib"] = settings.REDIS_CACHE_COMPRESSION,
+) -> bytes:
+    """
+    Serialize a user into a single string value.
+
+    Values are stored as strings, as they would be in a hash, so a user reads back
+    the same whichever encoding wrote it.
+
+    Args:
+        user: The cached fields of the user
+        encoding: "json" or "msgpack"
+        compression: "none" or "zlib"
+
+    Returns:
+        bytes: The value to SET
+
+    Raises:
+        ValueError: If the encoding or compression is unknown.
+    """
+    user = {
+        field: value if isinstance(value, str) else str(value)
+        for field, value in user.items()
+    }
+
+    if encoding == "json":
+        if orjson is not None:
+            blob = orjson.dumps(user)
+        else:
+            blob = json.dumps(user, separators=(",", ":")).encode("utf-8")
+    elif encoding == "msgpack":
+        blob = _msgpack().packb(user)
+    else:
+        raise ValueError(
+            f"Invalid cache encoding '{encoding}': must be 'json' or 'msgpack'."
+        )
+
+    if compression == "zlib":
+        return zlib.compress(blob)
+    if compression != "none":
+        raise ValueError(
+            f"Invalid cache compression '{compression}': must be 'none' or 'zlib'."
+        )
+    return blob
+
+
+def decode_user(raw) -> dict:
+    """
+    Turn the result of HGETALL or GET into a user dict, whatever its encoding.
+
+    Args:
+        raw: A hash as returned by HGETALL, a string as returned by GET, or None
+
+    Returns:
+        dict: The user, empty if the key was missing
+
+    Raises:
+        ValueError: If the string is in no known encoding.
+    """
+    if not raw:
+        return {}
+    if isinstance(raw, dict):
+        return {_text(field): _text(value) for field, value in raw.items()}
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+
+    header = raw[0]
+    if header == _JSON_HEADER:
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    if header in _MSGPACK_MAP_HEADERS:
+        return _msgpack().unpackb(raw)
+    if header == _ZLIB_HEADER:
+        return decode_user(zlib.decompress(raw))
+    raise ValueError("Invalid cached user: unknown encoding.")
+
+
+def queue_write(
+    pipe,
+    key: str,
+    user: dict,
+    ttl: int,
+    encoding: str = settings.REDIS_CACHE_ENCODING,
+    compression: str = settings.REDIS_CACHE_COMPRESSION,
+) -> None:
+    """
+    Queue the commands that store a user under `key` with a TTL.
+
+    A hash is written with UNLINK + HSET + EXPIRE, the UNLINK clearing any string
+    left by another encoding. Other encodings are a single SET with EX. A reader
+    must not see the key between the UNLINK and the HSET, so a hash is only queued
+    on a pipeline opened with `transaction=needs_transaction(encoding)`.
+
+    Args:
+        pipe: A sync or async Redis pipeline
+        key: The key to store the user under
+        user: The cached fields of the user
+        ttl: TTL in seconds
+        encoding: "hash", "json" or "msgpack"
+        compression: "none" or "zlib", for "json" and "msgpack"
+    """
+    if encoding == "hash":
+        pipe.unlink(key)
+        pipe.hset(key, mapping=user)
+        pipe.expire(key, ttl)
+    else:
+        pipe.set(key, encode_user(user, encoding, compression), ex=ttl)
+
+
+def needs_transaction(encoding: str = settings.REDIS_CACHE_ENCODING) -> bool:
+    """Whether `queue_write` must run in MULTI/EXEC to be seen all at once."""
+    return encoding == "hash"
+
+
+def read_user(pipe, key: str, encoding: str = settings.REDIS_CACHE_ENCODING):
+    """
+    Send or queue the command that reads a user stored with `encoding`.
+
+    Args:
+        pipe: A sync or async Redis pipeline, or a client
+        key: The key of the user
+        encoding: "hash" reads with HGETALL, anything else with GET
+
+    Returns:
+        What the command returns: the pipeline, or the result or awaitable of a client
+    """
+    if encoding == "hash":
+        return pipe.hgetall(key)
+    return pipe.get(key)
+
+
+def other_encoding(encoding: str) -> str:
+    """The encoding to read a key with after it answered WRONGTYPE."""
+    return "json" if encoding == "hash" else "hash"
+
+
+def is_wrong_type(result) -> bool:
+    """Whether a read failed because the key holds the other Redis type."""
+    return isinstance(result, ResponseError) and str(result).startswith("WRONGTYPE")
+
+
+def split_results(keys: list, results: list) -> tuple[dict, list]:
+    """
+    Decode the results of a pipeline of reads run with `raise_on_error=False`.
+
+    Args:
+        keys: The keys read, in order
+        results: The results of the pipeline
+
+    Returns:
+        The users found, by key, and the keys that must be read again with the
+        other encoding
+
+    Raises:
+        redis.RedisError: The first error of the pipeline other than WRONGTYPE.
+    """
+    users = {}
+    retry = []
+
+    for key, result in zip(keys, results):
+        if is_wrong_type(result):
+            retry.append(key)
+        elif isinstance(result, Exception):
+            raise result
+        else:
+            user = decode_user(result)
+            if user:
+                users[key] = user
+
+    return users, retry
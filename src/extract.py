@@ -0,0 +1,222 @@
+"""
+This module fetches random user data from the API concurrently.
+
+A run of `iter_pages` is split into pages of at most EXTRACT_PAGE_SIZE users, which
+are fetched by a bounded thread pool sharing one pooled `requests.Session`. Every
+request has a timeout, and 429/5xx responses, timeouts and connection errors are
+retried with jittered exponential backoff, honouring `Retry-After` when the API
+sends it.
+
+The module includes the following functions:
+- fetch_page: Fetches one page of users, retrying transient failures.
+- iter_pages: Yields a run's worth of users page by page, fetching ahead only as far
+  as the concurrency allows, and records each page's latency and the run's throughput.
+
+All defaults come from `src.settings`, including the API URL so the extractor can be
+pointed at a local mock server.
+"""
+import logging
+import math
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+from simple_chalk import green, red, yellow
+
+from src import settings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(message)s",
+)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """Return the shared session, so connections are reused across pages and runs."""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=settings.EXTRACT_CONCURRENCY
+            )
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _backoff(attempt: int, response: requests.Response | None) -> float:
+    """Seconds to wait before retry number `attempt` (full jitter)."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after is not None and retry_after.isdigit():
+        return min(float(retry_after), settings.EXTRACT_BACKOFF_MAX)
+
+    cap = min(settings.EXTRACT_BACKOFF_MAX, settings.EXTRACT_BACKOFF_BASE * 2**attempt)
+    return random.uniform(0, cap)
+
+
+def fetch_page(
+    size: int,
+    url: str = settings.EXTRACT_API_URL,
+    timeout: float = settings.EXTRACT_TIMEOUT,
+    max_retries: int = settings.EXTRACT_MAX_RETRIES,
+) -> tuple[list, dict]:
+    """Fetch one page of random users
+
+    Args:
+        size: Number of users to request, at most 100
+        url: The users endpoint of the API
+        timeout: Seconds to wait for each request
+        max_retries: How many times a transient failure is retried
+
+    Returns:
+        The users on the page, and the page's latency in seconds and retry count
+
+    Raises:
+        HTTPError: if an HTTP error occurred, or retries ran out on a 429/5xx
+        Timeout: if every attempt timed out
+        ConnectionError: if every attempt failed to connect
+    """
+    session = _get_session()
+    start = time.perf_counter()
+
+    for attempt in range(max_retries + 1):
+        response = None
+        try:
+            response = session.get(
+                url, params={"size": size, "response_type": "json"}, timeout=timeout
+            )
+            if response.status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                data = response.json()
+                # A page of one user comes back as a bare object
+                users = data if isinstance(data, list) else [data]
+                return users, {
+                    "latency": time.perf_counter() - start,
+                    "retries": attempt,
+                }
+            if attempt == max_retries:
+                response.raise_for_status()
+
+        except (Timeout, ConnectionError) as e:
+            if attempt == max_retries:
+                logging.warning(red(f"ERROR: {e}"))
+                raise e
+        except HTTPError as e:
+            logging.warning(red(f"ERROR: {e}"))
+            raise e
+
+        delay = _backoff(attempt, response)
+        logging.info(
+            yellow(f"Retrying page in {delay:.2f}s (attempt {attempt + 1} failed)")
+        )
+        time.sleep(delay)
+
+
+def _page_sizes(target_users: int, page_size: int) -> list:
+    """Split a run into page sizes, the last page taking the remainder."""
+    if target_users < 1 or page_size < 1:
+        raise ValueError("Invalid 'target_users': must fetch at least one user.")
+
+    pages = math.ceil(target_users / page_size)
+    return [page_size] * (pages - 1) + [target_users - page_size * (pages - 1)]
+
+
+def _record_page(metrics: dict, users: list, page_metrics: dict) -> None:
+    """Add a fetched page to a run's metrics and log its latency and throughput."""
+    latency = page_metrics["latency"]
+    metrics["pages"] += 1
+    metrics["users"] += len(users)
+    metrics["retries"] += page_metrics["retries"]
+    metrics["latencies"].append(latency)
+    logging.debug(
+        f"Fetched page {metrics['pages']} of {len(users)} users in {latency:.3f}s "
+        f"({len(users) / latency if latency else 0.0:.0f} users/s)"
+    )
+
+
+def _summarise(metrics: dict, elapsed: float) -> None:
+    """Fill in a run's throughput and page latencies once its pages are fetched."""
+    latencies = metrics["latencies"]
+    metrics["elapsed"] = elapsed
+    metrics["users_per_sec"] = metrics["users"] / elapsed if elapsed else 0.0
+    metrics["latency_p50"] = statistics.median(latencies) if latencies else 0.0
+    metrics["latency_max"] = max(latencies, default=0.0)
+    logging.info(
+        green(
+            f"Fetched {metrics['users']} users in {metrics['pages']} pages "
+            f"({metrics['users_per_sec']:.0f} users/s, {metrics['retries']} retries, "
+            f"p50 page latency {metrics['latency_p50']:.2f}s)"
+        )
+    )
+
+
+def iter_pages(
+    target_users: int = settings.EXTRACT_TARGET_USERS,
+    page_size: int = settings.EXTRACT_PAGE_SIZE,
+    concurrency: int = settings.EXTRACT_CONCURRENCY,
+    url: str = settings.EXTRACT_API_URL,
+    metrics: dict | None = None,
+) -> Iterator[list]:
+    """Yield a run's worth of random users page by page, in order
+
+    At most `concurrency` pages are fetched ahead of the consumer, so a slow
+    consumer holds back extraction instead of letting fetched pages pile up.
+    Each page's latency is recorded as it is handed over, and the run's throughput
+    is logged once the last page has been, or the consumer stops early.
+
+    Args:
+        target_users: Number of users to fetch in this run
+        page_size: Users requested per API call, at most 100
+        concurrency: Maximum number of requests in flight
+        url: The users endpoint of the API
+        metrics: A dict filled in with the run's metrics: pages, users, retries,
+            page latencies, elapsed seconds, users per second and the p50/max page
+            latency. Elapsed time includes the time the consumer held back
+            extraction.
+
+    Yields:
+        One page of users at a time
+
+    Raises:
+        HTTPError: if an HTTP error occurred
+        Timeout: Encase a Timeout has occurred
+        ValueError: If fewer than one user is requested
+    """
+    sizes = iter(_page_sizes(target_users, page_size))
+    metrics = {} if metrics is None else metrics
+    metrics.update(pages=0, users=0, retries=0, latencies=[])
+    start = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = deque(
+                executor.submit(fetch_page, size, url=url)
+                for _, size in zip(range(concurrency), sizes)
+            )
+
+            while pending:
+                users, page_metrics = pending.popleft().result()
+                _record_page(metrics, users, page_metrics)
+
+                # Replace the page being handed over with the next one
+                size = next(sizes, None)
+                if size is not None:
+                    pending.append(executor.submit(fetch_page, size, url=url))
+
+                yield users
+    finally:
+        _summarise(metrics, time.perf_counter() - start)
@@ -3,28 +3,43 @@ This module represents an ETL (Extract, Transform, Load) pipeline for processing
 The pipeline retrieves data from an API, validates and cleans the data, extracts relevant information,
 and inserts the data into relevant tables in Postgres and Redis for caching.
 
-The main function runs in a loop, processing data dumps every 2 minutes. Each loop represents one daily data dump.
-The maximum number of data dumps to process is defined by the 'max_count' variable.
+The main function hands the pipeline to a scheduler, which starts a run every 2 minutes. Each run represents one daily data dump.
+The number of data dumps to process is set by SCHEDULE_MAX_RUNS.
 
 The pipeline consists of the following steps:
 1. Extraction:
-    - The 'get_user_data' function makes an API call to a random user generator API and retrieves data on 10 random users.
-    - If the API call is successful, the data is returned as a JSON object.
+    - The 'iter_pages' function (see src.extract) calls a random user generator API concurrently, in pages, and retrieves data on EXTRACT_TARGET_USERS random users.
+    - Pages of JSON objects are handed over as they arrive, and each page's latency and the run's throughput are recorded.
 
 2. Transformation:
-    - The 'data_clean_up' function takes the JSON object and cleans it by dropping unneeded columns using Pandas DataFrame.
-    - The cleaned data is then converted back to a JSON string for storage.
-    - The 'extract_user_data_for_storage' function extracts relevant user data from the cleaned JSON object and returns a list of user dictionaries.
-    - The 'extract_address_data_for_storage' function extracts relevant address data from the cleaned JSON object and returns a list of address dictionaries.
+    - The 'validate_rows' function validates each user. Users that fail are set aside in bulk by 'quarantine_rows'
+      (the users_quarantine table or a file) and the rest of the chunk carries on.
+    - The 'clean_records' function takes the JSON objects and cleans them by dropping unneeded fields, without a DataFrame round-trip.
+    - The 'extract_frames' function extracts the user and address tables from the cleaned JSON objects as DataFrames, column by column.
+      The per-row 'extract_user_data_for_storage' and 'extract_address_data_for_storage' functions return the same data as lists of dicts.
 
 3. Load:
     - The extracted user data and address data are stored in Redis for caching using the 'add_user_to_redis' function.
-    - If the 'users' and 'users_address' tables do not exist in Postgres, they are created using the 'create_user_table' and 'create_address_table' functions.
-    - The user data is inserted into the 'users' table using the 'insert_into_user_table' function.
-    - The address data is inserted into the 'users_address' table using the 'insert_into_address_table' function.
+    - Before the first run, the Postgres schema is created or brought up to date by the 'migrate' function (see src.migrations).
+    - The user and address data are loaded into the 'users' and 'users_address' tables in one transaction using the 'load_users_bulk' function.
 
-The main function runs the ETL pipeline in a loop, processing data dumps every 2 minutes.
-After each data dump is processed, the program sleeps for 2 minutes before processing the next data dump.
+Each data dump is streamed through these steps in chunks of PIPELINE_CHUNK_SIZE users, so memory use
+depends on the chunk size rather than on the size of the dump. With PIPELINE_ASYNC the steps run as concurrent
+stages joined by bounded queues, so fetching, transforming and loading different chunks overlap (see src.async_pipeline).
+
+Runs are started at a fixed rate of SCHEDULE_INTERVAL seconds, or on the SCHEDULE_CRON expression, however long
+each one takes. With SCHEDULE_MAX_IN_FLIGHT above 1 the next run extracts its users while the previous one is
+still loading, and SCHEDULE_CATCH_UP decides whether runs missed while the pipeline was behind are all run or
+coalesced. The scheduler logs the duration and lag of every run.
+
+With PARALLEL_WORKERS above 1, each run is split into partitions that worker processes fetch and process end to end,
+each with its own Redis and Postgres connections (see src.parallel).
+
+With INCREMENTAL, users whose content fingerprint matches the one stored at their last write are dropped before
+anything is written, and each chunk reports how many of its users are new, changed or unchanged (see src.fingerprint).
+
+With SPOOL_ENABLED, extracted chunks are appended to a durable local spool first and loaded by draining it with
+checkpoints, so a slow or unavailable Postgres delays loading rather than losing fetched users (see src.spool).
 
 Note: This module requires the 'requests', 'pandas', 'simple_chalk', 'salt', and 'storage' modules to be imported.
 
@@ -32,68 +47,42 @@ Author: Paul Bennett
 Date: 2024-01-05
 """
 
-import json
+import asyncio
 import logging
 import time
+from functools import partial
+from typing import Iterable, Iterator
 
 import pandas as pd
-import requests
-from requests.exceptions import HTTPError, Timeout
-from simple_chalk import blue, green, red, yellow
-
-from salt import hash_pii
-from storage import (
+import psycopg2
+from redis import RedisError
+from simple_chalk import blue, green, red
+
+from src import settings
+from src.async_pipeline import run_pipeline
+from src.extract import iter_pages
+from src.fingerprint import classify, fingerprint_frames
+from src.migrations import migrate
+from src.parallel import close_executor, partition_sizes, run_parallel
+from src.salt import close_executors, hash_pii, hash_pii_batch
+from src.scheduler import Scheduler, make_trigger
+from src.spool import Spool
+from src.storage import (
+    ADDRESS_COLUMNS,
+    USER_COLUMNS,
     add_user_to_redis,
-    check_table_exists,
-    create_address_table,
-    create_user_table,
-    insert_into_address_table,
-    insert_into_user_table,
+    get_fingerprints,
+    load_users_bulk,
+    quarantine_rows,
+    save_fingerprints,
 )
-from validate import validate_json
+from src.validate import validate_rows
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(filename)s:%(funcName)s -> %(message)s",
 )
 
-"""
-EXTRACTION
-"""
-
-
-def get_user_data() -> dict:
-    """Generate random user data from API call
-
-    Calls a Random user generator API to collect data on 10 random users
-
-    Returns:
-        A JSON object of 100 random users
-
-    Raises:
-        HTTPError: if an HTTP error occurred
-        Timeout: Encase a Timeout has occurred
-    """
-    try:
-        # MAX requests is 100
-        response = requests.get(
-            "https://random-data-api.com/api/v2/users?size=10&response_type=json"
-        )
-
-        response.raise_for_status()
-
-        data = {}
-
-        if response.status_code == requests.codes.ok:
-            data: dict = response.json()
-
-        return data
-
-    except (HTTPError, Timeout) as e:
-        logging.warning(red(f"ERROR: {e}"))
-        raise e
-
-
 """
 TRANSFORM
 """
@@ -130,6 +119,36 @@ def data_clean_up(data: dict) -> pd.DataFrame:
         raise
 
 
+# Users of a chunk counted by incremental mode, by whether they changed since their
+# last write
+CHANGE_COUNTS = ("new", "changed", "unchanged")
+
+# Fields of an API record that are not stored
+DROPPED_FIELDS = frozenset(
+    ["id", "avatar", "gender", "employment", "credit_card", "subscription"]
+)
+
+
+def clean_records(data: list) -> list:
+    """Drop unneeded fields from each record
+
+    Produces the same records as `json.loads(data_clean_up(data).to_json(orient="records"))`
+    for validated data, without building a DataFrame and serializing and parsing the
+    whole batch. The remaining values, including the nested address, are shared with
+    the input rather than copied.
+
+    Agrs:
+        :params data: A list of JSON dicts
+
+    Returns:
+        A list of JSON dicts
+    """
+    return [
+        {key: value for key, value in record.items() if key not in DROPPED_FIELDS}
+        for record in data
+    ]
+
+
 def extract_user_data_for_storage(data: dict) -> list:
     """
     Extract users data to place inside another table
@@ -197,83 +216,495 @@ def extract_address_data_for_storage(data: dict) -> list:
     return address_data
 
 
+def extract_frames(data: list) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Extract the user and address tables as whole columns
+
+    Columnar equivalent of `extract_user_data_for_storage` and
+    `extract_address_data_for_storage`: each table is built in one pass over the
+    records, and missing fields are filled with "n/a" a column at a time. Both frames
+    can be handed straight to `add_user_to_redis` and `load_users_bulk`.
+
+    Agrs:
+        :params data: A list of cleaned JSON dicts
+
+    Returns:
+        A DataFrame of users and a DataFrame of their addresses, row-aligned, with
+        the columns of the users and users_address tables
+    """
+    users = pd.DataFrame.from_records(data, columns=[*USER_COLUMNS, "address"])
+
+    # Users without an address get an empty one, so every field defaults to "n/a"
+    addresses = pd.DataFrame.from_records(
+        [a if isinstance(a, dict) else {} for a in users.pop("address")],
+        columns=list(ADDRESS_COLUMNS[1:]),
+    )
+    addresses.insert(0, "uid", users["uid"])
+
+    users = users.fillna("n/a")
+    users["social_insurance_number"] = hash_pii_batch(users["social_insurance_number"])
+
+    return users, addresses.fillna("n/a")
+
+
+def skip_unchanged(
+    users: pd.DataFrame, addresses: pd.DataFrame
+) -> tuple[pd.DataFrame, pd.DataFrame, dict, dict]:
+    """
+    Drop the users whose content has not changed since it was last written
+
+    Fingerprints every user and compares it with the INCREMENTAL_INDEX, in one
+    round-trip for the chunk.
+
+    Agrs:
+        :params users: Users as returned by `extract_frames`
+        :params addresses: Their addresses, in the same order
+
+    Returns:
+        The users and addresses to write, their fingerprints by uid, and the number
+        of new, changed and unchanged users
+    """
+    uids = users["uid"].tolist()
+    fingerprints = fingerprint_frames(users, addresses)
+    write, changes = classify(uids, fingerprints, get_fingerprints(uids))
+
+    if not all(write):
+        users = users[write].reset_index(drop=True)
+        addresses = addresses[write].reset_index(drop=True)
+    written = {
+        uid: fingerprint
+        for uid, fingerprint, keep in zip(uids, fingerprints, write)
+        if keep
+    }
+
+    logging.info(
+        f"{blue(changes['new'])} new, {blue(changes['changed'])} changed, "
+        f"{blue(changes['unchanged'])} unchanged users"
+    )
+    return users, addresses, written, changes
+
+
+def transform_chunk(data: list) -> dict:
+    """
+    Validate, clean and extract one chunk of users.
+
+    In INCREMENTAL mode, users that have not changed since their last write are
+    dropped here, before anything is written.
+
+    Args:
+        data: A list of users as returned by the API
+
+    Returns:
+        dict: Number of users received, the rejected users with their reasons, the
+        user and address frames to write, None if there are none, and in
+        INCREMENTAL mode the fingerprints of the users to write and the number of
+        new, changed and unchanged users
+    """
+    chunk = {
+        "users": len(data),
+        "rejected": [],
+        "frames": None,
+        "fingerprints": None,
+        "changes": dict.fromkeys(CHANGE_COUNTS, 0),
+    }
+
+    # Validate Data - validate_rows: returns the valid users and the rejected ones
+    valid, chunk["rejected"] = validate_rows(data)
+    if not valid:
+        return chunk
+
+    # Clean Data by dropping the fields that are not stored
+    json_data = clean_records(valid)
+
+    """
+    Now data has been retrieved, validated and cleaned.
+    Now extract two objects of data to insert into relevant tables and Redis
+    for caching.
+    """
+
+    # Extract the user and users address tables as DataFrames
+    users, addresses = extract_frames(json_data)
+
+    if settings.INCREMENTAL:
+        users, addresses, chunk["fingerprints"], chunk["changes"] = skip_unchanged(
+            users, addresses
+        )
+        if users.empty:
+            return chunk
+
+    chunk["frames"] = (users, addresses)
+    return chunk
+
+
+def cache_chunk(chunk: dict) -> int:
+    """
+    Cache the valid users of a transformed chunk in Redis.
+
+    Returns:
+        int: Number of users cached
+    """
+    if chunk["frames"] is None:
+        return 0
+
+    """
+    LOAD -
+
+    Now data has been retrieved, validated and clean now insert into Redis
+    for caching
+    """
+
+    return add_user_to_redis(*chunk["frames"])["keys"]
+
+
+def quarantine_chunk(chunk: dict, strict: bool = False) -> int:
+    """
+    Quarantine the rejected users of a transformed chunk.
+
+    Args:
+        chunk: A chunk as returned by `transform_chunk`
+        strict: Raise quarantine errors instead of logging them
+
+    Returns:
+        int: Number of users quarantined
+
+    Raises:
+        psycopg2.Error / OSError: If they could not be quarantined and `strict` is
+            set.
+    """
+    rejected = chunk["rejected"]
+    if not rejected:
+        return 0
+
+    logging.warning(
+        red(
+            f"Quarantining {len(rejected)} of {chunk['users']} users, "
+            f"first reason: {rejected[0]['reason']}"
+        )
+    )
+    try:
+        return quarantine_rows(rejected)
+    except (psycopg2.Error, OSError):
+        if strict:
+            raise
+        logging.warning(red("Rejected users could not be quarantined"))
+        return 0
+
+
+def store_chunk(chunk: dict, strict: bool = False, quarantine: bool = True) -> int:
+    """
+    Quarantine the rejected users of a transformed chunk and load the valid ones
+    into Postgres.
+
+    Args:
+        chunk: A chunk as returned by `transform_chunk`
+        strict: Raise load errors instead of logging them, so the caller can retry
+        quarantine: Quarantine the rejected users, unless the caller already did
+
+    Returns:
+        int: Number of users loaded, 0 if the load failed
+
+    Raises:
+        psycopg2.Error: If the load failed and `strict` is set.
+    """
+    if quarantine:
+        quarantine_chunk(chunk)
+    if chunk["frames"] is None:
+        return 0
+
+    """
+    INSERT data into Postgres tables users and users_address
+    """
+
+    # Load both tables with COPY in a single transaction
+    try:
+        loaded = load_users_bulk(*chunk["frames"], mode=settings.PG_LOAD_MODE)
+        for table, counts in loaded.items():
+            logging.info(
+                f"{table}: {blue(counts['inserted'])} inserted, {blue(counts['updated'])} updated, {blue(counts['skipped'])} skipped in Postgres"
+            )
+    except psycopg2.Error:
+        if strict:
+            raise
+        logging.warning(red("Batch could not be loaded into Postgres"))
+        return 0
+
+    # Fingerprints are only recorded once the users are stored, so a failed load is
+    # written again next time rather than skipped
+    if chunk.get("fingerprints"):
+        try:
+            save_fingerprints(chunk["fingerprints"])
+        except (psycopg2.Error, RedisError):
+            logging.warning(
+                red("Fingerprints could not be saved, users will be rewritten")
+            )
+
+    return sum(loaded["users"].values())
+
+
+def load_chunk(chunk: dict, strict: bool = False, quarantine: bool = True) -> dict:
+    """
+    Cache and store a transformed chunk, and report its stats as `process_batch`.
+    """
+    return {
+        "users": chunk["users"],
+        "rejected": len(chunk["rejected"]),
+        "cached": cache_chunk(chunk),
+        "loaded": store_chunk(chunk, strict, quarantine),
+        "skipped": chunk["frames"] is None,
+        **chunk["changes"],
+    }
+
+
+def process_batch(data: list, strict: bool = False) -> dict:
+    """
+    Validate, clean, extract and load one chunk of users.
+
+    Args:
+        data: A list of users as returned by the API
+        strict: Raise Postgres load errors instead of logging them
+
+    Users that fail validation are quarantined and the rest of the chunk is loaded.
+
+    Returns:
+        dict: Number of users received, rejected, loaded into Redis and Postgres,
+        whether the chunk was skipped because none of its users were valid or
+        changed, and the number of new, changed and unchanged users in INCREMENTAL
+        mode
+    """
+    return load_chunk(transform_chunk(data), strict)
+
+
+def load_spooled_batch(data: list, batch_id: int, spool: Spool) -> dict:
+    """
+    Process one spooled chunk as `process_batch` does, raising its errors.
+
+    Its rejected users are quarantined on the first attempt only: the spool records
+    when that is done, so retries of the chunk only repeat the Redis writes and the
+    Postgres load, which are idempotent.
+
+    Args:
+        data: A list of users as returned by the API
+        batch_id: The id the chunk was spooled under
+        spool: The spool it was read from
+
+    Returns:
+        dict: The stats of `process_batch`
+    """
+    chunk = transform_chunk(data)
+    if chunk["rejected"] and not spool.is_done(batch_id, "quarantine"):
+        quarantine_chunk(chunk, strict=True)
+        spool.mark_done(batch_id, "quarantine")
+    return load_chunk(chunk, strict=True, quarantine=False)
+
+
+def iter_chunks(pages: Iterable[list], chunk_size: int) -> Iterator[list]:
+    """Regroup pages of users into chunks of `chunk_size` users, the last one shorter."""
+    chunk = []
+    for page in pages:
+        for user in page:
+            chunk.append(user)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_streaming(
+    pages: Iterable[list], chunk_size: int = settings.PIPELINE_CHUNK_SIZE
+) -> dict:
+    """
+    Run the pipeline over a stream of pages, one bounded chunk at a time.
+
+    Pages are pulled lazily, so only the chunk being processed and the pages the
+    extractor fetches ahead are held in memory. Peak memory depends on the chunk
+    size, not on how many users the run has.
+
+    Args:
+        pages: An iterable of pages of users, such as `extract.iter_pages()`
+        chunk_size: Number of users validated, transformed and loaded together
+
+    Returns:
+        dict: Chunks processed and skipped, users received, rejected, cached and loaded,
+        new, changed and unchanged, elapsed seconds and users per second
+    """
+    totals = {
+        "chunks": 0,
+        "skipped": 0,
+        "users": 0,
+        "rejected": 0,
+        "cached": 0,
+        "loaded": 0,
+        **dict.fromkeys(CHANGE_COUNTS, 0),
+    }
+    start = time.perf_counter()
+
+    for chunk in iter_chunks(pages, chunk_size):
+        stats = process_batch(chunk)
+        totals["chunks"] += 1
+        totals["skipped"] += stats["skipped"]
+        for key in ("users", "rejected", "cached", "loaded", *CHANGE_COUNTS):
+            totals[key] += stats[key]
+
+    totals["elapsed"] = time.perf_counter() - start
+    totals["users_per_sec"] = (
+        totals["users"] / totals["elapsed"] if totals["elapsed"] else 0.0
+    )
+    return totals
+
+
+def load_run(pages: Iterable[list]) -> dict:
+    """
+    Load one run's pages of users.
+
+    With PIPELINE_ASYNC the run goes through `async_pipeline.run_pipeline`, so chunks
+    are fetched, transformed and loaded concurrently, otherwise through
+    `run_streaming`, one chunk at a time.
+
+    Args:
+        pages: The run's pages of users, fetched lazily or in full
+
+    Returns:
+        dict: The totals of `run_streaming` or `run_pipeline`
+    """
+    if settings.PIPELINE_ASYNC:
+        chunks = iter_chunks(pages, settings.PIPELINE_CHUNK_SIZE)
+        totals = asyncio.run(
+            run_pipeline(chunks, transform_chunk, cache_chunk, store_chunk)
+        )
+    else:
+        totals = run_streaming(pages, settings.PIPELINE_CHUNK_SIZE)
+    logging.info(
+        green(
+            f"Processed {totals['users']} users in {totals['chunks']} chunks "
+            f"({totals['skipped']} skipped, {totals['rejected']} users quarantined, "
+            f"{totals['users_per_sec']:.0f} users/s)"
+        )
+    )
+    return totals
+
+
+def parallel_run(workers: int = settings.PARALLEL_WORKERS) -> dict:
+    """
+    Run the pipeline over partitions of the run's users across worker processes.
+
+    Each worker fetches its partition from the API and streams it through the
+    pipeline with its own Redis and Postgres connections.
+
+    Args:
+        workers: Number of worker processes
+
+    Returns:
+        dict: The totals of `parallel.run_parallel`
+    """
+    partitions = partition_sizes(
+        settings.EXTRACT_TARGET_USERS, settings.PARALLEL_PARTITIONS or workers
+    )
+    totals = run_parallel(
+        partitions,
+        partial(run_streaming, chunk_size=settings.PIPELINE_CHUNK_SIZE),
+        workers=workers,
+    )
+    logging.info(
+        green(
+            f"Processed {totals['users']} users in {totals['chunks']} chunks "
+            f"({totals['skipped']} skipped, {totals['rejected']} users quarantined, "
+            f"{len(totals['failed'])} partitions failed)"
+        )
+    )
+    return totals
+
+
+def drain_spool(spool: Spool) -> dict:
+    """
+    Load every chunk waiting in the spool.
+
+    Draining stops at the first chunk that cannot be loaded because Postgres or Redis
+    is unreachable, which stays in the spool for the next run along with everything
+    appended after it. A chunk that keeps failing for any other reason is moved to
+    the spool's dead letters after SPOOL_MAX_ATTEMPTS attempts.
+
+    Args:
+        spool: The spool extracted chunks were appended to
+
+    Returns:
+        dict: The totals of `Spool.drain`
+    """
+    return spool.drain(partial(load_spooled_batch, spool=spool))
+
+
+def pipeline_stages(
+    max_in_flight: int = settings.SCHEDULE_MAX_IN_FLIGHT,
+    workers: int = settings.PARALLEL_WORKERS,
+    spool: Spool | None = None,
+) -> list:
+    """
+    The stages of one scheduled run.
+
+    With a single run in flight, pages are pulled from the API as the chunks are
+    loaded. With more, the run is split into an extract stage, which fetches every
+    page, and a load stage, so the next run can extract while this one loads. With
+    more than one worker, the run is a single stage spread over worker processes.
+
+    With a spool, the extract stage appends the run's chunks to it and the load
+    stage drains it, including chunks left over by earlier runs.
+
+    Returns:
+        list: (name, callable) pairs for `scheduler.Scheduler`
+    """
+    if spool is not None:
+        return [
+            (
+                "extract",
+                lambda: spool.append(
+                    iter_chunks(iter_pages(), settings.PIPELINE_CHUNK_SIZE)
+                ),
+            ),
+            ("load", lambda _: drain_spool(spool)),
+        ]
+    if workers > 1:
+        return [("run", lambda: parallel_run(workers))]
+    if max_in_flight == 1:
+        return [("run", lambda: load_run(iter_pages()))]
+    return [("extract", lambda: list(iter_pages())), ("load", load_run)]
+
+
 def main() -> None:
     """
     Main function for processing daily data dumps.
 
     The function retrieves data from an API, validates and cleans the data, extracts relevant information,
     and inserts the data into relevant tables in Postgres and Redis for caching.
-    The function runs in a loop, processing data dumps every 2 minutes.
+    Each run streams through the pipeline in chunks of PIPELINE_CHUNK_SIZE users.
+    Runs are started by a scheduler every SCHEDULE_INTERVAL seconds (or on SCHEDULE_CRON),
+    SCHEDULE_MAX_RUNS times.
 
     Returns:
         None
     """
-    # Each loop will represent one daily data dump.
-    max_count = 10
-    # 24hrs = 2 mins- 10 days worth of data in 20 mins
-    for _ in range(max_count):
-        # Get Data from API. Max requests = 100
-        data_to_be_process = get_user_data()
-
-        # Validate Data - validate_json: returns True
-        if validate_json(data_to_be_process):
-            """
-            Clean Data by removing certain cols using Pandas DataFrame returns pd.DataFrame
-            that is then converted to JSON string for storage enabling extraction
-            """
-
-            json_data = json.loads(
-                data_clean_up(data_to_be_process).to_json(orient="records")
-            )
+    # The schema is brought up to date once, before the first run, rather than
+    # checked by every run
+    if settings.PG_MIGRATE:
+        migrate()
 
-            """
-            Now data has been retrieved, validated, cleaned and converted into JSON. 
-            Now extract two objects of data to insert into relevant tables and Redis
-            for caching.
-            """
-
-            # Extract user data and return a list of dicts
-            user_data = extract_user_data_for_storage(json_data)
-
-            # Extract users address data and return a list of dicts
-            users_address_data = extract_address_data_for_storage(json_data)
-
-            """
-            LOAD - 
-            
-            Now data has been retrieved, validated and clean now insert into Redis
-            for caching
-            """
-
-            add_user_to_redis(user_data, users_address_data)
-
-            """
-            INSERT data into Postgres tables users and users_address
-            """
-
-            if not check_table_exists("users") or not check_table_exists(
-                "users_address"
-            ):
-                # IF tables do not exist create and add data
-                if create_user_table():
-                    logging.info(yellow("users table was created"))
-                if create_address_table():
-                    logging.info(yellow("users_address table was created"))
-
-            for user in user_data:
-                # Add user into Postgres for permanent storage
-                if insert_into_user_table(user):
-                    logging.info(
-                        f"User: {blue(user['uid'])} added successfully into Postgres"
-                    )
-
-            for address in users_address_data:
-                if insert_into_address_table(address):
-                    logging.info(
-                        f"User: {blue(address['uid'])} address has been added successfully into Postgres"
-                    )
-        time.sleep(120)  # Sleep for 2 minutes
-        logging.info(yellow("Waiting for next batch of users to process..."))
+    # Each run will represent one daily data dump.
+    # 24hrs = 2 mins- 10 days worth of data in 20 mins
+    spool = Spool() if settings.SPOOL_ENABLED else None
+    scheduler = Scheduler(pipeline_stages(spool=spool), make_trigger())
+    try:
+        metrics = scheduler.run(max_runs=settings.SCHEDULE_MAX_RUNS or None)
+    finally:
+        close_executor()
+        close_executors()
+        if spool is not None:
+            spool.close()
+    logging.info(
+        green(
+            f"{metrics['finished']} runs finished ({metrics['failed']} failed, "
+            f"{metrics['missed']} missed), mean duration {metrics['duration_mean']:.1f}s, "
+            f"max lag {metrics['lag_max']:.1f}s"
+        )
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,289 @@
+"""
+This module evolves the PostgreSQL schema with numbered migrations, run once at startup.
+
+Every migration is a version, a description and the SQL that takes the schema from the
+previous version to this one. Applied versions are recorded in schema_migrations, so
+`migrate` only runs the ones a database has not seen yet: a fresh database gets every
+table, an existing deployment picks up where it left off.
+
+Each migration runs in its own transaction together with its schema_migrations row, so
+a failed migration leaves the schema at the previous version. A transaction-level
+advisory lock serialises pipelines, workers or API replicas that start at the same
+time; whoever gets it second finds the migration applied and skips it.
+
+Migrations are append-only: once released, a migration is never edited, a new one is
+added instead.
+
+The module includes the following functions:
+- schema_version: Returns the latest migration applied to the database.
+- migrate: Applies the pending migrations, in order.
+
+Run it on its own with:
+
+    python -m src.migrations [--target VERSION]
+"""
+import argparse
+import logging
+import time
+
+import psycopg2
+from simple_chalk import green, red, yellow
+
+from src.storage import get_connection
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(message)s",
+)
+
+# Key of the advisory lock held while a migration is applied
+MIGRATION_LOCK_ID = 4_851_202
+
+# (version, description, SQL), in order
+MIGRATIONS = (
+    (
+        1,
+        "Create the users, address, quarantine and fingerprint tables",
+        # The schema the tables were created with before migrations, so existing
+        # deployments adopt it unchanged
+        """
+            CREATE TABLE IF NOT EXISTS users
+                (
+                    uid VARCHAR(255) PRIMARY KEY,
+                    password VARCHAR(255),
+                    first_name VARCHAR(255),
+                    last_name VARCHAR(255),
+                    username VARCHAR(255),
+                    email VARCHAR(255),
+                    phone_number VARCHAR(255),
+                    social_insurance_number VARCHAR(255),
+                    date_of_birth VARCHAR(255),
+                    ts INT
+                );
+
+            CREATE TABLE IF NOT EXISTS users_address
+                (
+                    uid VARCHAR(255),
+                    city VARCHAR(255),
+                    street_name VARCHAR(255),
+                    street_address VARCHAR(255),
+                    zip_code VARCHAR(255),
+                    state VARCHAR(255),
+                    country VARCHAR(255),
+                    ts INT,
+
+                    PRIMARY KEY (uid),
+                    FOREIGN KEY (uid) REFERENCES users(uid)
+                );
+
+            CREATE TABLE IF NOT EXISTS users_quarantine
+                (
+                    id BIGSERIAL PRIMARY KEY,
+                    uid VARCHAR(255),
+                    reason TEXT,
+                    record JSONB,
+                    ts INT
+                );
+
+            CREATE TABLE IF NOT EXISTS users_fingerprints
+                (
+                    uid VARCHAR(255) PRIMARY KEY,
+                    fingerprint BIGINT NOT NULL,
+                    ts INT
+                );
+
+            CREATE INDEX IF NOT EXISTS users_ts_uid_idx
+                ON users (ts DESC, uid DESC);
+        """,
+    ),
+    (
+        2,
+        "Store uids as uuid, date_of_birth as date and ts as timestamptz",
+        # The foreign key is dropped while both sides of it change type. Quarantined
+        # uids failed validation, so they stay text. Dates of birth loaded before they
+        # were checked to exist, such as 1990-02-30, become NULL rather than failing
+        # the migration.
+        """
+            CREATE OR REPLACE FUNCTION pg_temp.to_date_or_null(value TEXT)
+            RETURNS DATE AS $$
+            BEGIN
+                IF value !~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}$' THEN
+                    RETURN NULL;
+                END IF;
+                RETURN value::date;
+            EXCEPTION WHEN invalid_datetime_format OR datetime_field_overflow THEN
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql IMMUTABLE;
+
+            ALTER TABLE users_address DROP CONSTRAINT IF EXISTS users_address_uid_fkey;
+
+            ALTER TABLE users
+                ALTER COLUMN uid TYPE uuid USING uid::uuid,
+                ALTER COLUMN date_of_birth TYPE date
+                    USING pg_temp.to_date_or_null(date_of_birth),
+                ALTER COLUMN ts TYPE timestamptz USING to_timestamp(ts),
+                ALTER COLUMN ts SET DEFAULT now();
+
+            ALTER TABLE users_address
+                ALTER COLUMN uid TYPE uuid USING uid::uuid,
+                ALTER COLUMN ts TYPE timestamptz USING to_timestamp(ts),
+                ALTER COLUMN ts SET DEFAULT now(),
+                ADD CONSTRAINT users_address_uid_fkey
+                    FOREIGN KEY (uid) REFERENCES users (uid);
+
+            ALTER TABLE users_quarantine
+                ALTER COLUMN ts TYPE timestamptz USING to_timestamp(ts),
+                ALTER COLUMN ts SET DEFAULT now();
+
+            ALTER TABLE users_fingerprints
+                ALTER COLUMN uid TYPE uuid USING uid::uuid,
+                ALTER COLUMN ts TYPE timestamptz USING to_timestamp(ts),
+                ALTER COLUMN ts SET DEFAULT now();
+
+            ANALYZE users, users_address, users_quarantine, users_fingerprints;
+        """,
+    ),
+    (
+        3,
+        "Index ts and the lookup columns of users_address and users_quarantine",
+        """
+            CREATE INDEX IF NOT EXISTS users_address_ts_idx
+                ON users_address (ts);
+
+            CREATE INDEX IF NOT EXISTS users_quarantine_uid_idx
+                ON users_quarantine (uid);
+
+            CREATE INDEX IF NOT EXISTS users_quarantine_ts_idx
+                ON users_quarantine (ts);
+        """,
+    ),
+    (
+        4,
+        "Index the social insurance number hashes of users",
+        # Keyed hashes are deterministic, so users can be looked up and deduplicated
+        # by SIN. The index is part of the schema whichever PII_HASH_MODE a
+        # deployment runs with, since a versioned migration cannot depend on a
+        # setting that may change later. It has a write cost: every COPY and upsert
+        # into users inserts one more entry per row, at a random position since the
+        # values are hashes, and in salted mode every reload of a user changes its
+        # hash. Nothing reads the index in that default mode; dropping it only
+        # affects get_uids_by_sin, which finds keyed-mode users alone anyway.
+        """
+            CREATE INDEX IF NOT EXISTS users_sin_idx
+                ON users (social_insurance_number);
+        """,
+    ),
+)
+
+
+def _create_migration_table(curs) -> None:
+    curs.execute(
+        """
+            CREATE TABLE IF NOT EXISTS schema_migrations
+                (
+                    version INT PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+        """
+    )
+
+
+def schema_version() -> int:
+    """
+    Return the latest migration applied to the database, 0 for none.
+
+    Raises:
+        psycopg2.Error: If an error occurs while querying the database.
+    """
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as curs:
+                curs.execute("SELECT to_regclass('schema_migrations') IS NOT NULL;")
+                if not curs.fetchone()[0]:
+                    return 0
+                curs.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations;")
+                return curs.fetchone()[0]
+
+    except psycopg2.Error as e:
+        logging.error(red(e))
+        raise
+
+
+def migrate(target: int | None = None, migrations: tuple = MIGRATIONS) -> list:
+    """
+    Apply the migrations the database has not seen yet, in order.
+
+    Args:
+        target: Stop after this version, None to apply every migration
+        migrations: (version, description, SQL) triples, in ascending version order
+
+    Returns:
+        list: The versions applied, empty if the schema was already up to date
+
+    Raises:
+        ValueError: If the versions are not ascending.
+        psycopg2.Error: If a migration failed. It is rolled back and the ones after
+            it are not applied.
+    """
+    versions = [version for version, _, _ in migrations]
+    if versions != sorted(set(versions)):
+        raise ValueError("Invalid migrations: versions must be unique and ascending.")
+
+    applied = []
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as curs:
+                curs.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
+                _create_migration_table(curs)
+
+        for version, description, sql in migrations:
+            if target is not None and version > target:
+                break
+
+            with get_connection() as conn:
+                with conn.cursor() as curs:
+                    # Held until the migration commits, then checked again, since
+                    # another process may have applied it while this one waited
+                    curs.execute(
+                        "SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,)
+                    )
+                    curs.execute(
+                        "SELECT 1 FROM schema_migrations WHERE version = %s;",
+                        (version,),
+                    )
+                    if curs.fetchone() is not None:
+                        continue
+
+                    start = time.perf_counter()
+                    curs.execute(sql)
+                    curs.execute(
+                        """
+                            INSERT INTO schema_migrations (version, description)
+                            VALUES (%s, %s);
+                        """,
+                        (version, description),
+                    )
+
+            applied.append(version)
+            logging.info(
+                yellow(
+                    f"Applied migration {version}: {description} "
+                    f"({time.perf_counter() - start:.2f}s)"
+                )
+            )
+
+    except psycopg2.Error as e:
+        logging.error(red(e))
+        raise
+
+    if not applied:
+        logging.info(green("Database schema is up to date"))
+    return applied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the pending migrations.")
+    parser.add_argument("--target", type=int, default=None)
+    migrate(parser.parse_args().target)
@@ -0,0 +1,211 @@
+"""
+This module runs a pipeline run as partitions spread over worker processes.
+
+A run is split into partitions, such as a share of the users to fetch from the API.
+Each partition is turned into pages of users and processed end to end (validate,
+transform, hash and load) by one worker of a process pool. Workers are started with
+"spawn", so each imports its own `src.storage` and opens its own Redis client and
+Postgres pool rather than sharing the parent's sockets. The pool is kept between runs.
+
+The coordinator aggregates the stats of every partition. A partition that raises is
+retried up to PARALLEL_RETRIES times; if a worker dies, the pool is replaced and only
+the partitions that had not finished are submitted again. Only the first of them to
+report the dead worker is charged an attempt for it. Partitions load their chunks in
+their own transactions, so the work of the others is never lost.
+
+The module includes the following functions:
+- partition_sizes: Splits a number of users into partitions.
+- fetch_partition: Fetches the pages of one partition from the API.
+- run_parallel: Processes partitions across the worker pool and aggregates the stats.
+- close_executor: Shuts down the worker pool.
+"""
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Sequence
+
+from simple_chalk import green, red, yellow
+
+from src import settings
+from src.extract import iter_pages
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(message)s",
+)
+
+# Stats of run_streaming summed across partitions
+TOTALS = (
+    "chunks",
+    "skipped",
+    "users",
+    "rejected",
+    "cached",
+    "loaded",
+    "new",
+    "changed",
+    "unchanged",
+)
+
+# Worker pool, by number of workers
+_executors = {}
+
+
+def partition_sizes(target_users: int, partitions: int) -> list:
+    """Split `target_users` into `partitions` near-equal sizes, dropping empty ones."""
+    if target_users < 1 or partitions < 1:
+        raise ValueError(
+            "Invalid 'target_users' or 'partitions': must be at least 1."
+        )
+
+    size, extra = divmod(target_users, partitions)
+    sizes = [size + (i < extra) for i in range(partitions)]
+    return [size for size in sizes if size]
+
+
+def fetch_partition(target_users: int) -> Iterable[list]:
+    """The pages of a partition of `target_users` users, fetched from the API."""
+    return iter_pages(target_users=target_users)
+
+
+def _run_partition(
+    index: int, partition, pages: Callable, process: Callable
+) -> dict:
+    """Process one partition in a worker, tagging its stats with where it ran."""
+    stats = process(pages(partition))
+    stats["partition"] = index
+    stats["worker"] = os.getpid()
+    return stats
+
+
+def _get_executor(workers: int) -> Executor:
+    """Return the pool of `workers` processes, creating it on first use."""
+    executor = _executors.get(workers)
+    if executor is None:
+        executor = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        _executors[workers] = executor
+    return executor
+
+
+def _discard_executor(workers: int) -> None:
+    executor = _executors.pop(workers, None)
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def close_executor() -> None:
+    """Shut down the worker pools used by `run_parallel`."""
+    while _executors:
+        _, executor = _executors.popitem()
+        executor.shutdown()
+
+
+def run_parallel(
+    partitions: Sequence,
+    process: Callable[[Iterable[list]], dict],
+    pages: Callable[..., Iterable[list]] = fetch_partition,
+    workers: int = settings.PARALLEL_WORKERS,
+    retries: int = settings.PARALLEL_RETRIES,
+) -> dict:
+    """
+    Process every partition of a run, in parallel when more than one worker is set
+
+    With one worker, partitions are processed one after another in the calling
+    process. Otherwise they are spread over a pool of `workers` processes, and
+    `pages`, `process` and the partitions must be picklable: module-level functions
+    or `functools.partial` objects of them.
+
+    Args:
+        partitions: What each worker is given, such as a number of users to fetch
+        process: Processes the pages of a partition and returns its stats, such as
+            `main.run_streaming`
+        pages: Turns a partition into an iterable of pages of users
+        workers: Number of worker processes
+        retries: Times a failed partition is run again
+
+    Returns:
+        dict: The summed stats of the partitions, elapsed seconds and users per
+        second, the stats of each partition that finished, in order, and the error
+        of each partition that failed, by index
+
+    Raises:
+        ValueError: If 'workers' is less than 1 or 'retries' is negative.
+    """
+    if workers < 1 or retries < 0:
+        raise ValueError(
+            "Invalid 'workers' or 'retries': must be at least 1 and 0 respectively."
+        )
+
+    start = time.perf_counter()
+    pending = dict(enumerate(partitions))
+    attempts = dict.fromkeys(pending, 0)
+    finished = {}
+    failed = {}
+
+    def fail(index: int, error: BaseException) -> None:
+        attempts[index] += 1
+        logging.warning(
+            red(f"Partition {index} failed (attempt {attempts[index]}): {error!r}")
+        )
+        if attempts[index] > retries:
+            failed[index] = repr(error)
+            del pending[index]
+
+    while pending:
+        if workers == 1:
+            for index, partition in list(pending.items()):
+                try:
+                    finished[index] = _run_partition(index, partition, pages, process)
+                    del pending[index]
+                except Exception as e:
+                    fail(index, e)
+            continue
+
+        executor = _get_executor(workers)
+        futures = {
+            executor.submit(_run_partition, index, partition, pages, process): index
+            for index, partition in pending.items()
+        }
+        broken = False
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                finished[index] = future.result()
+                del pending[index]
+            except BrokenProcessPool as e:
+                # A worker died: only the first partition to report it is charged an
+                # attempt, and every partition left unfinished is tried again on a
+                # fresh pool
+                if not broken:
+                    broken = True
+                    fail(index, e)
+                    _discard_executor(workers)
+            except Exception as e:
+                fail(index, e)
+
+    elapsed = time.perf_counter() - start
+    results = [finished[index] for index in sorted(finished)]
+    totals = {key: sum(stats.get(key, 0) for stats in results) for key in TOTALS}
+    totals.update(
+        {
+            "partitions": len(attempts),
+            "workers": workers,
+            "elapsed": elapsed,
+            "users_per_sec": totals["users"] / elapsed if elapsed else 0.0,
+            "per_partition": results,
+            "failed": failed,
+        }
+    )
+
+    logging.info(
+        (yellow if failed else green)(
+            f"{len(results)} of {len(attempts)} partitions processed by {workers} "
+            f"workers ({totals['users']} users, {totals['users_per_sec']:.0f} users/s)"
+        )
+    )
+    return totals
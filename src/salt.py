@@ -9,6 +9,15 @@ The function uses the SHA-512 hashing algorithm from the `hashlib` module to com
 
 If the input PII is not a valid string or is empty, a `ValueError` is raised.
 
+Salted hashes differ on every call, so stored values cannot be joined or looked up.
+With PII_HASH_MODE set to "keyed", PII is instead hashed with BLAKE2b keyed by the
+secret PII_HASH_KEY, which gives the same 32 hex character hash for the same PII every
+time while staying unguessable without the key.
+
+The `hash_pii_batch` function hashes a whole sequence or column the same way. It
+generates the salts for a chunk in one call and spreads the chunks over a pool of
+PII_HASH_WORKERS processes or threads, chunked by PII_HASH_CHUNK_SIZE.
+
 Example usage:
     hashed_pii = hash_pii("John Doe")
     print(hashed_pii)  # Output: '1234567890'
@@ -17,28 +26,164 @@ import hashlib
 import random
 import string
 import struct
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Literal, Sequence
+
+from src import settings
+
+SALT_LENGTH = 30
+KEYED_DIGEST_SIZE = 16
+
+# Worker pools, created on first use and kept for later batches
+_executors: dict[tuple[str, int], Executor] = {}
 
 
-def hash_pii(pii: str) -> str:
+def _hash_key(key: str) -> bytes:
+    """Encode the key for keyed mode, which cannot run without one."""
+    if not key:
+        raise ValueError("Invalid key: PII_HASH_KEY must be set for keyed mode.")
+    return key.encode("utf-8")
+
+
+def hash_pii(
+    pii: str,
+    mode: Literal["salted", "keyed"] = settings.PII_HASH_MODE,
+    key: str = settings.PII_HASH_KEY,
+) -> str:
     """
     Function for Salting PII information
 
-    Hashes PII with salting
+    Hashes PII with salting, or with a secret key in keyed mode
 
     Args:
         pii: string of sensitive information to be hashed
+        mode: "salted" for a random salt per call, "keyed" for BLAKE2b with `key`,
+            which always gives the same hash for the same PII
+        key: Secret key used in keyed mode, at most 64 bytes
 
     Returns:
         Hashed PII information ready for storage
 
     Raises:
-        ValueError: If the input is not a valid string or is empty.
+        ValueError: If the input is not a valid string or is empty, if the mode is
+            unknown, or if keyed mode has no key.
     """
     if not isinstance(pii, str) or not pii:
         raise ValueError("Invalid input: PII must be a non-empty string.")
 
+    if mode == "keyed":
+        return hashlib.blake2b(
+            pii.encode("ascii"), key=_hash_key(key), digest_size=KEYED_DIGEST_SIZE
+        ).hexdigest()
+    if mode != "salted":
+        raise ValueError(f"Invalid mode '{mode}': must be 'salted' or 'keyed'.")
+
     hash_object = hashlib.sha512(
-        (pii + "".join(random.choices(string.ascii_letters, k=30))).encode("ascii")
+        (pii + "".join(random.choices(string.ascii_letters, k=SALT_LENGTH))).encode(
+            "ascii"
+        )
     ).digest()
     number = struct.unpack(">Q", b"\x00" + hash_object[:7])[0]
     return str(number)
+
+
+def _hash_chunk(values: Sequence[str], mode: str, key: str) -> list[str]:
+    """Hash a chunk of PII the way `hash_pii` does, drawing all its salts at once."""
+    for pii in values:
+        if not isinstance(pii, str) or not pii:
+            raise ValueError("Invalid input: PII must be a non-empty string.")
+
+    if mode == "keyed":
+        blake2b, key_bytes = hashlib.blake2b, _hash_key(key)
+        return [
+            blake2b(
+                pii.encode("ascii"), key=key_bytes, digest_size=KEYED_DIGEST_SIZE
+            ).hexdigest()
+            for pii in values
+        ]
+
+    salts = "".join(random.choices(string.ascii_letters, k=SALT_LENGTH * len(values)))
+    sha512 = hashlib.sha512
+    hashes = []
+
+    for i, pii in enumerate(values):
+        salt = salts[i * SALT_LENGTH : (i + 1) * SALT_LENGTH]
+        digest = sha512((pii + salt).encode("ascii")).digest()
+        hashes.append(str(int.from_bytes(digest[:7], "big")))
+
+    return hashes
+
+
+def _get_executor(kind: str, workers: int) -> Executor:
+    """Return the pool of `workers` processes or threads, creating it on first use."""
+    executor = _executors.get((kind, workers))
+    if executor is None:
+        if kind == "process":
+            # Reseed each worker so forked processes do not draw the same salts
+            executor = ProcessPoolExecutor(workers, initializer=random.seed)
+        else:
+            executor = ThreadPoolExecutor(workers, thread_name_prefix="hash_pii")
+        _executors[(kind, workers)] = executor
+    return executor
+
+
+def close_executors() -> None:
+    """Shut down the worker pools used by `hash_pii_batch`."""
+    while _executors:
+        _, executor = _executors.popitem()
+        executor.shutdown()
+
+
+def hash_pii_batch(
+    values: Sequence[str],
+    workers: int = settings.PII_HASH_WORKERS,
+    chunk_size: int = settings.PII_HASH_CHUNK_SIZE,
+    executor: Literal["process", "thread"] = settings.PII_HASH_EXECUTOR,
+    mode: Literal["salted", "keyed"] = settings.PII_HASH_MODE,
+    key: str = settings.PII_HASH_KEY,
+) -> list[str]:
+    """
+    Hash a sequence or column of PII, in parallel when more than one worker is set
+
+    Each value is hashed exactly as `hash_pii` would, salted or keyed. Values are
+    split into chunks of `chunk_size`, which are hashed in the calling thread when
+    `workers` is 1 or there is a single chunk, and otherwise spread over a pool of
+    `workers` processes or threads. Hashing short values holds the GIL, so threads
+    only help with long values; processes scale with cores.
+
+    Args:
+        values: Strings of sensitive information, such as a list or a pandas Series
+        workers: Number of worker processes or threads
+        chunk_size: Number of values sent to a worker at a time
+        executor: "process" or "thread"
+        mode: "salted" or "keyed", as for `hash_pii`
+        key: Secret key used in keyed mode
+
+    Returns:
+        The hashed values, in the same order
+
+    Raises:
+        ValueError: If any value is not a valid string or is empty, or if the
+            arguments are invalid.
+    """
+    if workers < 1 or chunk_size < 1:
+        raise ValueError("Invalid 'workers' or 'chunk_size': must be at least 1.")
+    if executor not in ("process", "thread"):
+        raise ValueError(
+            f"Invalid executor '{executor}': must be 'process' or 'thread'."
+        )
+    if mode not in ("salted", "keyed"):
+        raise ValueError(f"Invalid mode '{mode}': must be 'salted' or 'keyed'.")
+
+    values = list(values)
+    chunks = [values[i : i + chunk_size] for i in range(0, len(values), chunk_size)]
+
+    hash_chunk = partial(_hash_chunk, mode=mode, key=key)
+
+    if workers == 1 or len(chunks) <= 1:
+        results = map(hash_chunk, chunks)
+    else:
+        results = _get_executor(executor, workers).map(hash_chunk, chunks)
+
+    return [hashed for chunk in results for hashed in chunk]
@@ -0,0 +1,442 @@
+"""
+This module schedules the runs of the ETL pipeline.
+
+A `Scheduler` starts a run every time its trigger fires:
+- FixedRate: every `interval` seconds, measured from when each run was due rather
+  than from when the previous one finished, so slow runs do not push the schedule.
+- Cron: on the minutes matched by a five-field cron expression
+  ("minute hour day-of-month month day-of-week", UTC by default).
+
+Up to `max_in_flight` runs are in progress at once. A run is a sequence of stages,
+each fed the result of the one before, and runs go through every stage in the order
+they were started, one run per stage at a time. With stages ("extract", "load") and
+two runs in flight, the next run extracts while the previous one loads.
+
+When runs fall behind, fire times that were missed are either all run, one after
+another ("all"), or coalesced into a single run for the latest of them ("latest").
+
+Every run is recorded with the time it was due, its lag (how late it started), its
+duration and the duration of each stage; `Scheduler.metrics` summarises them.
+
+Time is read and waited on through a clock. `FakeClock` runs on virtual time that
+jumps ahead whenever every thread of the scheduler is waiting on it, so schedules
+spanning hours can be tested in milliseconds, without real sleeps.
+"""
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Callable, Literal, Sequence
+
+from simple_chalk import green, red, yellow
+
+from src import settings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(message)s",
+)
+
+CATCH_UP_POLICIES = ("all", "latest")
+
+"""
+CLOCKS
+"""
+
+
+class Clock:
+    """Wall-clock time. Callers wait on `condition`, which must be held."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+
+    def now(self) -> float:
+        return time.time()
+
+    def wait(self, timeout: float | None = None) -> None:
+        self.condition.wait(timeout)
+
+    def notify_all(self) -> None:
+        self.condition.notify_all()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def enter(self) -> None:
+        """Register a thread that waits on the clock. Only the fake clock counts them."""
+
+    def leave(self) -> None:
+        """Unregister a thread registered with `enter`."""
+
+
+class FakeClock(Clock):
+    """
+    Virtual time for tests.
+
+    Time stands still while any registered thread is working and jumps to the
+    earliest deadline once all of them are waiting on the clock. Waking up is
+    spurious by design: every wake-up wakes every waiter, which re-checks its
+    condition, as callers of `threading.Condition.wait` must anyway.
+    """
+
+    def __init__(self, start: float = 0.0):
+        super().__init__()
+        self._now = start
+        self._threads = 0
+        self._waiting = {}
+
+    def now(self) -> float:
+        return self._now
+
+    def wait(self, timeout: float | None = None) -> None:
+        token = object()
+        self._waiting[token] = float("inf") if timeout is None else self._now + timeout
+        self._advance_if_idle()
+        while token in self._waiting:
+            self.condition.wait()
+
+    def notify_all(self) -> None:
+        self._waiting.clear()
+        self.condition.notify_all()
+
+    def sleep(self, seconds: float) -> None:
+        with self.condition:
+            deadline = self._now + seconds
+            while self._now < deadline:
+                self.wait(deadline - self._now)
+
+    def advance(self, seconds: float) -> None:
+        """Move time forward, waking the threads whose deadline has passed."""
+        with self.condition:
+            self._now += seconds
+            self.notify_all()
+
+    def enter(self) -> None:
+        with self.condition:
+            self._threads += 1
+
+    def leave(self) -> None:
+        with self.condition:
+            self._threads -= 1
+            self._advance_if_idle()
+
+    def _advance_if_idle(self) -> None:
+        if not self._waiting or len(self._waiting) < self._threads:
+            return
+        deadline = min(self._waiting.values())
+        if deadline != float("inf"):
+            self._now = max(self._now, deadline)
+            self.notify_all()
+
+
+"""
+TRIGGERS
+"""
+
+
+class FixedRate:
+    """Fire every `interval` seconds, the first time as soon as the scheduler starts."""
+
+    def __init__(self, interval: float):
+        if interval <= 0:
+            raise ValueError("Invalid 'interval': must be greater than 0 seconds.")
+        self.interval = interval
+
+    def first(self, now: float) -> float:
+        return now
+
+    def next_after(self, fire_time: float) -> float:
+        return fire_time + self.interval
+
+
+def _parse_cron_field(text: str, low: int, high: int) -> frozenset:
+    """Expand one cron field ("*", "5", "1-5", "*/15", "0-30/10", lists of these)."""
+    values = set()
+    for part in text.split(","):
+        span, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if span == "*":
+            start, end = low, high
+        elif "-" in span:
+            start, end = (int(bound) for bound in span.split("-", 1))
+        else:
+            start = int(span)
+            end = high if "/" in part else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"'{part}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class Cron:
+    """
+    Fire on the minutes matched by a five-field cron expression.
+
+    Fields are minute (0-59), hour (0-23), day of month (1-31), month (1-12) and day
+    of week (0-7, 0 and 7 being Sunday). As in cron, when both day fields are
+    restricted a day matching either of them fires.
+    """
+
+    def __init__(self, expression: str, tz: tzinfo = timezone.utc):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(
+                f"Invalid cron expression '{expression}': must have five fields."
+            )
+        try:
+            self.minutes = _parse_cron_field(fields[0], 0, 59)
+            self.hours = _parse_cron_field(fields[1], 0, 23)
+            self.days = _parse_cron_field(fields[2], 1, 31)
+            self.months = _parse_cron_field(fields[3], 1, 12)
+            self.weekdays = frozenset(
+                day % 7 for day in _parse_cron_field(fields[4], 0, 7)
+            )
+        except ValueError as e:
+            raise ValueError(f"Invalid cron expression '{expression}': {e}") from e
+
+        self.expression = expression
+        self.tz = tz
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def first(self, now: float) -> float:
+        return self.next_after(now)
+
+    def next_after(self, fire_time: float) -> float:
+        moment = datetime.fromtimestamp(fire_time, self.tz).replace(
+            second=0, microsecond=0
+        ) + timedelta(minutes=1)
+        # Every valid field combination fires within a leap-year cycle
+        give_up = moment + timedelta(days=366 * 5)
+
+        while moment < give_up:
+            if moment.month not in self.months:
+                month_start = moment.replace(day=1, hour=0, minute=0)
+                moment = (month_start + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+
+        raise ValueError(f"Cron expression '{self.expression}' never fires.")
+
+
+def make_trigger(
+    interval: float = settings.SCHEDULE_INTERVAL, cron: str = settings.SCHEDULE_CRON
+) -> FixedRate | Cron:
+    """A Cron trigger when a cron expression is given, a FixedRate one otherwise."""
+    return Cron(cron) if cron else FixedRate(interval)
+
+
+"""
+SCHEDULER
+"""
+
+
+class Scheduler:
+    """
+    Start runs of a staged job when a trigger fires.
+
+    Args:
+        stages: (name, callable) pairs. The first callable takes no arguments, the
+            others the result of the stage before; the last result is the run's.
+        trigger: When runs are due, a FixedRate or Cron
+        max_in_flight: Maximum number of runs in progress at once
+        catch_up: "all" runs every missed fire time, "latest" only the latest
+        clock: Clock to read and wait on, a FakeClock in tests
+        history_size: Number of recent runs kept in `history`
+
+    Raises:
+        ValueError: If there are no stages, or max_in_flight or catch_up is invalid.
+    """
+
+    def __init__(
+        self,
+        stages: Sequence[tuple[str, Callable]],
+        trigger: FixedRate | Cron,
+        max_in_flight: int = settings.SCHEDULE_MAX_IN_FLIGHT,
+        catch_up: Literal["all", "latest"] = settings.SCHEDULE_CATCH_UP,
+        clock: Clock | None = None,
+        history_size: int = 100,
+    ):
+        if not stages:
+            raise ValueError("Invalid 'stages': a run needs at least one stage.")
+        if max_in_flight < 1:
+            raise ValueError("Invalid 'max_in_flight': must be at least 1.")
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(
+                f"Invalid catch_up '{catch_up}': must be 'all' or 'latest'."
+            )
+
+        self.stages = list(stages)
+        self.trigger = trigger
+        self.max_in_flight = max_in_flight
+        self.catch_up = catch_up
+        self.clock = clock or Clock()
+        self.history = deque(maxlen=history_size)
+
+        # Sequence number of the next run allowed into each stage
+        self._turns = [0] * len(self.stages)
+        self._started = 0
+        self._finished = 0
+        self._failed = 0
+        self._missed = 0
+        self._in_flight = 0
+        self._stopping = False
+
+    def run(self, max_runs: int | None = None) -> dict:
+        """
+        Start runs as they fall due until `max_runs` have started or `stop` is called,
+        then wait for the runs in flight to finish.
+
+        Args:
+            max_runs: Number of runs to start, None to run until stopped
+
+        Returns:
+            dict: The scheduler's metrics once every run has finished
+        """
+        clock = self.clock
+        clock.enter()
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self.max_in_flight, thread_name_prefix="scheduler"
+            ) as executor, clock.condition:
+                due = self.trigger.first(clock.now())
+
+                while not self._stopping and (
+                    max_runs is None or self._started < max_runs
+                ):
+                    now = clock.now()
+                    if self._in_flight >= self.max_in_flight:
+                        clock.wait()
+                    elif due > now:
+                        clock.wait(due - now)
+                    else:
+                        due = self._skip_missed(due, now)
+                        self._start(executor, due, now)
+                        due = self.trigger.next_after(due)
+
+                while self._in_flight:
+                    clock.wait()
+        finally:
+            clock.leave()
+
+        return self.metrics()
+
+    def stop(self) -> None:
+        """Start no more runs. `run` returns once the runs in flight have finished."""
+        with self.clock.condition:
+            self._stopping = True
+            self.clock.notify_all()
+
+    def _skip_missed(self, due: float, now: float) -> float:
+        """With catch_up "latest", move past every fire time followed by another one due."""
+        if self.catch_up == "latest":
+            following = self.trigger.next_after(due)
+            while following <= now:
+                self._missed += 1
+                due, following = following, self.trigger.next_after(following)
+        return due
+
+    def _start(self, executor: ThreadPoolExecutor, due: float, now: float) -> None:
+        record = {
+            "run": self._started,
+            "scheduled": due,
+            "started": now,
+            "lag": now - due,
+            "finished": None,
+            "duration": None,
+            "stages": {},
+            "error": None,
+            "result": None,
+        }
+        self.history.append(record)
+        self._started += 1
+        self._in_flight += 1
+
+        # Registered here rather than by the worker, so a fake clock cannot move on
+        # before the run has begun
+        self.clock.enter()
+        executor.submit(self._execute, record)
+
+    def _execute(self, record: dict) -> None:
+        clock = self.clock
+        result = None
+
+        try:
+            for index, (name, stage) in enumerate(self.stages):
+                with clock.condition:
+                    while self._turns[index] != record["run"]:
+                        clock.wait()
+                try:
+                    # After a failure the run still takes its turn at every stage,
+                    # so the runs behind it are not held up
+                    if record["error"] is None:
+                        start = clock.now()
+                        result = stage(result) if index else stage()
+                        record["stages"][name] = clock.now() - start
+                except Exception as e:
+                    record["error"] = f"{name}: {e!r}"
+                    logging.error(red(f"Run {record['run']} failed in {name}: {e}"))
+                finally:
+                    with clock.condition:
+                        self._turns[index] += 1
+                        clock.notify_all()
+
+            with clock.condition:
+                record["finished"] = clock.now()
+                record["duration"] = record["finished"] - record["started"]
+                record["result"] = None if record["error"] else result
+                self._finished += 1
+                self._failed += record["error"] is not None
+                self._in_flight -= 1
+                clock.notify_all()
+
+            logging.info(
+                (yellow if record["error"] else green)(
+                    f"Run {record['run']} finished in {record['duration']:.1f}s, "
+                    f"started {record['lag']:.1f}s after it was due"
+                )
+            )
+        finally:
+            clock.leave()
+
+    def metrics(self) -> dict:
+        """
+        Summarise the runs so far.
+
+        Returns:
+            dict: Runs started, finished, failed, missed (coalesced by "latest") and
+            in flight, and the last, mean and max lag and duration in seconds over
+            the runs kept in `history`
+        """
+        with self.clock.condition:
+            finished = [r for r in self.history if r["finished"] is not None]
+            metrics = {
+                "started": self._started,
+                "finished": self._finished,
+                "failed": self._failed,
+                "missed": self._missed,
+                "in_flight": self._in_flight,
+            }
+
+        for key in ("lag", "duration"):
+            values = [r[key] for r in finished]
+            metrics[f"{key}_last"] = values[-1] if values else 0.0
+            metrics[f"{key}_mean"] = statistics.fmean(values) if values else 0.0
+            metrics[f"{key}_max"] = max(values, default=0.0)
+        return metrics
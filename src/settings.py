@@ -0,0 +1,199 @@
+"""
+This module holds the configuration shared by the ETL pipeline and the API.
+
+Every value can be overridden with an environment variable of the same name, so the
+`pipeline` and `api` containers can be tuned from docker-compose without code changes.
+The defaults match the services defined in docker-compose.yml.
+"""
+import os
+
+"""
+EXTRACTION -----------------------------------------------------------------------------
+"""
+
+EXTRACT_API_URL = os.environ.get(
+    "EXTRACT_API_URL", "https://random-data-api.com/api/v2/users"
+)
+
+# Users fetched per run, split into pages of at most EXTRACT_PAGE_SIZE (the API
+# allows 100) fetched EXTRACT_CONCURRENCY at a time.
+EXTRACT_TARGET_USERS = int(os.environ.get("EXTRACT_TARGET_USERS", "10"))
+EXTRACT_PAGE_SIZE = int(os.environ.get("EXTRACT_PAGE_SIZE", "100"))
+EXTRACT_CONCURRENCY = int(os.environ.get("EXTRACT_CONCURRENCY", "4"))
+
+# Per-request timeout in seconds, and retries of 429/5xx responses and timeouts with
+# jittered exponential backoff between EXTRACT_BACKOFF_BASE and EXTRACT_BACKOFF_MAX.
+EXTRACT_TIMEOUT = float(os.environ.get("EXTRACT_TIMEOUT", "10"))
+EXTRACT_MAX_RETRIES = int(os.environ.get("EXTRACT_MAX_RETRIES", "5"))
+EXTRACT_BACKOFF_BASE = float(os.environ.get("EXTRACT_BACKOFF_BASE", "0.5"))
+EXTRACT_BACKOFF_MAX = float(os.environ.get("EXTRACT_BACKOFF_MAX", "30"))
+
+"""
+PIPELINE -------------------------------------------------------------------------------
+"""
+
+# Users validated, transformed and loaded together when a run is streamed
+PIPELINE_CHUNK_SIZE = int(os.environ.get("PIPELINE_CHUNK_SIZE", "1000"))
+
+# With PIPELINE_ASYNC, the extract, transform, Redis and Postgres stages of a run work
+# on different chunks at once, with up to PIPELINE_QUEUE_SIZE chunks queued between
+# stages. Each stage handles as many chunks at once as it has workers; transform
+# workers are threads or processes (PIPELINE_TRANSFORM_EXECUTOR).
+PIPELINE_ASYNC = os.environ.get("PIPELINE_ASYNC", "false").lower() == "true"
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "4"))
+PIPELINE_TRANSFORM_WORKERS = int(os.environ.get("PIPELINE_TRANSFORM_WORKERS", "1"))
+PIPELINE_TRANSFORM_EXECUTOR = os.environ.get("PIPELINE_TRANSFORM_EXECUTOR", "thread")
+PIPELINE_REDIS_WORKERS = int(os.environ.get("PIPELINE_REDIS_WORKERS", "1"))
+PIPELINE_POSTGRES_WORKERS = int(os.environ.get("PIPELINE_POSTGRES_WORKERS", "1"))
+
+# Users of a run are split into PARALLEL_PARTITIONS partitions (0 for one per worker)
+# processed end to end by PARALLEL_WORKERS worker processes. Each worker opens its own
+# Redis client and a Postgres pool of up to PG_POOL_MAX_SIZE connections. A failed
+# partition is run again up to PARALLEL_RETRIES times.
+PARALLEL_WORKERS = int(os.environ.get("PARALLEL_WORKERS", "1"))
+PARALLEL_PARTITIONS = int(os.environ.get("PARALLEL_PARTITIONS", "0"))
+PARALLEL_RETRIES = int(os.environ.get("PARALLEL_RETRIES", "1"))
+
+# With SPOOL_ENABLED, every extracted chunk is first appended to a local SQLite spool
+# at SPOOL_PATH, and the load drains it with checkpoints, so a Postgres outage delays
+# loading instead of losing fetched users. SPOOL_SYNCHRONOUS "FULL" syncs every append
+# to disk; "NORMAL" is faster and still survives a crash of the pipeline.
+SPOOL_ENABLED = os.environ.get("SPOOL_ENABLED", "false").lower() == "true"
+SPOOL_PATH = os.environ.get("SPOOL_PATH", "spool.sqlite3")
+SPOOL_SYNCHRONOUS = os.environ.get("SPOOL_SYNCHRONOUS", "FULL")
+
+# A spooled batch that fails with anything but a lost connection is retried after
+# SPOOL_RETRY_BACKOFF seconds, doubled on every attempt, and moved to the spool's
+# dead_letters table after SPOOL_MAX_ATTEMPTS failures.
+SPOOL_MAX_ATTEMPTS = int(os.environ.get("SPOOL_MAX_ATTEMPTS", "3"))
+SPOOL_RETRY_BACKOFF = float(os.environ.get("SPOOL_RETRY_BACKOFF", "0.5"))
+
+# With INCREMENTAL, each user's content is fingerprinted and users whose fingerprint
+# matches the one stored at their last write are skipped before Redis and Postgres.
+# Fingerprints are kept in the INCREMENTAL_REDIS_KEY hash ("redis") or in the
+# users_fingerprints table ("postgres").
+INCREMENTAL = os.environ.get("INCREMENTAL", "false").lower() == "true"
+INCREMENTAL_INDEX = os.environ.get("INCREMENTAL_INDEX", "redis")
+INCREMENTAL_REDIS_KEY = os.environ.get("INCREMENTAL_REDIS_KEY", "users:fingerprints")
+
+# Where users that fail validation are set aside while the rest of their chunk is
+# loaded: "table" copies them into users_quarantine, "file" appends them as JSON lines
+# to QUARANTINE_FILE.
+QUARANTINE_TARGET = os.environ.get("QUARANTINE_TARGET", "table")
+QUARANTINE_FILE = os.environ.get("QUARANTINE_FILE", "quarantine.ndjson")
+
+# Social insurance numbers are hashed in chunks of PII_HASH_CHUNK_SIZE spread over
+# PII_HASH_WORKERS worker processes ("process") or threads ("thread"). One worker
+# hashes in the pipeline's own thread.
+PII_HASH_WORKERS = int(os.environ.get("PII_HASH_WORKERS", "1"))
+PII_HASH_CHUNK_SIZE = int(os.environ.get("PII_HASH_CHUNK_SIZE", "10000"))
+PII_HASH_EXECUTOR = os.environ.get("PII_HASH_EXECUTOR", "process")
+
+# "salted" hashes each value with a fresh random salt, so equal values never match.
+# "keyed" hashes with BLAKE2b under the secret PII_HASH_KEY (at most 64 bytes), so
+# equal values give equal hashes that can be indexed, joined and deduplicated.
+PII_HASH_MODE = os.environ.get("PII_HASH_MODE", "salted")
+PII_HASH_KEY = os.environ.get("PII_HASH_KEY", "")
+
+"""
+SCHEDULER ------------------------------------------------------------------------------
+"""
+
+# Runs start every SCHEDULE_INTERVAL seconds, or on SCHEDULE_CRON (five fields, UTC)
+# when it is set. SCHEDULE_MAX_RUNS runs are started, 0 runs until stopped.
+SCHEDULE_INTERVAL = float(os.environ.get("SCHEDULE_INTERVAL", "120"))
+SCHEDULE_CRON = os.environ.get("SCHEDULE_CRON", "")
+SCHEDULE_MAX_RUNS = int(os.environ.get("SCHEDULE_MAX_RUNS", "10"))
+
+# Runs in progress at once. From 2, the next run extracts while the previous one
+# loads; its users are then fetched in full before its load starts.
+SCHEDULE_MAX_IN_FLIGHT = int(os.environ.get("SCHEDULE_MAX_IN_FLIGHT", "1"))
+
+# Runs missed while the pipeline was behind: "all" runs each of them back to back,
+# "latest" runs once for the latest and skips the rest.
+SCHEDULE_CATCH_UP = os.environ.get("SCHEDULE_CATCH_UP", "latest")
+
+"""
+REDIS ----------------------------------------------------------------------------------
+"""
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "redis")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", "6379"))
+
+# Connections the async API client may open; requests beyond it wait for one to free.
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "50"))
+
+# TTL of cached users, and how many users are sent per pipeline round-trip. Set
+# REDIS_PIPELINE_TRANSACTION to wrap each chunk in MULTI/EXEC, which the "hash"
+# encoding always does.
+REDIS_TTL = int(os.environ.get("REDIS_TTL", "120"))
+REDIS_PIPELINE_CHUNK_SIZE = int(os.environ.get("REDIS_PIPELINE_CHUNK_SIZE", "1000"))
+REDIS_PIPELINE_TRANSACTION = (
+    os.environ.get("REDIS_PIPELINE_TRANSACTION", "false").lower() == "true"
+)
+
+# How cached users are stored: "hash" (one field per column), "json" (one JSON string)
+# or "msgpack" (one msgpack blob). REDIS_CACHE_COMPRESSION "zlib" compresses the json
+# and msgpack values. Readers detect the encoding of every key, see src.codec.
+REDIS_CACHE_ENCODING = os.environ.get("REDIS_CACHE_ENCODING", "hash")
+REDIS_CACHE_COMPRESSION = os.environ.get("REDIS_CACHE_COMPRESSION", "none")
+
+# Users the API had to load from Postgres are written back with REDIS_READ_THROUGH_TTL.
+# Unknown uids are remembered under REDIS_MISSING_PREFIX for REDIS_NEGATIVE_TTL so
+# repeated lookups of them do not reach Postgres.
+REDIS_READ_THROUGH_TTL = int(
+    os.environ.get("REDIS_READ_THROUGH_TTL", str(REDIS_TTL))
+)
+REDIS_NEGATIVE_TTL = int(os.environ.get("REDIS_NEGATIVE_TTL", "30"))
+REDIS_MISSING_PREFIX = os.environ.get("REDIS_MISSING_PREFIX", "missing:")
+
+# Pub/sub channel on which the pipeline announces the uids it rewrote
+REDIS_INVALIDATION_CHANNEL = os.environ.get(
+    "REDIS_INVALIDATION_CHANNEL", "users:invalidate"
+)
+
+"""
+POSTGRES -------------------------------------------------------------------------------
+"""
+
+POSTGRES_DB = os.environ.get("POSTGRES_DB", "postgres")
+POSTGRES_USER = os.environ.get("POSTGRES_USER", "postgres")
+POSTGRES_PASSWORD = os.environ.get("POSTGRES_PASSWORD", "password")
+POSTGRES_HOST = os.environ.get("POSTGRES_HOST", "postgres")
+POSTGRES_PORT = int(os.environ.get("POSTGRES_PORT", "5432"))
+
+# Connection pool sizing, how long a caller may wait for a free connection and how
+# long a connection may sit idle before it is pinged on checkout.
+PG_POOL_MIN_SIZE = int(os.environ.get("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.environ.get("PG_POOL_MAX_SIZE", "10"))
+PG_POOL_TIMEOUT = float(os.environ.get("PG_POOL_TIMEOUT", "30"))
+PG_POOL_HEALTHCHECK_INTERVAL = float(
+    os.environ.get("PG_POOL_HEALTHCHECK_INTERVAL", "30")
+)
+
+# Rows fetched per round-trip by the server-side cursor behind streaming exports
+PG_CURSOR_PREFETCH = int(os.environ.get("PG_CURSOR_PREFETCH", "1000"))
+
+# With PG_MIGRATE, main.main applies the pending schema migrations (see src.migrations)
+# once at startup. Turn it off when migrations are run separately with
+# `python -m src.migrations`.
+PG_MIGRATE = os.environ.get("PG_MIGRATE", "true").lower() == "true"
+
+# How main.main loads each batch: "insert" copies rows straight in, "upsert" merges
+# them on uid so replayed batches and duplicate uids do not fail the load.
+PG_LOAD_MODE = os.environ.get("PG_LOAD_MODE", "upsert")
+
+"""
+API ------------------------------------------------------------------------------------
+"""
+
+# Page size of /list-users when no limit is given, and the largest limit accepted
+API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", "100"))
+API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", "1000"))
+
+# Optional in-process cache in front of Redis for hot users, bounded by entry count
+# and approximate bytes. Entries never outlive the Redis key they were read from.
+L1_CACHE_ENABLED = os.environ.get("L1_CACHE_ENABLED", "false").lower() == "true"
+L1_CACHE_MAX_ENTRIES = int(os.environ.get("L1_CACHE_MAX_ENTRIES", "10000"))
+L1_CACHE_MAX_BYTES = int(os.environ.get("L1_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+L1_CACHE_TTL = float(os.environ.get("L1_CACHE_TTL", str(REDIS_TTL)))
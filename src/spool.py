@@ -0,0 +1,418 @@
+"""
+This module keeps a durable local spool of extracted batches between extraction and load.
+
+Batches of users fetched from the API are appended to a SQLite database in WAL mode
+before anything else happens to them. A loader drains the spool at its own pace,
+in the order the batches were appended, and checkpoints its position after every
+batch it has loaded. A slow or unavailable Postgres therefore never holds back or
+loses extraction: the loader stops at the first batch it cannot load and picks it up
+again on the next drain, and after a crash the batches past the last checkpoint are
+replayed instead of refetched.
+
+Delivery is at least once: a crash between loading a batch and checkpointing it loads
+the batch again, which the "upsert" PG_LOAD_MODE makes harmless. Steps that are not
+harmless to repeat can be recorded with `mark_done` and skipped on the next attempt.
+Drained batches are deleted once every consumer has checkpointed past them.
+
+Only transient errors, such as a lost connection, stop a drain and leave the batch for
+the next one. Any other error is counted against the batch, which is retried with a
+backoff and moved to the dead_letters table after SPOOL_MAX_ATTEMPTS failures, so a
+batch that can never be loaded does not hold back the ones behind it.
+
+Writers and readers may be different threads or processes, each with its own `Spool`
+on the same path; WAL lets readers work while a batch is appended.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable
+
+import psycopg2
+import redis
+from simple_chalk import green, red, yellow
+
+from src import settings
+
+try:
+    import orjson
+except ImportError:  # the standard library is used instead
+    orjson = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(message)s",
+)
+
+# Stats of a drain, summed from the stats each batch is processed into
+DRAIN_TOTALS = ("users", "rejected", "cached", "loaded", "new", "changed", "unchanged")
+
+# Errors that stop a drain without counting against the batch: the batch is retried on
+# the next drain, however long the outage lasts
+TRANSIENT_ERRORS = (
+    psycopg2.OperationalError,
+    psycopg2.InterfaceError,
+    redis.ConnectionError,
+    redis.TimeoutError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def _dumps(batch: list) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(batch)
+    return json.dumps(batch, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(payload: bytes) -> list:
+    return orjson.loads(payload) if orjson is not None else json.loads(payload)
+
+
+class Spool:
+    """
+    Append-only spool of batches in a SQLite database.
+
+    Args:
+        path: The spool's database file, created if missing
+        synchronous: SQLite's synchronous mode. "FULL" syncs every append to disk;
+            "NORMAL" survives a crash of the pipeline but may lose the latest
+            appends if the host loses power.
+    """
+
+    def __init__(
+        self,
+        path: str = settings.SPOOL_PATH,
+        synchronous: str = settings.SPOOL_SYNCHRONOUS,
+    ):
+        if synchronous.upper() not in ("FULL", "NORMAL"):
+            raise ValueError(
+                f"Invalid synchronous mode '{synchronous}': must be 'FULL' or 'NORMAL'."
+            )
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False, timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute(f"PRAGMA synchronous={synchronous.upper()};")
+        self._conn.execute(
+            """
+                CREATE TABLE IF NOT EXISTS batches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    users INTEGER NOT NULL,
+                    payload BLOB NOT NULL,
+                    created REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT
+                );
+            """
+        )
+        self._conn.execute(
+            """
+                CREATE TABLE IF NOT EXISTS offsets (
+                    consumer TEXT PRIMARY KEY,
+                    position INTEGER NOT NULL
+                );
+            """
+        )
+        self._conn.execute(
+            """
+                CREATE TABLE IF NOT EXISTS steps (
+                    batch_id INTEGER NOT NULL,
+                    step TEXT NOT NULL,
+                    PRIMARY KEY (batch_id, step)
+                );
+            """
+        )
+        self._conn.execute(
+            """
+                CREATE TABLE IF NOT EXISTS dead_letters (
+                    batch_id INTEGER NOT NULL,
+                    consumer TEXT NOT NULL,
+                    users INTEGER NOT NULL,
+                    payload BLOB NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    error TEXT,
+                    failed REAL NOT NULL,
+                    PRIMARY KEY (batch_id, consumer)
+                );
+            """
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def append(self, batches: Iterable[list]) -> dict:
+        """
+        Append batches of users, each committed as soon as it is written.
+
+        Args:
+            batches: Batches of users, such as the pages or chunks of a run
+
+        Returns:
+            dict: Batches and users appended, and the id of the last batch
+        """
+        appended = {"batches": 0, "users": 0, "last_id": None}
+
+        for batch in batches:
+            payload = _dumps(batch)
+            with self._lock:
+                cursor = self._conn.execute(
+                    "INSERT INTO batches (users, payload, created) VALUES (?, ?, ?);",
+                    (len(batch), payload, time.time()),
+                )
+            appended["batches"] += 1
+            appended["users"] += len(batch)
+            appended["last_id"] = cursor.lastrowid
+
+        return appended
+
+    def position(self, consumer: str = "loader") -> int:
+        """The id of the last batch `consumer` checkpointed, 0 if none."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT position FROM offsets WHERE consumer = ?;", (consumer,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def read(self, consumer: str = "loader", limit: int = 1) -> list:
+        """
+        Read the next batches past the checkpoint of `consumer`, without moving it.
+
+        Returns:
+            list: (id, batch) pairs, in the order they were appended
+        """
+        position = self.position(consumer)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM batches WHERE id > ? ORDER BY id LIMIT ?;",
+                (position, limit),
+            ).fetchall()
+        return [(batch_id, _loads(payload)) for batch_id, payload in rows]
+
+    def checkpoint(self, position: int, consumer: str = "loader") -> None:
+        """Record that `consumer` is done with every batch up to `position`."""
+        with self._lock:
+            self._conn.execute(
+                """
+                    INSERT INTO offsets (consumer, position) VALUES (?, ?)
+                    ON CONFLICT (consumer) DO UPDATE SET position = excluded.position;
+                """,
+                (consumer, position),
+            )
+
+    def mark_done(self, batch_id: int, step: str) -> None:
+        """Record that `step` of a batch is done, so a retry can skip it."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO steps (batch_id, step) VALUES (?, ?);",
+                (batch_id, step),
+            )
+
+    def is_done(self, batch_id: int, step: str) -> bool:
+        """Whether `step` of a batch was marked done by an earlier attempt."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM steps WHERE batch_id = ? AND step = ?;",
+                (batch_id, step),
+            ).fetchone()
+        return row is not None
+
+    def _record_failure(self, batch_id: int, error: Exception) -> int:
+        """Count a failed attempt at a batch and return its attempts so far."""
+        with self._lock:
+            self._conn.execute(
+                """
+                    UPDATE batches SET attempts = attempts + 1, last_error = ?
+                    WHERE id = ?;
+                """,
+                (repr(error), batch_id),
+            )
+            return self._conn.execute(
+                "SELECT attempts FROM batches WHERE id = ?;", (batch_id,)
+            ).fetchone()[0]
+
+    def _dead_letter(self, batch_id: int, consumer: str) -> None:
+        """Copy a batch to dead_letters and move `consumer` past it, atomically."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE;")
+            try:
+                self._conn.execute(
+                    """
+                        INSERT OR REPLACE INTO dead_letters (
+                            batch_id, consumer, users, payload, attempts, error, failed
+                        )
+                        SELECT id, ?, users, payload, attempts, last_error, ?
+                        FROM batches WHERE id = ?;
+                    """,
+                    (consumer, time.time(), batch_id),
+                )
+                self._conn.execute(
+                    """
+                        INSERT INTO offsets (consumer, position) VALUES (?, ?)
+                        ON CONFLICT (consumer) DO UPDATE SET position = excluded.position;
+                    """,
+                    (consumer, batch_id),
+                )
+                self._conn.execute("COMMIT;")
+            except Exception:
+                self._conn.execute("ROLLBACK;")
+                raise
+
+    def dead_letters(self, consumer: str = "loader") -> list:
+        """
+        The batches `consumer` gave up on.
+
+        Returns:
+            list: (batch id, batch, attempts, last error) tuples, oldest first
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                    SELECT batch_id, payload, attempts, error FROM dead_letters
+                    WHERE consumer = ? ORDER BY batch_id;
+                """,
+                (consumer,),
+            ).fetchall()
+        return [
+            (batch_id, _loads(payload), attempts, error)
+            for batch_id, payload, attempts, error in rows
+        ]
+
+    def compact(self) -> int:
+        """
+        Delete the batches every consumer has checkpointed past. A consumer holds
+        batches back once it has checkpointed, at 0 to start from the beginning.
+
+        Returns:
+            int: Number of batches deleted
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                    DELETE FROM batches
+                    WHERE id <= (SELECT COALESCE(MIN(position), 0) FROM offsets);
+                """
+            )
+            self._conn.execute(
+                "DELETE FROM steps WHERE batch_id NOT IN (SELECT id FROM batches);"
+            )
+        return cursor.rowcount
+
+    def pending(self, consumer: str = "loader") -> dict:
+        """
+        Report what is left for `consumer` to drain.
+
+        Returns:
+            dict: Checkpointed position, and batches and users past it
+        """
+        position = self.position(consumer)
+        with self._lock:
+            batches, users = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(users), 0) FROM batches WHERE id > ?;",
+                (position,),
+            ).fetchone()
+        return {"position": position, "batches": batches, "users": users}
+
+    def drain(
+        self,
+        process: Callable[[list, int], dict],
+        consumer: str = "loader",
+        max_batches: int | None = None,
+        max_attempts: int = settings.SPOOL_MAX_ATTEMPTS,
+        backoff: float = settings.SPOOL_RETRY_BACKOFF,
+    ) -> dict:
+        """
+        Process the batches past the checkpoint of `consumer`, one at a time.
+
+        The checkpoint moves past each batch once `process` returns. If it raises one
+        of the TRANSIENT_ERRORS, draining stops at that batch, which is processed
+        again on the next drain. Any other error counts as a failed attempt: the
+        batch is retried after `backoff` seconds, doubled on every attempt, and after
+        `max_attempts` failures it is dead-lettered and draining moves on.
+
+        Args:
+            process: Loads a batch, given the batch and its id, and returns its stats,
+                such as `main.load_spooled_batch`
+            consumer: Name the checkpoint is kept under
+            max_batches: Most batches to process, None for all of them
+            max_attempts: Failed attempts before a batch is dead-lettered
+            backoff: Seconds before the first retry of a failed batch
+
+        Returns:
+            dict: Batches drained and dead-lettered, the users, rejected, cached,
+            loaded, new, changed and unchanged of their stats, what is still pending,
+            elapsed seconds, users per second, and the error that stopped the drain,
+            if any
+        """
+        if max_attempts < 1:
+            raise ValueError("Invalid 'max_attempts': must be at least 1.")
+
+        totals = {
+            "batches": 0,
+            "dead_lettered": 0,
+            **dict.fromkeys(DRAIN_TOTALS, 0),
+            "error": None,
+        }
+        start = time.perf_counter()
+
+        while max_batches is None or totals["batches"] < max_batches:
+            batches = self.read(consumer)
+            if not batches:
+                break
+
+            ((batch_id, batch),) = batches
+            try:
+                stats = process(batch, batch_id)
+            except TRANSIENT_ERRORS as e:
+                totals["error"] = repr(e)
+                logging.warning(
+                    red(f"Spooled batch {batch_id} could not be loaded, stopping: {e}")
+                )
+                break
+            except Exception as e:
+                attempts = self._record_failure(batch_id, e)
+                if attempts < max_attempts:
+                    logging.warning(
+                        red(
+                            f"Spooled batch {batch_id} failed (attempt {attempts} of "
+                            f"{max_attempts}), retrying: {e}"
+                        )
+                    )
+                    time.sleep(backoff * 2 ** (attempts - 1))
+                    continue
+
+                self._dead_letter(batch_id, consumer)
+                totals["dead_lettered"] += 1
+                logging.error(
+                    red(
+                        f"Spooled batch {batch_id} failed {attempts} times, moved to "
+                        f"dead_letters: {e}"
+                    )
+                )
+                continue
+
+            self.checkpoint(batch_id, consumer)
+            totals["batches"] += 1
+            for key in DRAIN_TOTALS:
+                totals[key] += stats.get(key, 0)
+
+        self.compact()
+        totals["pending"] = self.pending(consumer)
+        totals["elapsed"] = time.perf_counter() - start
+        totals["users_per_sec"] = (
+            totals["users"] / totals["elapsed"] if totals["elapsed"] else 0.0
+        )
+
+        logging.info(
+            (yellow if totals["error"] or totals["dead_lettered"] else green)(
+                f"Drained {totals['batches']} spooled batches ({totals['users']} users), "
+                f"{totals['dead_lettered']} dead-lettered, "
+                f"{totals['pending']['batches']} still pending"
+            )
+        )
+        return totals
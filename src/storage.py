@@ -2,27 +2,58 @@
 This module provides functions for storing and retrieving user data using Redis and PostgreSQL.
 
 The module includes the following functions:
-- add_user_to_redis: Adds user data to Redis for caching.
+- add_user_to_redis: Adds user data to Redis for caching using pipelined writes.
 - get_user_from_redis: Retrieves user data from Redis based on the given key.
-- create_user_table: Creates the users table in PostgreSQL.
-- create_address_table: Creates the users_address table in PostgreSQL.
+- get_users_from_redis: Retrieves many users from Redis in one round-trip.
+- get_uids_by_sin: Finds users by social insurance number when PII is hashed in keyed mode.
 - check_table_exists: Checks if a table exists in PostgreSQL.
+- get_connection: Borrows a connection from the shared PostgreSQL connection pool.
+- get_pool_stats: Returns size, wait time and checkout counters for the pool.
+- close_pool: Closes every connection held by the pool.
 - insert_into_user_table: Inserts user data into the users table in PostgreSQL.
 - insert_into_address_table: Inserts user address data into the users_address table in PostgreSQL.
+- load_users_bulk: Loads a whole batch of users and addresses with COPY in one transaction.
+- quarantine_rows: Sets aside users that failed validation, in bulk, in a table or a file.
+- get_fingerprints / save_fingerprints: Read and write the content fingerprints of
+  incremental mode, in Redis or PostgreSQL.
+
+The tables themselves are created and evolved by `src.migrations`.
+
+All PostgreSQL helpers borrow their connection from one module-level pool, configured
+through `src.settings`, instead of opening a new connection per statement.
 
 The module also includes a basic logging configuration for logging INFO and ERROR messages.
 
 Note: The module assumes that Redis and PostgreSQL are running and accessible.
 """
+import io
+import json
 import logging
-from datetime import datetime
-from typing import Literal
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Literal
 
+import pandas as pd
 import psycopg2
 import redis
-from redis import RedisError
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from redis import RedisError, ResponseError
 from simple_chalk import red
 
+from src import settings
+from src.codec import (
+    decode_user,
+    is_wrong_type,
+    needs_transaction,
+    other_encoding,
+    queue_write,
+    read_user,
+    split_results,
+)
+from src.salt import hash_pii
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - line:%(lineno)d - %(message)s",
@@ -49,69 +80,105 @@ REDIS --------------------------------------------------------------------------
 
 
 # REDIS connection
-redis = redis.Redis(host="redis", port=6379, decode_responses=True)
+# Responses are not decoded, as msgpack and zlib values are binary; see src.codec
+redis = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+
+
+def _execute_chunk(pipe, uids: list) -> None:
+    """Send a chunk of cache writes, announcing the rewritten uids to API caches."""
+    pipe.publish(settings.REDIS_INVALIDATION_CHANNEL, ",".join(uids))
+    pipe.execute()
 
 
-def add_user_to_redis(user_data: list, user_address_data: list) -> None:
+def add_user_to_redis(
+    user_data: list | pd.DataFrame,
+    user_address_data: list | pd.DataFrame,
+    chunk_size: int = settings.REDIS_PIPELINE_CHUNK_SIZE,
+    transaction: bool = settings.REDIS_PIPELINE_TRANSACTION,
+    ttl: int = settings.REDIS_TTL,
+    encoding: str = settings.REDIS_CACHE_ENCODING,
+    compression: str = settings.REDIS_CACHE_COMPRESSION,
+) -> dict:
     """Add user to Redis for caching
 
     Combine the user and users address data into one dictionary to cache into Redis
-    under the same uid. A TTL of 2mins is also set to each key to keep the Redis cache
-    as fresh as possible.
+    under the same uid. A TTL (2 mins by default) is also set to each key to keep the
+    Redis cache as fresh as possible.
+
+    The HSET and EXPIRE commands are pipelined, so each chunk of users costs a single
+    round-trip rather than two per user. The uids of each chunk are published on
+    REDIS_INVALIDATION_CHANNEL so API processes drop stale in-process copies.
+
+    Both arguments may also be DataFrames, such as those built by
+    `main.extract_frames`, whose rows are read without going back to dicts.
 
     Agrs:
-        user_data: A list of a JSON dicts
-        users_address_data: A list of JSON dicts
+        user_data: A list of a JSON dicts, or a DataFrame of users
+        users_address_data: A list of JSON dicts, or a DataFrame of addresses
+        chunk_size: Number of users sent per pipeline round-trip
+        transaction: Wrap each chunk in MULTI/EXEC, which the hash encoding always
+            does so readers never find a user missing while it is rewritten
+        ttl: TTL in seconds set on each key
+        encoding: "hash", "json" or "msgpack", see src.codec
+        compression: "none" or "zlib", for the json and msgpack encodings
 
     Returns:
-        Nothing
+        dict: Number of keys written and the time in seconds each chunk took
 
     Raises:
         ValueError: If any values are incorrect
     """
-    try:
-        for ud, uad in zip(user_data, user_address_data):
-            uid: str = ud.get("uid")
-            users_data: dict = {
-                "password": ud.get("password", "n/a"),
-                "first_name": ud.get("first_name", "n/a"),
-                "last_name": ud.get("last_name", "n/a"),
-                "username": ud.get("username", "n/a"),
-                "email": ud.get("email", "n/a"),
-                "phone_number": ud.get("phone_number", "n/a"),
-                "social_insurance_number": ud.get("social_insurance_number", "n/a"),
-                "date_of_birth": ud.get("date_of_birth", "n/a"),
-            }
-
-            address_data: dict = {
-                "city": uad.get("city", "n/a"),
-                "street_name": uad.get("street_name", "n/a"),
-                "street_address": uad.get("street_address", "n/a"),
-                "zip_code": uad.get("zip_code", "n/a"),
-                "state": uad.get("state", "n/a"),
-                "country": uad.get("country", "n/a"),
-            }
-
-            full_user_data: dict = users_data | address_data
-
-            # Add user to Redis
-            redis.hset(uid, mapping=full_user_data)
-
-            # Set TTL in Redis for 2 min
-            redis.expire(uid, 120)
-
-        logging.info(
-            f"{red(len(user_data))} Users have been cached in Redis, with a TTL of 2 mins"
-        )
+    if chunk_size < 1:
+        raise ValueError("Invalid 'chunk_size': must be at least 1.")
 
-    except ValueError as e:
-        raise e
+    keys = 0
+    chunk_uids = []
+    chunk_times = []
+    pipe = redis.pipeline(transaction=transaction or needs_transaction(encoding))
+    start = time.perf_counter()
+
+    users = _iter_values(user_data, USER_COLUMNS)
+    addresses = _iter_values(user_address_data, ADDRESS_COLUMNS)
+    for user, address in zip(users, addresses):
+        uid = user[0]
+        if not uid or uid == "n/a":
+            raise ValueError("Invalid 'uid': every user must have a uid.")
+
+        # Cached fields are the user columns then the address columns, minus uid
+        full_user_data: dict = dict(zip(CACHE_FIELDS, user[1:] + address[1:]))
+
+        # Queue the user and its TTL, and forget any earlier "not found"
+        queue_write(pipe, uid, full_user_data, ttl, encoding, compression)
+        pipe.unlink(f"{settings.REDIS_MISSING_PREFIX}{uid}")
+        chunk_uids.append(uid)
+        keys += 1
+
+        if len(chunk_uids) == chunk_size:
+            _execute_chunk(pipe, chunk_uids)
+            chunk_times.append(time.perf_counter() - start)
+            chunk_uids = []
+            start = time.perf_counter()
+
+    if chunk_uids:
+        _execute_chunk(pipe, chunk_uids)
+        chunk_times.append(time.perf_counter() - start)
+
+    logging.info(
+        f"{red(keys)} Users have been cached in Redis in {red(len(chunk_times))} round-trips, with a TTL of {ttl}s"
+    )
+
+    return {"keys": keys, "chunk_times": chunk_times}
 
 
 def get_user_from_redis(key: str) -> dict:
     """
     Retrieve user data from Redis based on the given key.
 
+    A single HGETALL, or GET for the json and msgpack encodings, is sent; Redis
+    returns an empty value for a missing or expired key, so there is no separate
+    EXISTS round-trip that the key could expire behind. A key stored with the other
+    Redis type is read again with the other command.
+
     Args:
         key (str): The key to look up in Redis.
 
@@ -121,12 +188,18 @@ def get_user_from_redis(key: str) -> dict:
     Raises:
         redis.RedisError: If there's an error in executing the Redis command.
     """
-    try:
-        data = {}
+    encoding = settings.REDIS_CACHE_ENCODING
 
-        if redis.exists(key):
-            data: dict = redis.hgetall(key)
-        else:
+    try:
+        try:
+            raw = read_user(redis, key, encoding)
+        except ResponseError as e:
+            if not is_wrong_type(e):
+                raise
+            raw = read_user(redis, key, other_encoding(encoding))
+
+        data: dict = decode_user(raw)
+        if not data:
             logging.error(f"Key {red(key)} not found in Redis. Trying Postgres...")
 
         return data
@@ -136,90 +209,360 @@ def get_user_from_redis(key: str) -> dict:
         raise e
 
 
+def get_users_from_redis(keys: list) -> dict:
+    """
+    Retrieve many users from Redis in a single pipelined round-trip.
+
+    Args:
+        keys (list): The keys to look up in Redis.
+
+    Returns:
+        dict: The user data of every key found, by key. Missing keys are left out.
+
+    Raises:
+        redis.RedisError: If there's an error in executing the Redis commands.
+    """
+    if not keys:
+        return {}
+
+    encoding = settings.REDIS_CACHE_ENCODING
+
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for key in keys:
+            read_user(pipe, key, encoding)
+        users, retry = split_results(keys, pipe.execute(raise_on_error=False))
+
+        # Keys written with another encoding cost one more round-trip
+        if retry:
+            pipe = redis.pipeline(transaction=False)
+            for key in retry:
+                read_user(pipe, key, other_encoding(encoding))
+            users |= split_results(retry, pipe.execute(raise_on_error=False))[0]
+
+        return {key: users[key] for key in keys if key in users}
+
+    except RedisError as e:
+        logging.error(f"General Redis error: {e}")
+        raise e
+
+
 """
 POSTGRES -------------------------------------------------------------------------------
 """
 
 
-def create_user_table() -> Literal[True]:
+# Column order of the users and users_address tables, excluding ts
+USER_COLUMNS = (
+    "uid",
+    "password",
+    "first_name",
+    "last_name",
+    "username",
+    "email",
+    "phone_number",
+    "social_insurance_number",
+    "date_of_birth",
+)
+ADDRESS_COLUMNS = (
+    "uid",
+    "city",
+    "street_name",
+    "street_address",
+    "zip_code",
+    "state",
+    "country",
+)
+
+# Fields of the Redis hash cached under each uid
+CACHE_FIELDS = USER_COLUMNS[1:] + ADDRESS_COLUMNS[1:]
+
+# POSTGRES connection pool, created lazily on first use
+_pool: ThreadedConnectionPool | None = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(settings.PG_POOL_MAX_SIZE)
+# When each pooled connection was last returned, by id(), for as long as it is open
+_last_used: dict[int, float] = {}
+_pool_stats: dict = {
+    "checkouts": 0,
+    "timeouts": 0,
+    "reconnects": 0,
+    "total_wait_time": 0.0,
+    "max_wait_time": 0.0,
+}
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    """Return the shared connection pool, creating it on first use."""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = ThreadedConnectionPool(
+                settings.PG_POOL_MIN_SIZE,
+                settings.PG_POOL_MAX_SIZE,
+                dbname=settings.POSTGRES_DB,
+                user=settings.POSTGRES_USER,
+                password=settings.POSTGRES_PASSWORD,
+                host=settings.POSTGRES_HOST,
+                port=settings.POSTGRES_PORT,
+            )
+        return _pool
+
+
+def _is_healthy(conn) -> bool:
+    """Check a pooled connection is still usable.
+
+    Connections that have been idle for longer than PG_POOL_HEALTHCHECK_INTERVAL are
+    pinged with `SELECT 1`, everything else only has its local state checked so a
+    busy pool does not pay an extra round-trip per checkout.
+    """
+    if conn.closed:
+        return False
+
+    last_used = _last_used.get(id(conn))
+    if last_used is None:
+        # Freshly opened by the pool
+        return True
+    if time.monotonic() - last_used < settings.PG_POOL_HEALTHCHECK_INTERVAL:
+        return True
+
+    try:
+        with conn.cursor() as curs:
+            curs.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def get_connection() -> Iterator:
+    """Borrow a connection from the shared PostgreSQL pool.
+
+    The connection is used as a transaction: it is committed when the block exits
+    cleanly and rolled back otherwise. Broken connections are discarded and replaced
+    on the next checkout.
+
+    Yields:
+        A psycopg2 connection
+
+    Raises:
+        PoolError: If no connection became free within PG_POOL_TIMEOUT seconds.
     """
-    Create users table
+    start = time.perf_counter()
+    if not _pool_slots.acquire(timeout=settings.PG_POOL_TIMEOUT):
+        with _pool_lock:
+            _pool_stats["timeouts"] += 1
+        raise PoolError("Timed out waiting for a Postgres connection")
+
+    waited = time.perf_counter() - start
+    with _pool_lock:
+        _pool_stats["checkouts"] += 1
+        _pool_stats["total_wait_time"] += waited
+        _pool_stats["max_wait_time"] = max(_pool_stats["max_wait_time"], waited)
+
+    try:
+        pool = _get_pool()
+        conn = pool.getconn()
+
+        if not _is_healthy(conn):
+            # Reconnect: drop the dead connection and let the pool open a new one
+            logging.warning(red("Discarding broken Postgres connection"))
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+            with _pool_lock:
+                _pool_stats["reconnects"] += 1
+
+        broken = False
+        try:
+            with conn:
+                yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            _last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn, close=broken or bool(conn.closed))
+            # The pool also closes connections beyond PG_POOL_MIN_SIZE as they come
+            # back. A closed connection is never handed out again, and its id() may
+            # be reused by a new one, so its timestamp is dropped.
+            if conn.closed:
+                _last_used.pop(id(conn), None)
+    finally:
+        _pool_slots.release()
+
+
+def get_pool_stats() -> dict:
+    """
+    Report the state of the PostgreSQL connection pool.
 
     Returns:
-        Literal True
+        dict: Pool size limits, connections in use and idle, total checkouts,
+        time spent waiting for a connection, timeouts and reconnects.
+    """
+    with _pool_lock:
+        stats = dict(_pool_stats)
+        in_use = len(_pool._used) if _pool is not None and not _pool.closed else 0
+        idle = len(_pool._pool) if _pool is not None and not _pool.closed else 0
+
+    stats.update(
+        {
+            "min_size": settings.PG_POOL_MIN_SIZE,
+            "max_size": settings.PG_POOL_MAX_SIZE,
+            "in_use": in_use,
+            "idle": idle,
+            "avg_wait_time": (
+                stats["total_wait_time"] / stats["checkouts"]
+                if stats["checkouts"]
+                else 0.0
+            ),
+        }
+    )
+    return stats
+
+
+def close_pool() -> None:
+    """Close every connection held by the PostgreSQL pool."""
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+        _last_used.clear()
+
+
+def _timestamp() -> datetime:
+    """The ts written with a load: the current time, timezone-aware for timestamptz."""
+    return datetime.now(timezone.utc)
+
+
+def get_uids_by_sin(social_insurance_number: str) -> list:
     """
+    Find the users stored with a social insurance number, through users_sin_idx.
+
+    The number is hashed in keyed mode with PII_HASH_KEY, so only users loaded while
+    PII_HASH_MODE was "keyed" can be found.
+
+    Args:
+        social_insurance_number: The social insurance number, as received from the API
+
+    Returns:
+        list: The uids of the matching users
+
+    Raises:
+        ValueError: If the number is empty or PII_HASH_KEY is not set.
+        psycopg2.Error: If an error occurs while querying the database.
+    """
+    hashed = hash_pii(social_insurance_number, mode="keyed")
+
     try:
-        with psycopg2.connect(
-            dbname="postgres", user="postgres", password="password", host="postgres"
-        ) as conn:
+        with get_connection() as conn:
             with conn.cursor() as curs:
                 curs.execute(
-                    """
-                        CREATE TABLE IF NOT EXISTS users
-                            (
-                                uid VARCHAR(255) PRIMARY KEY,
-                                password VARCHAR(255),
-                                first_name VARCHAR(255),
-                                last_name VARCHAR(255),
-                                username VARCHAR(255),
-                                email VARCHAR(255),
-                                phone_number VARCHAR(255),
-                                social_insurance_number VARCHAR(255),
-                                date_of_birth VARCHAR(255),
-                                ts INT
-                            );
-                    """
+                    "SELECT uid FROM users WHERE social_insurance_number = %s;",
+                    (hashed,),
                 )
+                return [uid for (uid,) in curs.fetchall()]
 
-    except Exception as e:
+    except psycopg2.Error as e:
         logging.error(red(e))
-
-    return True
+        raise
 
 
-def create_address_table() -> Literal[True]:
+def get_fingerprints(
+    uids: list, index: Literal["redis", "postgres"] = settings.INCREMENTAL_INDEX
+) -> dict:
     """
-    Create users_address table
+    Look up the stored fingerprints of users, in one round-trip.
+
+    Args:
+        uids: The uids to look up
+        index: "redis" reads the INCREMENTAL_REDIS_KEY hash, "postgres" the
+            users_fingerprints table
 
     Returns:
-        Literal True
+        dict: The fingerprint of every uid that has one
+
+    Raises:
+        ValueError: If the index is unknown.
+        redis.RedisError / psycopg2.Error: If the index could not be read.
     """
+    if index not in ("redis", "postgres"):
+        raise ValueError(f"Invalid index '{index}': must be 'redis' or 'postgres'.")
+    if not len(uids):
+        return {}
+
+    if index == "redis":
+        values = redis.hmget(settings.INCREMENTAL_REDIS_KEY, list(uids))
+        return {
+            uid: int(value) for uid, value in zip(uids, values) if value is not None
+        }
+
     try:
-        with psycopg2.connect(
-            dbname="postgres", user="postgres", password="password", host="postgres"
-        ) as conn:
+        with get_connection() as conn:
             with conn.cursor() as curs:
                 curs.execute(
                     """
-                        CREATE TABLE IF NOT EXISTS users_address
-                            (
-                                uid VARCHAR(255),
-                                city VARCHAR(255),
-                                street_name VARCHAR(255),
-                                street_address VARCHAR(255),
-                                zip_code VARCHAR(255),
-                                state VARCHAR(255),
-                                country VARCHAR(255),
-                                ts INT,
-
-                                PRIMARY KEY (uid),
-                                FOREIGN KEY (uid) REFERENCES users(uid)
-                            );
-                    """
+                        SELECT uid, fingerprint FROM users_fingerprints
+                        WHERE uid = ANY(%s::uuid[]);
+                    """,
+                    (list(uids),),
                 )
+                return dict(curs.fetchall())
 
-    except Exception as e:
+    except psycopg2.Error as e:
         logging.error(red(e))
+        raise
 
-    return True
+
+def save_fingerprints(
+    fingerprints: dict,
+    index: Literal["redis", "postgres"] = settings.INCREMENTAL_INDEX,
+) -> int:
+    """
+    Store the fingerprints of users that were written, replacing older ones.
+
+    Args:
+        fingerprints: Fingerprint by uid
+        index: "redis" or "postgres", as for `get_fingerprints`
+
+    Returns:
+        int: Number of fingerprints stored
+
+    Raises:
+        ValueError: If the index is unknown.
+        redis.RedisError / psycopg2.Error: If the index could not be written.
+    """
+    if index not in ("redis", "postgres"):
+        raise ValueError(f"Invalid index '{index}': must be 'redis' or 'postgres'.")
+    if not fingerprints:
+        return 0
+
+    if index == "redis":
+        redis.hset(settings.INCREMENTAL_REDIS_KEY, mapping=fingerprints)
+        return len(fingerprints)
+
+    ts = _timestamp()
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as curs:
+                rows = ((uid, fp, ts) for uid, fp in fingerprints.items())
+                _upsert_rows(curs, "users_fingerprints", ("uid", "fingerprint"), rows)
+
+    except psycopg2.Error as e:
+        logging.error(red(e))
+        raise
+
+    return len(fingerprints)
 
 
 def check_table_exists(table_name):
     """Check if table exists"""
     try:
-        with psycopg2.connect(
-            dbname="postgres", user="postgres", password="password", host="postgres"
-        ) as conn:
+        with get_connection() as conn:
             with conn.cursor() as curs:
                 curs.execute(
                     """
@@ -246,9 +589,7 @@ def insert_into_user_table(user_data: dict) -> Literal[True]:
     """
 
     try:
-        with psycopg2.connect(
-            dbname="postgres", user="postgres", password="password", host="postgres"
-        ) as conn:
+        with get_connection() as conn:
             with conn.cursor() as curs:
                 curs.execute(
                     """
@@ -269,7 +610,7 @@ def insert_into_user_table(user_data: dict) -> Literal[True]:
                         user_data["phone_number"],
                         user_data["social_insurance_number"],
                         user_data["date_of_birth"],
-                        int(datetime.timestamp(datetime.now())),
+                        _timestamp(),
                     ),
                 )
 
@@ -287,9 +628,7 @@ def insert_into_address_table(address_data: dict) -> Literal[True]:
         Literal True
     """
     try:
-        with psycopg2.connect(
-            dbname="postgres", user="postgres", password="password", host="postgres"
-        ) as conn:
+        with get_connection() as conn:
             with conn.cursor() as curs:
                 curs.execute(
                     """
@@ -308,7 +647,7 @@ def insert_into_address_table(address_data: dict) -> Literal[True]:
                         address_data["zip_code"],
                         address_data["state"],
                         address_data["country"],
-                        int(datetime.timestamp(datetime.now())),
+                        _timestamp(),
                     ),
                 )
 
@@ -316,3 +655,253 @@ def insert_into_address_table(address_data: dict) -> Literal[True]:
         logging.error(red(e))
 
     return True
+
+
+def _csv_field(value) -> str:
+    """Render one value as a COPY CSV field.
+
+    COPY reads an unquoted empty field as NULL, so None is written that way and every
+    other value is quoted: an empty string stays an empty string.
+    """
+    if value is None:
+        return ""
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class _CopyStream(io.TextIOBase):
+    """Read-only file object that renders rows as CSV on demand for COPY FROM STDIN.
+
+    psycopg2 pulls the data with `read(size)`, so only about one read's worth of CSV
+    is held in memory at a time no matter how many rows the batch has.
+
+    Fields are rendered by `_csv_field` rather than the csv module, which cannot quote
+    every value but None before Python 3.12.
+    """
+
+    def __init__(self, rows: Iterable[tuple]):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        for row in self._rows:
+            self._buffer.write(",".join(map(_csv_field, row)) + "\n")
+            if 0 <= size <= self._buffer.tell():
+                break
+
+        data = self._buffer.getvalue()
+        if size < 0 or size >= len(data):
+            chunk, rest = data, ""
+        else:
+            chunk, rest = data[:size], data[size:]
+
+        self._buffer = io.StringIO()
+        self._buffer.write(rest)
+        return chunk
+
+
+def _iter_values(data: list | pd.DataFrame, columns: tuple[str, ...]) -> Iterator[tuple]:
+    """Yield the values of `columns`, in order, for each dict or DataFrame row.
+
+    Missing fields fall back to "n/a" the same way the per-row helpers do.
+    """
+    if isinstance(data, pd.DataFrame):
+        frame = data.reindex(columns=list(columns), fill_value="n/a")
+        # Zipping object arrays is much cheaper than itertuples on string columns
+        yield from zip(*(frame[column].to_numpy(dtype=object) for column in columns))
+    else:
+        for record in data:
+            yield tuple(record.get(column, "n/a") for column in columns)
+
+
+def _iter_rows(
+    data: list | pd.DataFrame, columns: tuple[str, ...], ts: datetime
+) -> Iterator[tuple]:
+    """Yield table rows, in column order with ts appended, from dicts or a DataFrame."""
+    for values in _iter_values(data, columns):
+        yield (*values, ts)
+
+
+def _copy_rows(curs, table: str, columns: tuple[str, ...], rows: Iterable[tuple]) -> int:
+    """COPY rows into a table and return the number of rows written."""
+    curs.copy_expert(
+        f"COPY {table} ({', '.join(columns)}, ts) FROM STDIN WITH (FORMAT csv)",
+        _CopyStream(rows),
+    )
+    return curs.rowcount
+
+
+def _upsert_rows(
+    curs, table: str, columns: tuple[str, ...], rows: Iterable[tuple]
+) -> dict:
+    """Stage rows in a temp table with COPY and merge them with ON CONFLICT (uid).
+
+    Rows whose values already match the stored row are left untouched, and when a
+    uid appears more than once in the batch the last occurrence wins.
+
+    Returns:
+        dict: Number of rows inserted, updated and skipped
+    """
+    stage = f"{table}_stage"
+    curs.execute(
+        f"""
+            CREATE TEMP TABLE {stage} (LIKE {table}) ON COMMIT DROP;
+            ALTER TABLE {stage} ADD COLUMN seq BIGSERIAL;
+        """
+    )
+    staged = _copy_rows(curs, stage, columns, rows)
+
+    column_list = ", ".join(columns)
+    values = [column for column in columns if column != "uid"]
+    curs.execute(
+        f"""
+            INSERT INTO {table} ({column_list}, ts)
+            SELECT DISTINCT ON (uid) {column_list}, ts
+            FROM {stage}
+            ORDER BY uid, seq DESC
+            ON CONFLICT (uid) DO UPDATE SET
+                {", ".join(f"{column} = EXCLUDED.{column}" for column in values)},
+                ts = EXCLUDED.ts
+            WHERE ({", ".join(f"{table}.{column}" for column in values)})
+                IS DISTINCT FROM ({", ".join(f"EXCLUDED.{column}" for column in values)})
+            RETURNING (xmax = 0) AS inserted;
+        """
+    )
+    results = [row[0] for row in curs.fetchall()]
+    inserted = sum(results)
+    updated = len(results) - inserted
+
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "skipped": staged - inserted - updated,
+    }
+
+
+def load_users_bulk(
+    user_data: list | pd.DataFrame,
+    user_address_data: list | pd.DataFrame,
+    mode: Literal["insert", "upsert"] = "insert",
+) -> dict:
+    """
+    Load a whole batch of users and addresses into Postgres with COPY
+
+    Both tables are written inside one transaction, users first so the foreign key
+    on users_address is satisfied. If either table fails nothing from the batch is
+    kept.
+
+    In "insert" mode rows are copied straight into the tables, so a uid that is
+    already stored fails the batch. In "upsert" mode rows are staged in a temp table
+    and merged with ON CONFLICT (uid) DO UPDATE, which makes replays and backfills
+    idempotent: new uids are inserted, changed rows are updated and identical rows
+    or in-batch duplicates are skipped.
+
+    Args:
+        user_data: A list of user dicts or a DataFrame with the users columns
+        user_address_data: A list of address dicts or a DataFrame with the
+            users_address columns
+        mode: "insert" or "upsert"
+
+    Returns:
+        dict: Number of rows inserted, updated and skipped per table
+
+    Raises:
+        ValueError: If the mode is unknown.
+        psycopg2.Error: If the batch could not be loaded.
+    """
+    if mode not in ("insert", "upsert"):
+        raise ValueError(f"Invalid load mode '{mode}': must be 'insert' or 'upsert'.")
+
+    ts = _timestamp()
+    stats = {}
+
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as curs:
+                for table, columns, data in (
+                    ("users", USER_COLUMNS, user_data),
+                    ("users_address", ADDRESS_COLUMNS, user_address_data),
+                ):
+                    rows = _iter_rows(data, columns, ts)
+                    if mode == "upsert":
+                        stats[table] = _upsert_rows(curs, table, columns, rows)
+                    else:
+                        stats[table] = {
+                            "inserted": _copy_rows(curs, table, columns, rows),
+                            "updated": 0,
+                            "skipped": 0,
+                        }
+
+    except psycopg2.Error as e:
+        logging.error(red(e))
+        raise
+
+    return stats
+
+
+def quarantine_rows(
+    rejected: list,
+    target: Literal["table", "file"] = settings.QUARANTINE_TARGET,
+    path: str = settings.QUARANTINE_FILE,
+) -> int:
+    """
+    Set aside users that failed validation, all in one write.
+
+    With target "table" the rows are copied into users_quarantine in one COPY. With
+    target "file" they are appended to `path` as JSON lines.
+
+    Args:
+        rejected: Rejected entries as returned by `validate.validate_rows`
+        target: "table" or "file"
+        path: File appended to when target is "file"
+
+    Returns:
+        int: Number of rows quarantined
+
+    Raises:
+        ValueError: If target is not "table" or "file".
+        psycopg2.Error: If the rows could not be copied into the table.
+        OSError: If the file could not be written.
+    """
+    if target not in ("table", "file"):
+        raise ValueError(
+            f"Invalid quarantine target '{target}': must be 'table' or 'file'."
+        )
+    if not rejected:
+        return 0
+
+    ts = _timestamp()
+
+    if target == "file":
+        lines = (
+            json.dumps(
+                {
+                    "uid": r["uid"],
+                    "reason": r["reason"],
+                    "record": r["record"],
+                    "ts": ts.isoformat(),
+                },
+                default=str,
+            )
+            for r in rejected
+        )
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return len(rejected)
+
+    rows = (
+        (r["uid"], r["reason"], json.dumps(r["record"], default=str), ts)
+        for r in rejected
+    )
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as curs:
+                return _copy_rows(
+                    curs, "users_quarantine", ("uid", "reason", "record"), rows
+                )
+
+    except psycopg2.Error as e:
+        logging.error(red(e))
+        raise
@@ -7,20 +7,97 @@ in an entry, address details, coordinates, employment details, subscription deta
 and credit card details.
 
 The main function in this module is `validate_json`, which takes a JSON object as input
-and performs validation on the different fields and structures within the object.
+and performs validation on the different fields and structures within the object. The
+checks of every part are built once at import into one table, which `validate_entry`
+runs over a record in a single pass and the per-part validators run a part at a time,
+and `validate_columns` validates a whole batch a column at a time.
+`validate_rows` validates every entry of a batch and returns the valid entries along
+with the reasons the others were rejected, rather than failing the whole batch.
 
 By using the functions in this module, you can ensure that the data you are working with
 meets the required format and is valid, helping to maintain data integrity and consistency
 in your application.
 """
 import re
+from datetime import date
+from functools import lru_cache
+from operator import itemgetter
 from typing import Literal
 from uuid import UUID
 
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+# Patterns are compiled once rather than looked up by `re.match` on every call
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+URL_PATTERN = re.compile(
+    r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*(),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
+)
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# Only whether the patterns match from the start of a value is checked, so the
+# validators use these shortened forms, which accept exactly the same strings without
+# scanning the rest of the value.
+_EMAIL_CHECK = re.compile(r"[^@]+@[^@]+\.[^@]")
+_URL_CHECK = re.compile(r"https?://(?:[a-zA-Z0-9$-_@.&+!*(),]|%[0-9a-fA-F]{2})")
+
+# Fields each part of an entry must hold, as strings unless noted otherwise
+BASIC_FIELDS = (
+    "uid",
+    "password",
+    "first_name",
+    "last_name",
+    "username",
+    "email",
+    "avatar",
+    "gender",
+    "phone_number",
+    "social_insurance_number",
+    "date_of_birth",
+)
+ADDRESS_FIELDS = (
+    "city",
+    "street_name",
+    "street_address",
+    "zip_code",
+    "state",
+    "country",
+)
+COORDINATE_FIELDS = ("lat", "lng")  # floats
+EMPLOYMENT_FIELDS = ("title", "key_skill")
+SUBSCRIPTION_FIELDS = ("plan", "status", "payment_method", "term")
+
+
+@lru_cache(maxsize=None)
+def _uuid_pattern(version: int | None) -> re.Pattern | None:
+    """Compile the pattern of the strings `UUID(value, version=version)` round-trips.
+
+    `str(UUID(...))` is the canonical lowercase hyphenated form, and a version sets
+    the version nibble and the RFC 4122 variant bits. Versions this Python's `UUID`
+    rejects give None, as no string can pass.
+    """
+    if version is None:
+        version_nibble, variant = "[0-9a-f]", "[0-9a-f]"
+    else:
+        try:
+            UUID(int=0, version=version)
+        except ValueError:
+            return None
+        version_nibble, variant = f"{version:x}", "[89ab]"
+
+    return re.compile(
+        f"[0-9a-f]{{8}}-[0-9a-f]{{4}}-{version_nibble}[0-9a-f]{{3}}"
+        f"-{variant}[0-9a-f]{{3}}-[0-9a-f]{{12}}"
+    )
+
 
 def is_valid_uuid(uuid_to_test, version=4):
     """Check if a UUID is valid.
 
+    The UUID must be in the canonical lowercase hyphenated form with the given version
+    and the RFC 4122 variant, which is checked with a precompiled pattern rather than
+    by building a `uuid.UUID` and comparing its string form.
+
     Args:
         uuid_to_test: The UUID to be tested.
         version: The UUID version to validate against. Defaults to 4.
@@ -28,11 +105,38 @@ def is_valid_uuid(uuid_to_test, version=4):
     Returns:
         True if the UUID is valid and matches the specified version; False otherwise.
     """
-    try:
-        uuid_obj = UUID(uuid_to_test, version=version)
-    except ValueError:
-        return False
-    return str(uuid_obj) == uuid_to_test
+    if not isinstance(uuid_to_test, str):
+        # Non-strings fail inside UUID itself, so keep its behaviour for them
+        try:
+            uuid_obj = UUID(uuid_to_test, version=version)
+        except ValueError:
+            return False
+        return str(uuid_obj) == uuid_to_test
+
+    pattern = _uuid_pattern(version)
+    return pattern is not None and pattern.fullmatch(uuid_to_test) is not None
+
+
+def valid_uuids(values, version=4) -> pd.Series:
+    """Check a whole column of UUIDs at once.
+
+    Args:
+        values: A Series or list of values to be tested.
+        version: The UUID version to validate against. Defaults to 4.
+
+    Returns:
+        A boolean Series, True where `is_valid_uuid` would return True. Values that
+        are not strings are False.
+    """
+    column = pd.Series(values, dtype=object)
+    valid = pd.Series(False, index=column.index)
+    pattern = _uuid_pattern(version)
+    # .str refuses a column without any strings, so only the strings are matched
+    strings = column.map(lambda value: isinstance(value, str)).astype(bool)
+    if pattern is None or not strings.any():
+        return valid
+    valid[strings] = column[strings].str.fullmatch(pattern).astype(bool)
+    return valid
 
 
 def is_valid_email(email: str):
@@ -44,8 +148,7 @@ def is_valid_email(email: str):
     Returns:
         A match object if the email address matches the pattern; None otherwise.
     """
-    pattern = r"[^@]+@[^@]+\.[^@]+"
-    return re.match(pattern, email)
+    return EMAIL_PATTERN.match(email)
 
 
 def is_valid_url(url: str):
@@ -57,23 +160,117 @@ def is_valid_url(url: str):
     Returns:
         A match object if the URL matches the pattern; None otherwise.
     """
-    pattern = (
-        r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*(),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
-    )
-    return re.match(pattern, url)
+    return URL_PATTERN.match(url)
 
 
 def is_valid_date(date_text: str):
-    """Check if a date string is in the 'YYYY-MM-DD' format.
+    """Check if a date string is a real date in the 'YYYY-MM-DD' format.
+
+    The whole string must match, and the date must exist, so '1990-02-30' and
+    '1990-01-01garbage' are invalid: they would fail to load into a date column.
 
     Args:
         date_text: The date string to be checked.
 
     Returns:
-        A match object if the date string matches the format; None otherwise.
+        A match object if the date string is a valid date; None otherwise.
     """
-    pattern = r"\d{4}-\d{2}-\d{2}"
-    return re.match(pattern, date_text)
+    match = DATE_PATTERN.fullmatch(date_text)
+    if match is None:
+        return None
+    try:
+        date.fromisoformat(date_text)
+    except ValueError:
+        return None
+    return match
+
+
+# The checks of each part of an entry, built once at import and shared by
+# `validate_entry` and the per-part validators. Each part maps to the error for when
+# it is missing or empty and the one for when it is not a JSON object (None for the
+# entry itself), its fields, the type they must all be and the error for a field
+# that is not, then the (field, check, error) checks of the values that must also
+# match a pattern.
+_PART_CHECKS = {
+    "basic": (
+        None,
+        None,
+        BASIC_FIELDS,
+        str,
+        "Invalid '{field}': must be a string.",
+        (
+            ("uid", is_valid_uuid, "Invalid 'uid': must be a valid UUID."),
+            (
+                "email",
+                _EMAIL_CHECK.match,
+                "Invalid 'email': must be in a valid email format.",
+            ),
+            ("avatar", _URL_CHECK.match, "Invalid 'avatar': must be a valid URL."),
+            (
+                "date_of_birth",
+                is_valid_date,
+                "Invalid 'date_of_birth': must be in 'YYYY-MM-DD' format.",
+            ),
+        ),
+    ),
+    "address": (
+        "Address is missing.",
+        "Invalid address: must be a JSON object.",
+        ADDRESS_FIELDS,
+        str,
+        "Invalid address '{field}': must be a string.",
+        (),
+    ),
+    "coordinates": (
+        "Coordinates are missing.",
+        "Invalid coordinates: must be a JSON object.",
+        COORDINATE_FIELDS,
+        float,
+        "Invalid coordinates '{field}': must be a float.",
+        (),
+    ),
+    "employment": (
+        "Employment details are missing.",
+        "Invalid employment: must be a JSON object.",
+        EMPLOYMENT_FIELDS,
+        str,
+        "Invalid employment '{field}': must be a string.",
+        (),
+    ),
+    "subscription": (
+        "Subscription details are missing.",
+        "Invalid subscription: must be a JSON object.",
+        SUBSCRIPTION_FIELDS,
+        str,
+        "Invalid subscription '{field}': must be a string.",
+        (),
+    ),
+    "credit_card": (
+        "Credit card details are missing.",
+        "Invalid credit card: must be a JSON object.",
+        ("cc_number",),
+        str,
+        "Invalid credit card: missing or invalid '{field}'.",
+        (),
+    ),
+}
+
+
+def _check(part: dict, checks: tuple):
+    """Run the checks of one part, raising the error of the first that fails."""
+    missing, not_object, fields, kind, message, values = checks
+    if missing is not None:
+        if not part:
+            raise ValueError(missing)
+        if not isinstance(part, dict):
+            raise ValueError(not_object)
+
+    for field in fields:
+        if not isinstance(part.get(field), kind):
+            raise ValueError(message.format(field=field))
+    for field, check, error in values:
+        if not check(part[field]):
+            raise ValueError(error)
 
 
 def validate_basic_fields(entry: dict):
@@ -85,31 +282,7 @@ def validate_basic_fields(entry: dict):
     Raises:
         ValueError: If any of the basic fields are missing or invalid.
     """
-    required_fields = [
-        "uid",
-        "password",
-        "first_name",
-        "last_name",
-        "username",
-        "email",
-        "avatar",
-        "gender",
-        "phone_number",
-        "social_insurance_number",
-        "date_of_birth",
-    ]
-    for field in required_fields:
-        if field not in entry or not isinstance(entry[field], str):
-            raise ValueError(f"Invalid '{field}': must be a string.")
-
-    if not is_valid_uuid(entry["uid"]):
-        raise ValueError("Invalid 'uid': must be a valid UUID.")
-    if not is_valid_email(entry["email"]):
-        raise ValueError("Invalid 'email': must be in a valid email format.")
-    if not is_valid_url(entry["avatar"]):
-        raise ValueError("Invalid 'avatar': must be a valid URL.")
-    if not is_valid_date(entry["date_of_birth"]):
-        raise ValueError("Invalid 'date_of_birth': must be in 'YYYY-MM-DD' format.")
+    _check(entry, _PART_CHECKS["basic"])
 
 
 def validate_address(address: dict):
@@ -121,20 +294,7 @@ def validate_address(address: dict):
     Raises:
         ValueError: If the address details are missing or invalid.
     """
-    if not address:
-        raise ValueError("Address is missing.")
-
-    address_fields = [
-        "city",
-        "street_name",
-        "street_address",
-        "zip_code",
-        "state",
-        "country",
-    ]
-    for field in address_fields:
-        if field not in address or not isinstance(address[field], str):
-            raise ValueError(f"Invalid address '{field}': must be a string.")
+    _check(address, _PART_CHECKS["address"])
 
 
 def validate_coordinates(coordinates: dict):
@@ -144,14 +304,9 @@ def validate_coordinates(coordinates: dict):
         coordinates: A dictionary containing latitude and longitude.
 
     Raises:
-        ValueError: If
+        ValueError: If the coordinates are missing or not floats.
     """
-    if not coordinates:
-        raise ValueError("Coordinates are missing.")
-
-    for key in ["lat", "lng"]:
-        if key not in coordinates or not isinstance(coordinates[key], float):
-            raise ValueError(f"Invalid coordinates '{key}': must be a float.")
+    _check(coordinates, _PART_CHECKS["coordinates"])
 
 
 def validate_employment(employment: dict):
@@ -163,12 +318,7 @@ def validate_employment(employment: dict):
     Raises:
         ValueError: If the employment details are missing or invalid.
     """
-    if not employment:
-        raise ValueError("Employment details are missing.")
-
-    for key in ["title", "key_skill"]:
-        if key not in employment or not isinstance(employment[key], str):
-            raise ValueError(f"Invalid employment '{key}': must be a string.")
+    _check(employment, _PART_CHECKS["employment"])
 
 
 def validate_subscription(subscription: dict):
@@ -180,12 +330,7 @@ def validate_subscription(subscription: dict):
     Raises:
         ValueError: If the subscription details are missing or invalid.
     """
-    if not subscription:
-        raise ValueError("Subscription details are missing.")
-
-    for key in ["plan", "status", "payment_method", "term"]:
-        if key not in subscription or not isinstance(subscription[key], str):
-            raise ValueError(f"Invalid subscription '{key}': must be a string.")
+    _check(subscription, _PART_CHECKS["subscription"])
 
 
 def validate_credit_card(credit_card: dict):
@@ -198,11 +343,30 @@ def validate_credit_card(credit_card: dict):
     Raises:
         ValueError: If the credit card details are missing or invalid.
     """
-    if not credit_card:
-        raise ValueError("Credit card details are missing.")
+    _check(credit_card, _PART_CHECKS["credit_card"])
+
 
-    if "cc_number" not in credit_card or not isinstance(credit_card["cc_number"], str):
-        raise ValueError("Invalid credit card: missing or invalid 'cc_number'.")
+def validate_entry(entry: dict):
+    """Validate one entry in a single pass.
+
+    Runs the checks of `validate_basic_fields`, `validate_address`,
+    `validate_coordinates`, `validate_employment`, `validate_subscription` and
+    `validate_credit_card`, in that order and with the same errors, from the same
+    table of checks.
+
+    Args:
+        entry: A dictionary representing an entry.
+
+    Raises:
+        ValueError: If any field is missing or invalid.
+    """
+    _check(entry, _PART_CHECKS["basic"])
+    address = entry.get("address", {})
+    _check(address, _PART_CHECKS["address"])
+    _check(address.get("coordinates", {}), _PART_CHECKS["coordinates"])
+    _check(entry.get("employment", {}), _PART_CHECKS["employment"])
+    _check(entry.get("subscription", {}), _PART_CHECKS["subscription"])
+    _check(entry.get("credit_card", {}), _PART_CHECKS["credit_card"])
 
 
 def validate_json(data: dict) -> Literal[True]:
@@ -218,11 +382,141 @@ def validate_json(data: dict) -> Literal[True]:
         ValueError: if incorrect types are found.
     """
     for entry in data:
-        validate_basic_fields(entry)
-        validate_address(entry.get("address", {}))
-        validate_coordinates(entry.get("address", {}).get("coordinates", {}))
-        validate_employment(entry.get("employment", {}))
-        validate_subscription(entry.get("subscription", {}))
-        validate_credit_card(entry.get("credit_card", {}))
+        validate_entry(entry)
+
+    return True
+
+
+def validate_rows(data: list) -> tuple[list, list]:
+    """Validate every entry, keeping the valid ones and the reasons for the rest.
+
+    Unlike `validate_json`, a bad entry does not fail the batch: every entry is
+    checked in one pass and each rejected one is reported with the first error found
+    in it. Entries shaped in ways the validators do not foresee are rejected too,
+    rather than failing the batch.
+
+    Args:
+        data: A list of JSON dicts.
+
+    Returns:
+        The valid entries, in order, and the rejected ones as dicts holding their
+        "index" in the batch, "uid" (None if it is not a string), "reason" and the
+        "record" itself.
+    """
+    valid = []
+    rejected = []
+
+    for index, entry in enumerate(data):
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError("Invalid entry: must be a JSON object.")
+            validate_entry(entry)
+        except (ValueError, TypeError, KeyError) as e:
+            uid = entry.get("uid") if isinstance(entry, dict) else None
+            rejected.append(
+                {
+                    "index": index,
+                    "uid": uid if isinstance(uid, str) else None,
+                    "reason": str(e),
+                    "record": entry,
+                }
+            )
+        else:
+            valid.append(entry)
+
+    return valid, rejected
+
+
+def _columns(records: list, fields: tuple[str, ...]) -> list[pd.Series] | None:
+    """Gather `fields` from every record into object columns, or None if any is missing."""
+    try:
+        return [
+            pd.Series(list(map(itemgetter(field), records)), dtype=object)
+            for field in fields
+        ]
+    except (KeyError, TypeError):
+        return None
+
+
+def _parts(records: list, key: str) -> list | None:
+    """Gather the non-empty dicts stored under `key`, or None if any is missing."""
+    columns = _columns(records, (key,))
+    if columns is None:
+        return None
+    parts = columns[0].tolist()
+    if all(isinstance(part, dict) and part for part in parts):
+        return parts
+    return None
+
+
+def _all_strings(column: pd.Series) -> bool:
+    """Whether every value of an object column is a string."""
+    return infer_dtype(column, skipna=False) == "string"
+
+
+def _all_floats(column: pd.Series) -> bool:
+    """Whether every value of an object column is a float.
+
+    `infer_dtype` also reports numpy float32 values as floating, which `isinstance`
+    rejects, so each value is checked.
+    """
+    return all(isinstance(value, float) for value in column)
+
+
+def _columns_valid(data: list) -> bool:
+    """Whether every entry passes, checking one column of the batch at a time."""
+    if not data:
+        return True
+
+    columns = _columns(data, BASIC_FIELDS)
+    if columns is None or not all(map(_all_strings, columns)):
+        return False
+    basic = dict(zip(BASIC_FIELDS, columns))
+    if not (
+        valid_uuids(basic["uid"]).all()
+        and basic["email"].str.match(_EMAIL_CHECK).all()
+        and basic["avatar"].str.match(_URL_CHECK).all()
+        and all(map(is_valid_date, basic["date_of_birth"]))
+    ):
+        return False
+
+    addresses = _parts(data, "address")
+    if addresses is None:
+        return False
+
+    for records, fields, check in (
+        (addresses, ADDRESS_FIELDS, _all_strings),
+        (_parts(addresses, "coordinates"), COORDINATE_FIELDS, _all_floats),
+        (_parts(data, "employment"), EMPLOYMENT_FIELDS, _all_strings),
+        (_parts(data, "subscription"), SUBSCRIPTION_FIELDS, _all_strings),
+        (_parts(data, "credit_card"), ("cc_number",), _all_strings),
+    ):
+        if records is None:
+            return False
+        columns = _columns(records, fields)
+        if columns is None or not all(map(check, columns)):
+            return False
 
     return True
+
+
+def validate_columns(data: list) -> Literal[True]:
+    """Validate a whole batch a column at a time.
+
+    Accepts and rejects exactly what `validate_json` does. Each field is gathered into
+    one column and checked at once, with the patterns applied through `Series.str`.
+    Batches that fail are passed to `validate_json` to find the first invalid entry,
+    so the error raised is the same.
+
+    Args:
+        data: A list of JSON dicts.
+
+    Returns:
+        Literal True if every entry is valid.
+
+    Raises:
+        ValueError: if incorrect types are found.
+    """
+    if _columns_valid(data):
+        return True
+    return validate_json(data)
@@ -32,7 +32,7 @@ function App() {
     fetch(`http://127.0.0.1:80/api/v2/datapipeline/list-users`)
       .then(response => response.json())
       .then(data => {
-        setUsers(data)
+        setUsers(data.users)
       })
       .catch(error => console.error(error))
   }, [])
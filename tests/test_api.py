@@ -1,16 +1,29 @@
-import psycopg2
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+from uuid import UUID
+
+import asyncpg
 import pytest
 from fastapi.testclient import TestClient
 
-from src.api import app
+from src.api import app, decode_cursor, encode_cursor
 
 client = TestClient(app)
 
+USER_ID = "7c9e6679-7425-40de-944b-e07fc1f90ae7"
+
+# Users as listed by Postgres, newest first: uuid uids and timestamptz ts
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+ROWS = [(UUID(int=i, version=4), T0 + timedelta(seconds=i)) for i in (3, 2, 1)]
+UIDS = [str(uid) for uid, _ in ROWS]
+
 
 def test_get_user_from_redis():
     # Mock the get_user_from_redis function to return user information
     # from Redis
-    def mock_get_user_from_redis(user_id):
+    async def mock_get_user_from_redis(user_id):
         return {
             "uid": user_id,
             "first_name": "John",
@@ -20,18 +33,17 @@ def test_get_user_from_redis():
             # ... other user information
         }
 
-    # Monkey patch the get_user_from_redis function
-    app.get_user_from_redis = mock_get_user_from_redis
-
-    # Send a GET request to the API endpoint
-    response = client.get("/api/datapipe/123")
+    # Patch the read-through lookup, which answers from Redis
+    with patch("src.api.get_user_read_through", mock_get_user_from_redis):
+        # Send a GET request to the API endpoint
+        response = client.get(f"/api/v2/datapipeline/{USER_ID}")
 
     # Assert that the response status code is 200
     assert response.status_code == 200
 
     # Assert that the response body matches the user information from Redis
     assert response.json() == {
-        "uid": "123",
+        "uid": USER_ID,
         "first_name": "John",
         "last_name": "Doe",
         "username": "johndoe",
@@ -41,52 +53,142 @@ def test_get_user_from_redis():
 
 
 def test_get_user_from_database():
-    # Mock the get_user_from_redis function to return an empty dictionary
+    # Mock the read-through lookup to return the user row from Postgres,
     # indicating that the user is not found in Redis
-    def mock_get_user_from_redis(user_id):
-        return {}
-
-    # Monkey patch the get_user_from_redis function
-    app.get_user_from_redis = mock_get_user_from_redis
-
-    # Send a GET request to the API endpoint
-    response = client.get("/api/datapipe/123")
+    mock_get_user_read_through = AsyncMock(
+        return_value=[
+            (
+                USER_ID,
+                "John",
+                "Doe",
+                "johndoe",
+                "johndoe@example.com",
+                # ... other user information
+            )
+        ]
+    )
+
+    # Patch the read-through lookup
+    with patch("src.api.get_user_read_through", mock_get_user_read_through):
+        # Send a GET request to the API endpoint
+        response = client.get(f"/api/v2/datapipeline/{USER_ID}")
 
     # Assert that the response status code is 200
     assert response.status_code == 200
 
     # Assert that the response body matches the user information from the database
     assert response.json() == [
-        "123",
-        "John",
-        "Doe",
-        "johndoe",
-        "johndoe@example.com",
-        # ... other user information
+        [
+            USER_ID,
+            "John",
+            "Doe",
+            "johndoe",
+            "johndoe@example.com",
+            # ... other user information
+        ]
     ]
+    mock_get_user_read_through.assert_awaited_once_with(USER_ID)
 
 
 def test_get_user_error():
-    # Mock the get_user_from_redis function to return an empty dictionary
-    # indicating that the user is not found in Redis
-    def mock_get_user_from_redis(user_id):
-        return {}
-
-    # Monkey patch the get_user_from_redis function
-    app.get_user_from_redis = mock_get_user_from_redis
+    # Mock the read-through lookup to raise a database error after
+    # the user is not found in Redis
+    mock_get_user_read_through = AsyncMock(
+        side_effect=asyncpg.PostgresError("Database connection error")
+    )
 
-    # Mock the psycopg2.connect function to raise an error
-    def mock_psycopg2_connect(*args, **kwargs):
-        raise psycopg2.Error("Database connection error")
-
-    # Monkey patch the psycopg2.connect function
-    app.psycopg2.connect = mock_psycopg2_connect
-
-    # Send a GET request to the API endpoint
-    response = client.get("/api/datapipe/123")
+    # Patch the read-through lookup
+    with patch("src.api.get_user_read_through", mock_get_user_read_through):
+        # Send a GET request to the API endpoint
+        response = client.get(f"/api/v2/datapipeline/{USER_ID}")
 
     # Assert that the response status code is 200
     assert response.status_code == 200
 
     # Assert that the response body contains the error message
     assert response.json() == {"message": "Database connection error"}
+
+
+def test_get_user_invalid_uid():
+    # Mock the read-through lookup, which should not be reached
+    mock_get_user_read_through = AsyncMock()
+
+    # Send a GET request for a uid that is not a v4 UUID
+    with patch("src.api.get_user_read_through", mock_get_user_read_through):
+        response = client.get("/api/v2/datapipeline/123")
+
+    # Assert that no rows are returned without a lookup
+    assert response.status_code == 200
+    assert response.json() == []
+    mock_get_user_read_through.assert_not_awaited()
+
+
+def test_list_users_first_page():
+    # Mock the fetch_user_page function to return one row more than the limit
+    mock_fetch_user_page = AsyncMock(return_value=ROWS)
+
+    # Patch the fetch_user_page function
+    with patch("src.api.fetch_user_page", mock_fetch_user_page):
+        # Send a GET request to the API endpoint
+        response = client.get("/api/v2/datapipeline/list-users?limit=2")
+
+    # Assert that the page holds two uids and a token pointing at the last one
+    assert response.status_code == 200
+    assert response.json()["users"] == UIDS[:2]
+    assert decode_cursor(response.json()["next"]) == (ROWS[1][1], UIDS[1])
+    mock_fetch_user_page.assert_awaited_once_with(3, None)
+
+
+def test_list_users_last_page():
+    # Mock the fetch_user_page function to return fewer rows than the limit
+    mock_fetch_user_page = AsyncMock(return_value=ROWS[2:])
+
+    # Patch the fetch_user_page function
+    with patch("src.api.fetch_user_page", mock_fetch_user_page):
+        # Send a GET request continuing from a previous page
+        response = client.get(
+            "/api/v2/datapipeline/list-users",
+            params={"limit": 2, "after": encode_cursor(*ROWS[1][::-1])},
+        )
+
+    # Assert that the page continues after the token and is the last one
+    assert response.json() == {"users": UIDS[2:], "next": None}
+    mock_fetch_user_page.assert_awaited_once_with(3, (ROWS[1][1], UIDS[1]))
+
+
+def test_list_users_invalid_token():
+    # Send a GET request with a token the API did not issue
+    response = client.get("/api/v2/datapipeline/list-users?after=not-a-token")
+
+    # Assert that the request is rejected
+    assert response.status_code == 400
+
+
+def test_list_users_rejects_tokens_of_integer_timestamps():
+    # A token issued before ts became a timestamptz
+    token = base64.urlsafe_b64encode(json.dumps([2, UIDS[1]]).encode()).decode()
+
+    # Send a GET request with it
+    response = client.get("/api/v2/datapipeline/list-users", params={"after": token})
+
+    # Assert that the request is rejected rather than failing in Postgres
+    assert response.status_code == 400
+
+
+def test_export_users_streams_ndjson():
+    # Mock the stream_user_ids function to yield rows from a cursor
+    async def mock_stream_user_ids(after):
+        for row in ROWS[1:]:
+            yield row
+
+    # Patch the stream_user_ids function
+    with patch("src.api.stream_user_ids", mock_stream_user_ids):
+        # Send a GET request to the API endpoint
+        response = client.get("/api/v2/datapipeline/export-users")
+
+    # Assert that every user is one JSON line
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.text.splitlines() == [
+        f'{{"uid": "{UIDS[1]}", "ts": "2026-01-01T00:00:02+00:00"}}',
+        f'{{"uid": "{UIDS[2]}", "ts": "2026-01-01T00:00:01+00:00"}}',
+    ]
@@ -0,0 +1,178 @@
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from benchmarks.synthetic import fake_api_users
+from src.async_pipeline import get_pipeline_stats, run_pipeline
+from src.main import cache_chunk, iter_chunks, store_chunk, transform_chunk
+
+
+def fake_transform(chunk: list) -> dict:
+    return {"users": len(chunk), "rejected": [], "frames": chunk}
+
+
+def fake_load(result: dict) -> int:
+    return result["users"]
+
+
+def transform_in_worker(chunk: list) -> dict:
+    # Report whether the worker process started without the parent's Postgres pool
+    from src import storage
+
+    return {"users": len(chunk), "rejected": [], "frames": storage._pool is None}
+
+
+def test_run_pipeline_counts_every_stage():
+    # Input data: ten chunks of three users
+    chunks = [[{"uid": str(i)}] * 3 for i in range(10)]
+
+    # Call the function
+    totals = asyncio.run(
+        run_pipeline(
+            chunks, fake_transform, fake_load, fake_load, transform_workers=2
+        )
+    )
+
+    # Assert that every chunk went through every stage
+    assert totals["chunks"] == 10
+    assert totals["users"] == totals["cached"] == totals["loaded"] == 30
+    for name in ("extract", "transform", "redis", "postgres"):
+        assert totals["stages"][name]["chunks"] == 10
+        assert totals["stages"][name]["users"] == 30
+    assert totals["bottleneck"] in totals["stages"]
+    assert get_pipeline_stats()["stages"]["postgres"]["queue_depth"] == 0
+
+
+@patch("src.storage._pool", "the parent's pool")
+def test_run_pipeline_process_workers_do_not_inherit_the_parents_pools():
+    # Input data, and a store recording what each worker reported
+    chunks = [[{"uid": str(i)}] for i in range(4)]
+    reported = []
+
+    def store(result: dict) -> int:
+        reported.append(result["frames"])
+        return result["users"]
+
+    # Call the function with transform processes
+    totals = asyncio.run(
+        run_pipeline(
+            chunks,
+            transform_in_worker,
+            fake_load,
+            store,
+            transform_workers=2,
+            transform_executor="process",
+        )
+    )
+
+    # Assert that every chunk was transformed in a worker with a pool of its own
+    assert totals["loaded"] == 4
+    assert reported == [True] * 4
+
+
+def test_run_pipeline_applies_backpressure():
+    # A Postgres stage held up until the test releases it, and a count of the chunks
+    # the extractor was asked for
+    release = threading.Event()
+    pulled = []
+
+    def chunks():
+        for i in range(20):
+            pulled.append(i)
+            yield [{"uid": str(i)}]
+
+    def slow_store(result: dict) -> int:
+        release.wait(timeout=10)
+        return result["users"]
+
+    async def run():
+        pipeline = asyncio.create_task(
+            run_pipeline(chunks(), fake_transform, fake_load, slow_store, queue_size=1)
+        )
+        await asyncio.sleep(0.2)
+        held_up = len(pulled)
+        release.set()
+        return held_up, await pipeline
+
+    # Call the function
+    held_up, totals = asyncio.run(run())
+
+    # Assert that extraction stopped once every queue and worker held a chunk, and
+    # carried on once the store caught up
+    assert held_up <= 6
+    assert totals["loaded"] == 20
+    assert totals["stages"]["transform"]["queue_max"] == 1
+
+
+def test_run_pipeline_overlaps_extract_with_load():
+    # A first load that only finishes once later chunks have been extracted
+    extracted_ahead = threading.Event()
+
+    def chunks():
+        for i in range(4):
+            if i == 2:
+                extracted_ahead.set()
+            yield [{"uid": str(i)}]
+
+    def store(result: dict) -> int:
+        extracted_ahead.wait(timeout=10)
+        return result["users"]
+
+    # Call the function
+    asyncio.run(run_pipeline(chunks(), fake_transform, fake_load, store))
+
+    # Assert that the extractor ran ahead of the load
+    assert extracted_ahead.is_set()
+
+
+def test_run_pipeline_stops_on_stage_error():
+    # A Redis stage that fails
+    def broken_cache(result: dict) -> int:
+        raise ConnectionError("Redis is down")
+
+    chunks = [[{"uid": str(i)}] for i in range(50)]
+
+    # Assert that the error is raised and the pipeline does not hang
+    with pytest.raises(ConnectionError):
+        asyncio.run(
+            run_pipeline(chunks, fake_transform, broken_cache, fake_load, queue_size=1)
+        )
+
+
+def test_run_pipeline_rejects_invalid_sizes():
+    # Assert that a queue without room raises a ValueError
+    with pytest.raises(ValueError):
+        asyncio.run(run_pipeline([], fake_transform, fake_load, fake_load, 0))
+
+
+@patch("src.main.quarantine_rows")
+@patch("src.main.add_user_to_redis")
+@patch("src.main.load_users_bulk")
+def test_run_pipeline_with_main_stages(mock_load, mock_redis, mock_quarantine):
+    # Input data: pages of users with one invalid user
+    data = fake_api_users(25)
+    data[7]["email"] = None
+    mock_redis.side_effect = lambda users, addresses: {"keys": len(users)}
+    mock_load.side_effect = lambda users, addresses, mode: {
+        "users": {"inserted": len(users), "updated": 0, "skipped": 0},
+        "users_address": {"inserted": len(users), "updated": 0, "skipped": 0},
+    }
+
+    # Call the function with chunks of ten users
+    totals = asyncio.run(
+        run_pipeline(
+            iter_chunks([data[:12], data[12:]], 10),
+            transform_chunk,
+            cache_chunk,
+            store_chunk,
+        )
+    )
+
+    # Assert that the totals match those of the sequential pipeline
+    assert totals["chunks"] == 3
+    assert totals["users"] == 25
+    assert totals["rejected"] == 1
+    assert totals["cached"] == totals["loaded"] == 24
+    mock_quarantine.assert_called_once()
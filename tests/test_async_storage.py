@@ -0,0 +1,244 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src import async_storage
+
+fakeredis = pytest.importorskip("fakeredis")
+
+USER_ROW = (
+    "123",
+    "John",
+    "Doe",
+    "johndoe",
+    "johndoe@example.com",
+    "1234567890",
+    "42",
+    "1990-01-01",
+    "New York",
+    "Broadway",
+    "123",
+    "10001",
+    "NY",
+    None,
+)
+
+
+@pytest.fixture
+def fake_redis():
+    # Swap the module's Redis client for an in-memory one
+    client = fakeredis.FakeAsyncRedis()
+    with patch("src.async_storage._redis", client), patch.dict(
+        async_storage._cache_stats,
+        {"l1_hits": 0, "hits": 0, "negative_hits": 0, "misses": 0, "coalesced": 0},
+    ):
+        yield client
+
+
+def test_read_through_writes_back_on_miss(fake_redis):
+    # Mock the Postgres lookup
+    with patch("src.async_storage.fetch_user", AsyncMock(return_value=[USER_ROW])):
+        # First lookup misses Redis and loads from Postgres
+        first = asyncio.run(async_storage.get_user_read_through("123"))
+        # Second lookup is answered by Redis
+        second = asyncio.run(async_storage.get_user_read_through("123"))
+
+    # Assert that the rows came from Postgres, then the written-back hash from Redis
+    assert first == [USER_ROW]
+    assert second["first_name"] == "John"
+    assert second["country"] == "n/a"
+    assert asyncio.run(fake_redis.ttl("123")) > 0
+    assert async_storage.get_cache_stats()["misses"] == 1
+    assert async_storage.get_cache_stats()["hits"] == 1
+
+
+def test_read_through_negative_caching(fake_redis):
+    # Mock the Postgres lookup for an unknown uid
+    mock_fetch_user = AsyncMock(return_value=[])
+
+    with patch("src.async_storage.fetch_user", mock_fetch_user):
+        # Look the unknown uid up twice
+        asyncio.run(async_storage.get_user_read_through("999"))
+        result = asyncio.run(async_storage.get_user_read_through("999"))
+
+    # Assert that Postgres was only queried once
+    assert result == []
+    mock_fetch_user.assert_awaited_once_with("999")
+    assert async_storage.get_cache_stats()["negative_hits"] == 1
+
+
+def test_read_through_coalesces_concurrent_misses(fake_redis):
+    # Mock a slow Postgres lookup
+    async def slow_fetch_user(user_id):
+        await asyncio.sleep(0.05)
+        return [USER_ROW]
+
+    mock_fetch_user = AsyncMock(side_effect=slow_fetch_user)
+
+    async def stampede():
+        return await asyncio.gather(
+            *(async_storage.get_user_read_through("123") for _ in range(10))
+        )
+
+    with patch("src.async_storage.fetch_user", mock_fetch_user):
+        results = asyncio.run(stampede())
+
+    # Assert that ten concurrent misses made a single Postgres query
+    assert results == [[USER_ROW]] * 10
+    mock_fetch_user.assert_awaited_once()
+    assert async_storage.get_cache_stats()["coalesced"] == 9
+
+
+@pytest.mark.parametrize("encoding", ["json", "msgpack"])
+def test_reads_detect_the_cache_encoding(fake_redis, encoding):
+    if encoding == "msgpack":
+        pytest.importorskip("msgpack")
+
+    # Cache one user as a hash and write another back with the configured encoding
+    asyncio.run(fake_redis.hset("123", mapping={"first_name": "John"}))
+    with patch("src.async_storage.settings.REDIS_CACHE_ENCODING", encoding), patch(
+        "src.async_storage.fetch_user", AsyncMock(return_value=[USER_ROW])
+    ):
+        asyncio.run(async_storage.get_user_read_through("456"))
+
+        # Read both back, one at a time and in one pipeline
+        single = asyncio.run(async_storage.get_user_read_through("123"))
+        many = asyncio.run(async_storage.get_users_from_redis(["123", "456", "789"]))
+
+    # Assert that the write-back was a single string and both users read back
+    assert asyncio.run(fake_redis.type("456")) == b"string"
+    assert single == {"first_name": "John"}
+    assert many["123"] == {"first_name": "John"}
+    assert many["456"]["first_name"] == "John"
+    assert many["456"]["country"] == "n/a"
+    assert "789" not in many
+
+
+def test_l1_cache_answers_hot_users(fake_redis):
+    # Cache a user in Redis with 60s left to live
+    asyncio.run(fake_redis.hset("123", mapping={"first_name": "John"}))
+    asyncio.run(fake_redis.expire("123", 60))
+    l1 = async_storage._LocalCache(max_entries=10, max_bytes=1024)
+
+    with patch("src.async_storage._l1", l1):
+        # First lookup is answered by Redis, second by the in-process cache
+        asyncio.run(async_storage.get_user_read_through("123"))
+        asyncio.run(fake_redis.delete("123"))
+        result = asyncio.run(async_storage.get_user_read_through("123"))
+        stats = async_storage.get_cache_stats()
+
+    # Assert that the second lookup never reached Redis
+    assert result == {"first_name": "John"}
+    assert stats["l1_hits"] == 1
+    assert stats["hits"] == 1
+    assert stats["l1_hit_ratio"] == 0.5
+    assert stats["l1_entries"] == 1
+
+    # Assert that the entry expires no later than the Redis key did
+    assert l1._entries["123"][0] - async_storage.time.monotonic() <= 60
+
+
+def test_l1_cache_skips_a_read_invalidated_while_pending(fake_redis):
+    # Cache a user in Redis, and hold its read until the invalidation has arrived
+    asyncio.run(fake_redis.hset("123", mapping={"first_name": "John"}))
+    asyncio.run(fake_redis.expire("123", 60))
+    l1 = async_storage._LocalCache(max_entries=10, max_bytes=1024)
+    pipeline = fake_redis.pipeline
+
+    def held_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def execute_then_wait(**execute_kwargs):
+            results = await execute(**execute_kwargs)
+            await invalidated.wait()
+            return results
+
+        pipe.execute = execute_then_wait
+        return pipe
+
+    async def interleave():
+        read = asyncio.create_task(async_storage.get_user_read_through("123"))
+        await asyncio.sleep(0.01)
+        # The pipeline rewrites the user while its old value is on the way back
+        l1.invalidate("123")
+        invalidated.set()
+        return await read
+
+    with patch("src.async_storage._l1", l1), patch.object(
+        fake_redis, "pipeline", held_pipeline
+    ):
+        invalidated = asyncio.Event()
+        result = asyncio.run(interleave())
+
+    # Assert that the value read before the invalidation was not kept in L1
+    assert result == {"first_name": "John"}
+    assert l1.get("123") is None
+
+    # Assert that a read started after the invalidation is kept
+    l1.set("123", result, ttl=60, since=l1.sequence)
+    assert l1.get("123") == {"first_name": "John"}
+
+
+def test_local_cache_forgets_old_invalidations_conservatively():
+    # A cache remembering the invalidations of two uids
+    l1 = async_storage._LocalCache(max_entries=2, max_bytes=1024)
+    sequence = l1.sequence
+
+    # Invalidate three uids, so the first is folded into the floor
+    for uid in ("a", "b", "c"):
+        l1.invalidate(uid)
+
+    # Assert that a read started before them is kept for none of them, even "a"
+    for uid in ("a", "b", "c"):
+        l1.set(uid, {"f": "1"}, ttl=60, since=sequence)
+    assert len(l1) == 0
+
+    # Assert that a clear, as on resubscribing, invalidates every pending read
+    sequence = l1.sequence
+    l1.clear()
+    l1.set("d", {"f": "1"}, ttl=60, since=sequence)
+    assert len(l1) == 0
+
+
+def test_local_cache_evicts_least_recently_used():
+    # A cache holding two entries
+    l1 = async_storage._LocalCache(max_entries=2, max_bytes=1024)
+    l1.set("a", {"f": "1"}, ttl=60)
+    l1.set("b", {"f": "2"}, ttl=60)
+
+    # Touch "a" so "b" becomes the least recently used, then add a third entry
+    l1.get("a")
+    l1.set("c", {"f": "3"}, ttl=60)
+
+    # Assert that "b" was evicted
+    assert l1.get("b") is None
+    assert l1.get("a") == {"f": "1"}
+    assert l1.evictions == 1
+
+
+def test_local_cache_bounded_by_bytes_and_ttl():
+    # A cache of 20 bytes
+    l1 = async_storage._LocalCache(max_entries=10, max_bytes=20)
+
+    # Entries too large for the cache, or already expired, are not kept
+    l1.set("big", {"field": "x" * 50}, ttl=60)
+    l1.set("old", {"f": "1"}, ttl=0)
+
+    # Assert that nothing was kept
+    assert len(l1) == 0
+    assert l1.bytes == 0
+
+
+def test_local_cache_invalidate():
+    # A cache holding one entry
+    l1 = async_storage._LocalCache(max_entries=10, max_bytes=1024)
+    l1.set("123", {"first_name": "John"}, ttl=60)
+
+    # Invalidate it, as the pipeline does when it rewrites the uid
+    l1.invalidate("123")
+
+    # Assert that the entry is gone and the invalidation counted
+    assert l1.get("123") is None
+    assert l1.invalidations == 1
@@ -1,14 +1,17 @@
 from unittest.mock import MagicMock
 
+import pandas as pd
 import pytest
 
-from src.caching import add_user_to_redis
+from src.storage import add_user_to_redis, get_user_from_redis, get_users_from_redis
 
 
 def test_add_user_to_redis(mocker):
     # Mock the Redis client
     redis_mock = mocker.MagicMock()
-    mocker.patch("caching.redis", redis_mock)
+    mocker.patch("src.storage.redis", redis_mock)
+    pipe_mock = redis_mock.pipeline.return_value
+    pipe_mock.__len__.return_value = 2
 
     # Input data
     user_data = [
@@ -37,10 +40,10 @@ def test_add_user_to_redis(mocker):
     ]
 
     # Call the function
-    add_user_to_redis(user_data, user_address_data)
+    result = add_user_to_redis(user_data, user_address_data)
 
-    # Assert that the Redis client methods were called correctly
-    redis_mock.hset.assert_called_once_with(
+    # Assert that the commands were queued on the pipeline and sent in one round-trip
+    pipe_mock.hset.assert_called_once_with(
         "123",
         mapping={
             "password": "password123",
@@ -59,32 +62,65 @@ def test_add_user_to_redis(mocker):
             "country": "USA",
         },
     )
-    redis_mock.expire.assert_called_once_with("123", 120)
-    assert redis_mock.hset.call_count == 1
-    assert redis_mock.expire.call_count == 1
+    pipe_mock.expire.assert_called_once_with("123", 120)
+    pipe_mock.publish.assert_called_once_with("users:invalidate", "123")
+    pipe_mock.execute.assert_called_once()
+    assert redis_mock.hset.call_count == 0
+    assert redis_mock.expire.call_count == 0
+    assert result["keys"] == 1
+    assert len(result["chunk_times"]) == 1
+
+
+def test_add_user_to_redis_accepts_dataframes(mocker):
+    # Mock the Redis client
+    redis_mock = mocker.MagicMock()
+    mocker.patch("src.storage.redis", redis_mock)
+    pipe_mock = redis_mock.pipeline.return_value
+
+    # Input data as columns, with a user and an address field missing
+    user_data = pd.DataFrame({"uid": ["1", "2"], "first_name": ["Ann", "Bob"]})
+    user_address_data = pd.DataFrame({"uid": ["1", "2"], "city": ["Leeds", "York"]})
+
+    # Call the function
+    result = add_user_to_redis(user_data, user_address_data)
+
+    # Assert that each row was cached with the missing fields set to "n/a"
+    assert result["keys"] == 2
+    uid = pipe_mock.hset.call_args_list[1].args[0]
+    mapping = pipe_mock.hset.call_args_list[1].kwargs["mapping"]
+    assert uid == "2"
+    assert mapping["first_name"] == "Bob"
+    assert mapping["city"] == "York"
+    assert mapping["email"] == "n/a"
+    assert len(mapping) == 14
 
 
 def test_add_user_to_redis_empty_data(mocker):
     # Mock the Redis client
     redis_mock = mocker.MagicMock()
-    mocker.patch("caching.redis", redis_mock)
+    mocker.patch("src.storage.redis", redis_mock)
+    pipe_mock = redis_mock.pipeline.return_value
+    pipe_mock.__len__.return_value = 0
 
     # Input data
     user_data = []
     user_address_data = []
 
     # Call the function
-    add_user_to_redis(user_data, user_address_data)
+    result = add_user_to_redis(user_data, user_address_data)
 
-    # Assert that the Redis client methods were not called
-    assert redis_mock.hset.call_count == 0
-    assert redis_mock.expire.call_count == 0
+    # Assert that nothing was sent to Redis
+    assert pipe_mock.hset.call_count == 0
+    assert pipe_mock.execute.call_count == 0
+    assert result == {"keys": 0, "chunk_times": []}
 
 
 def test_add_user_to_redis_invalid_data(mocker):
     # Mock the Redis client
     redis_mock = mocker.MagicMock()
-    mocker.patch("caching.redis", redis_mock)
+    mocker.patch("src.storage.redis", redis_mock)
+    pipe_mock = redis_mock.pipeline.return_value
+    pipe_mock.__len__.return_value = 0
 
     # Input data with missing uid
     user_data = [
@@ -113,3 +149,86 @@ def test_add_user_to_redis_invalid_data(mocker):
     # Call the function and assert that it raises a ValueError
     with pytest.raises(ValueError):
         add_user_to_redis(user_data, user_address_data)
+
+
+def test_add_user_to_redis_chunks_pipeline(mocker):
+    # Mock the Redis client
+    redis_mock = mocker.MagicMock()
+    mocker.patch("src.storage.redis", redis_mock)
+    pipe_mock = redis_mock.pipeline.return_value
+    pipe_mock.__len__.return_value = 2
+
+    # Input data for five users
+    user_data = [{"uid": str(i)} for i in range(5)]
+    user_address_data = [{"uid": str(i)} for i in range(5)]
+
+    # Call the function with a chunk size of two and a transaction per chunk
+    result = add_user_to_redis(
+        user_data, user_address_data, chunk_size=2, transaction=True
+    )
+
+    # Assert that the five users were sent in three round-trips
+    redis_mock.pipeline.assert_called_once_with(transaction=True)
+    assert pipe_mock.execute.call_count == 3
+    assert result["keys"] == 5
+    assert len(result["chunk_times"]) == 3
+
+
+def test_get_user_from_redis_single_round_trip(mocker):
+    # Mock the Redis client
+    redis_mock = mocker.MagicMock()
+    mocker.patch("src.storage.redis", redis_mock)
+    redis_mock.hgetall.return_value = {"first_name": "John"}
+
+    # Call the function
+    result = get_user_from_redis("123")
+
+    # Assert that only HGETALL was sent
+    redis_mock.hgetall.assert_called_once_with("123")
+    assert redis_mock.exists.call_count == 0
+    assert result == {"first_name": "John"}
+
+
+def test_get_user_from_redis_miss(mocker):
+    # Mock the Redis client returning an empty hash for a missing key
+    redis_mock = mocker.MagicMock()
+    mocker.patch("src.storage.redis", redis_mock)
+    redis_mock.hgetall.return_value = {}
+
+    # Call the function and assert that a miss is an empty dict
+    assert get_user_from_redis("123") == {}
+
+
+def test_get_users_from_redis(mocker):
+    # Mock the Redis client, with the second key missing
+    redis_mock = mocker.MagicMock()
+    mocker.patch("src.storage.redis", redis_mock)
+    pipe_mock = redis_mock.pipeline.return_value
+    pipe_mock.execute.return_value = [{"first_name": "John"}, {}]
+
+    # Call the function
+    result = get_users_from_redis(["123", "456"])
+
+    # Assert that both keys were fetched in one pipeline and the miss left out
+    assert pipe_mock.hgetall.call_count == 2
+    pipe_mock.execute.assert_called_once()
+    assert result == {"123": {"first_name": "John"}}
+
+
+@pytest.mark.parametrize(
+    "encoding, transaction", [("hash", True), ("json", False), ("msgpack", False)]
+)
+def test_add_user_to_redis_rewrites_hashes_in_a_transaction(
+    mocker, encoding, transaction
+):
+    # Mock the Redis client
+    redis_mock = mocker.MagicMock()
+    mocker.patch("src.storage.redis", redis_mock)
+
+    # Call the function without asking for a transaction
+    add_user_to_redis(
+        [{"uid": "123"}], [{"uid": "123"}], transaction=False, encoding=encoding
+    )
+
+    # Assert that a hash, written with UNLINK then HSET, is never seen half-written
+    redis_mock.pipeline.assert_called_once_with(transaction=transaction)
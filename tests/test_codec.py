@@ -0,0 +1,50 @@
+import pytest
+
+from src.codec import decode_user, encode_user
+
+USER = {"first_name": "John", "city": "New York", "zip_code": "10001"}
+
+
+@pytest.mark.parametrize("encoding", ["json", "msgpack"])
+@pytest.mark.parametrize("compression", ["none", "zlib"])
+def test_encode_decode_round_trip(encoding, compression):
+    if encoding == "msgpack":
+        pytest.importorskip("msgpack")
+
+    # Call the function
+    blob = encode_user(USER, encoding, compression)
+
+    # Assert that the encoding is detected from the value itself
+    assert isinstance(blob, bytes)
+    assert decode_user(blob) == USER
+
+
+def test_encode_user_stores_values_as_strings():
+    # Input data with a number, as a hash would store it
+    user = {"first_name": "John", "zip_code": 10001}
+
+    # Call the function and decode the result
+    result = decode_user(encode_user(user, "json", "none"))
+
+    # Assert that the number reads back as a string
+    assert result == {"first_name": "John", "zip_code": "10001"}
+
+
+def test_decode_user_hash_and_miss():
+    # A hash as returned by HGETALL without decode_responses, and a missing key
+    raw = {b"first_name": b"John", b"city": "New York".encode()}
+
+    # Assert that the hash is decoded and a miss is an empty dict
+    assert decode_user(raw) == {"first_name": "John", "city": "New York"}
+    assert decode_user(None) == {}
+    assert decode_user({}) == {}
+
+
+def test_codec_rejects_unknown_formats():
+    # Assert that unknown settings and values raise a ValueError
+    with pytest.raises(ValueError):
+        encode_user(USER, "pickle", "none")
+    with pytest.raises(ValueError):
+        encode_user(USER, "json", "lz4")
+    with pytest.raises(ValueError):
+        decode_user(b"plain text")
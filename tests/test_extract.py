@@ -0,0 +1,134 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from requests.exceptions import HTTPError
+
+from src.extract import fetch_page, iter_pages
+
+
+class MockUserAPI(BaseHTTPRequestHandler):
+    # Status codes to answer with before serving users, shared by all requests
+    failures: list = []
+    requests_seen: list = []
+
+    def do_GET(self):
+        size = int(parse_qs(urlparse(self.path).query)["size"][0])
+        self.requests_seen.append(size)
+
+        if self.failures:
+            self.send_response(self.failures.pop(0))
+            self.end_headers()
+            return
+
+        body = json.dumps([{"uid": str(i)} for i in range(size)]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_url():
+    # Serve the mock API on a free local port
+    MockUserAPI.failures = []
+    MockUserAPI.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockUserAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with patch("src.extract.settings.EXTRACT_BACKOFF_BASE", 0.001):
+        yield f"http://127.0.0.1:{server.server_port}/api/v2/users"
+
+    server.shutdown()
+
+
+def test_iter_pages_splits_run_into_pages_and_records_metrics(api_url):
+    # Call the function for 250 users in pages of 100, the first page retried once
+    MockUserAPI.failures = [503]
+    metrics = {}
+    pages = list(
+        iter_pages(target_users=250, page_size=100, url=api_url, metrics=metrics)
+    )
+
+    # Assert that, besides the failed attempt, three pages were requested and every
+    # user returned
+    assert sorted(MockUserAPI.requests_seen[1:]) == [50, 100, 100]
+    assert sum(len(page) for page in pages) == 250
+
+    # Assert that each page's latency and the run's throughput were recorded
+    assert metrics["pages"] == 3
+    assert metrics["users"] == 250
+    assert metrics["retries"] == 1
+    assert len(metrics["latencies"]) == 3
+    assert 0 < metrics["latency_p50"] <= metrics["latency_max"]
+    assert metrics["users_per_sec"] > 0
+
+
+def test_fetch_page_retries_rate_limits_and_server_errors(api_url):
+    # The API rate limits, then fails, then answers
+    MockUserAPI.failures = [429, 503]
+
+    # Call the function
+    users, metrics = fetch_page(5, url=api_url)
+
+    # Assert that the page was retried until it succeeded
+    assert len(users) == 5
+    assert metrics["retries"] == 2
+
+
+def test_fetch_page_gives_up_after_max_retries(api_url):
+    # The API keeps failing
+    MockUserAPI.failures = [500] * 10
+
+    # Call the function and assert that it raises an HTTPError
+    with pytest.raises(HTTPError):
+        fetch_page(5, url=api_url, max_retries=2)
+
+    # Assert that it tried once and retried twice
+    assert len(MockUserAPI.requests_seen) == 3
+
+
+def test_fetch_page_does_not_retry_client_errors(api_url):
+    # The API rejects the request
+    MockUserAPI.failures = [404]
+
+    # Call the function and assert that it raises an HTTPError at once
+    with pytest.raises(HTTPError):
+        fetch_page(5, url=api_url)
+
+    assert len(MockUserAPI.requests_seen) == 1
+
+
+def test_iter_pages_fetches_ahead_only_up_to_concurrency(api_url):
+    # Pull the first page of five, with two requests allowed in flight
+    pages = iter_pages(target_users=5, page_size=1, concurrency=2, url=api_url)
+    first = next(pages)
+
+    # Assert that only the first page and the ones allowed ahead were requested
+    assert len(first) == 1
+    assert len(MockUserAPI.requests_seen) <= 3
+
+    # Assert that the rest of the run still arrives
+    assert sum(len(page) for page in pages) == 4
+
+
+def test_iter_pages_records_metrics_when_the_consumer_stops_early(api_url):
+    # Pull one page of five, then stop
+    metrics = {}
+    pages = iter_pages(
+        target_users=5, page_size=1, concurrency=2, url=api_url, metrics=metrics
+    )
+    next(pages)
+    pages.close()
+
+    # Assert that the metrics cover the page handed over
+    assert metrics["pages"] == 1
+    assert metrics["users"] == 1
+    assert metrics["elapsed"] > 0
@@ -0,0 +1,63 @@
+from benchmarks.synthetic import fake_api_users
+from src.fingerprint import classify, fingerprint_frames
+from src.main import clean_records, extract_frames
+
+
+def frames(data):
+    return extract_frames(clean_records(data))
+
+
+def test_fingerprint_frames_is_stable():
+    # Input data
+    users, addresses = frames(fake_api_users(3))
+
+    # Call the function twice
+    first = fingerprint_frames(users, addresses)
+    second = fingerprint_frames(users.copy(), addresses.copy())
+
+    # Assert that the same content gives the same 64-bit fingerprints
+    assert first == second
+    assert len(set(first)) == 3
+    assert all(-(2**63) <= fingerprint < 2**63 for fingerprint in first)
+
+
+def test_fingerprint_frames_detects_address_changes():
+    # Input data: the same user before and after moving
+    data = fake_api_users(1)
+    before = fingerprint_frames(*frames(data))
+    data[0]["address"]["city"] = "Elsewhere"
+
+    # Call the function
+    after = fingerprint_frames(*frames(data))
+
+    # Assert that the fingerprint changed
+    assert before != after
+
+
+def test_fingerprint_frames_covers_sin_in_keyed_mode_only():
+    # Input data: the same user with another social insurance number
+    users, addresses = frames(fake_api_users(1))
+    other = users.copy()
+    other["social_insurance_number"] = "another-hash"
+
+    # Assert that salted hashes are ignored but keyed hashes are compared
+    assert fingerprint_frames(users, addresses, "salted") == fingerprint_frames(
+        other, addresses, "salted"
+    )
+    assert fingerprint_frames(users, addresses, "keyed") != fingerprint_frames(
+        other, addresses, "keyed"
+    )
+
+
+def test_classify_counts_new_changed_and_unchanged():
+    # Input data
+    uids = ["a", "b", "c"]
+    fingerprints = [1, 2, 3]
+    stored = {"b": 2, "c": 4}
+
+    # Call the function
+    write, counts = classify(uids, fingerprints, stored)
+
+    # Assert that only the unchanged user is skipped
+    assert write == [True, False, True]
+    assert counts == {"new": 1, "changed": 1, "unchanged": 1}
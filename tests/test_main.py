@@ -0,0 +1,347 @@
+import json
+from unittest.mock import patch
+
+import psycopg2
+from redis import RedisError
+
+from benchmarks.synthetic import fake_api_users
+from src.spool import Spool
+from src.main import (
+    clean_records,
+    data_clean_up,
+    drain_spool,
+    extract_address_data_for_storage,
+    extract_frames,
+    extract_user_data_for_storage,
+    iter_chunks,
+    main,
+    pipeline_stages,
+    process_batch,
+    run_streaming,
+    store_chunk,
+    transform_chunk,
+)
+from src.fingerprint import fingerprint_frames
+
+
+def test_clean_records_matches_dataframe_round_trip():
+    # Input data shaped like the API response
+    data = fake_api_users(5)
+
+    # Expected output: the previous DataFrame -> JSON -> dict transform
+    expected_output = json.loads(data_clean_up(data).to_json(orient="records"))
+
+    # Assert that the projection gives the same records
+    assert clean_records(data) == expected_output
+
+
+def test_extract_frames_matches_per_row_extraction():
+    # Input data with a missing field and a missing address
+    data = clean_records(fake_api_users(3))
+    del data[1]["email"]
+    del data[2]["address"]
+
+    # Call the function
+    users, addresses = extract_frames(data)
+
+    # Assert that the frames hold the same rows as the per-row helpers, apart from
+    # the salted SIN hash, which differs on every call
+    expected_users = extract_user_data_for_storage(data)
+    for row, expected in zip(users.to_dict("records"), expected_users):
+        assert row.pop("social_insurance_number").isdigit()
+        expected.pop("social_insurance_number")
+        assert row == expected
+    assert addresses.to_dict("records") == extract_address_data_for_storage(data)
+    assert users.loc[1, "email"] == "n/a"
+    assert addresses.loc[2, "city"] == "n/a"
+
+
+def test_iter_chunks_regroups_pages():
+    # Pages of uneven size
+    pages = [[1, 2, 3], [4], [5, 6, 7, 8]]
+
+    # Regroup them into chunks of three
+    chunks = list(iter_chunks(pages, 3))
+
+    # Assert that every chunk but the last is full
+    assert chunks == [[1, 2, 3], [4, 5, 6], [7, 8]]
+
+
+def test_run_streaming_pulls_pages_lazily():
+    # Track how many pages the pipeline has pulled
+    pulled = []
+
+    def pages():
+        for i in range(4):
+            pulled.append(i)
+            yield [{"uid": f"{i}-{j}"} for j in range(2)]
+
+    # Record how many pages had been pulled when each chunk was processed
+    seen = []
+
+    def mock_process_batch(chunk):
+        seen.append(len(pulled))
+        return {
+            "users": len(chunk),
+            "rejected": 0,
+            "cached": len(chunk),
+            "loaded": 0,
+            "skipped": False,
+            "new": 0,
+            "changed": 0,
+            "unchanged": 0,
+        }
+
+    # Call the function with chunks of two users
+    with patch("src.main.process_batch", mock_process_batch):
+        totals = run_streaming(pages(), chunk_size=2)
+
+    # Assert that each chunk was processed before the next page was fetched
+    assert seen == [1, 2, 3, 4]
+    assert totals["chunks"] == 4
+    assert totals["users"] == 8
+    assert totals["cached"] == 8
+
+
+@patch("src.main.run_streaming")
+@patch("src.main.iter_pages")
+def test_pipeline_stages_split_extract_from_load(mock_pages, mock_streaming):
+    # Pages of users from the API
+    mock_pages.side_effect = lambda: iter([[1, 2], [3]])
+    mock_streaming.return_value = {
+        "users": 3,
+        "chunks": 1,
+        "skipped": 0,
+        "rejected": 0,
+        "users_per_sec": 3.0,
+    }
+
+    # Call the function with two runs in flight
+    (extract_name, extract), (load_name, load) = pipeline_stages(max_in_flight=2)
+    pages = extract()
+    load(pages)
+
+    # Assert that the extract stage fetched every page and the load stage loaded them
+    assert (extract_name, load_name) == ("extract", "load")
+    assert pages == [[1, 2], [3]]
+    assert mock_streaming.call_args.args[0] == [[1, 2], [3]]
+
+    # With one run in flight, a single stage streams the pages as it loads them
+    assert [name for name, _ in pipeline_stages(max_in_flight=1)] == ["run"]
+
+
+@patch("src.main.quarantine_rows")
+@patch("src.main.add_user_to_redis")
+@patch("src.main.load_users_bulk")
+def test_process_batch_skips_invalid_chunk(mock_load, mock_redis, mock_quarantine):
+    # Input data that fails validation
+    data = [{"uid": "not-a-uuid"}]
+
+    # Call the function
+    stats = process_batch(data)
+
+    # Assert that the chunk was quarantined and nothing was loaded
+    assert stats["skipped"] is True
+    assert stats["rejected"] == 1
+    mock_quarantine.assert_called_once()
+    mock_redis.assert_not_called()
+    mock_load.assert_not_called()
+
+
+@patch("src.main.quarantine_rows")
+@patch("src.main.add_user_to_redis")
+@patch("src.main.load_users_bulk")
+def test_process_batch_loads_valid_users_of_noisy_chunk(
+    mock_load, mock_redis, mock_quarantine
+):
+    # Input data with one malformed user among valid ones
+    data = fake_api_users(4)
+    data[2]["email"] = None
+    mock_redis.return_value = {"keys": 3, "chunk_times": [0.0]}
+    mock_load.return_value = {
+        "users": {"inserted": 3, "updated": 0, "skipped": 0},
+        "users_address": {"inserted": 3, "updated": 0, "skipped": 0},
+    }
+
+    # Call the function
+    stats = process_batch(data)
+
+    # Assert that only the malformed user was quarantined and the rest were loaded
+    (rejected,), _ = mock_quarantine.call_args
+    assert [r["uid"] for r in rejected] == [data[2]["uid"]]
+    users, _ = mock_load.call_args.args
+    assert users["uid"].tolist() == [data[i]["uid"] for i in (0, 1, 3)]
+    assert stats == {
+        "users": 4,
+        "rejected": 1,
+        "cached": 3,
+        "loaded": 3,
+        "skipped": False,
+        "new": 0,
+        "changed": 0,
+        "unchanged": 0,
+    }
+
+
+@patch("src.main.add_user_to_redis")
+@patch("src.main.load_users_bulk")
+def test_drain_spool_replays_chunks_after_an_outage(mock_load, mock_redis, tmp_path):
+    # Input data: a chunk spooled while Postgres is down
+    spool = Spool(str(tmp_path / "spool.sqlite3"))
+    spool.append([fake_api_users(2)])
+    mock_redis.return_value = {"keys": 2, "chunk_times": [0.0]}
+    mock_load.side_effect = psycopg2.OperationalError("connection refused")
+
+    # Call the function during the outage, then once Postgres is back
+    during = drain_spool(spool)
+    mock_load.side_effect = None
+    mock_load.return_value = {
+        "users": {"inserted": 2, "updated": 0, "skipped": 0},
+        "users_address": {"inserted": 2, "updated": 0, "skipped": 0},
+    }
+    after = drain_spool(spool)
+    spool.close()
+
+    # Assert that the chunk stayed in the spool and was loaded on the next drain
+    assert during["batches"] == 0
+    assert during["pending"]["users"] == 2
+    assert after["loaded"] == 2
+    assert after["pending"]["batches"] == 0
+
+
+@patch("src.main.settings.INCREMENTAL", True)
+@patch("src.main.get_fingerprints")
+def test_transform_chunk_drops_unchanged_users(mock_get_fingerprints):
+    # Input data: one user unchanged since their last write, one changed, one new
+    data = fake_api_users(3)
+    users, addresses = extract_frames(clean_records(data))
+    fingerprints = fingerprint_frames(users, addresses)
+    mock_get_fingerprints.return_value = {
+        data[0]["uid"]: fingerprints[0],
+        data[1]["uid"]: fingerprints[1] + 1,
+    }
+
+    # Call the function
+    chunk = transform_chunk(data)
+
+    # Assert that only the changed and new users are left to write
+    users, addresses = chunk["frames"]
+    assert users["uid"].tolist() == [data[1]["uid"], data[2]["uid"]]
+    assert addresses["uid"].tolist() == [data[1]["uid"], data[2]["uid"]]
+    assert chunk["fingerprints"] == {
+        data[1]["uid"]: fingerprints[1],
+        data[2]["uid"]: fingerprints[2],
+    }
+    assert chunk["changes"] == {"new": 1, "changed": 1, "unchanged": 1}
+
+
+@patch("src.main.settings.INCREMENTAL", True)
+@patch("src.main.get_fingerprints")
+def test_transform_chunk_skips_chunk_without_changes(mock_get_fingerprints):
+    # Input data: every user unchanged
+    data = fake_api_users(2)
+    users, addresses = extract_frames(clean_records(data))
+    mock_get_fingerprints.return_value = dict(
+        zip(users["uid"], fingerprint_frames(users, addresses))
+    )
+
+    # Call the function
+    chunk = transform_chunk(data)
+
+    # Assert that nothing is left to write
+    assert chunk["frames"] is None
+    assert chunk["changes"] == {"new": 0, "changed": 0, "unchanged": 2}
+
+
+@patch("src.main.save_fingerprints")
+@patch("src.main.load_users_bulk")
+def test_store_chunk_saves_fingerprints_after_the_load(mock_load, mock_save):
+    # Input data
+    users, addresses = extract_frames(clean_records(fake_api_users(1)))
+    chunk = {
+        "users": 1,
+        "rejected": [],
+        "frames": (users, addresses),
+        "fingerprints": {"uid": 1},
+    }
+    mock_load.return_value = {
+        "users": {"inserted": 1, "updated": 0, "skipped": 0},
+        "users_address": {"inserted": 1, "updated": 0, "skipped": 0},
+    }
+    mock_save.side_effect = RedisError("down")
+
+    # Call the function, then again while Postgres is down
+    loaded = store_chunk(chunk)
+    mock_load.side_effect = psycopg2.OperationalError("connection refused")
+    failed = store_chunk(chunk)
+
+    # Assert that fingerprints are only saved once the users are stored, and that
+    # failing to save them does not fail the load
+    assert loaded == 1
+    assert failed == 0
+    mock_save.assert_called_once_with({"uid": 1})
+
+
+@patch("src.main.close_executors")
+@patch("src.main.close_executor")
+@patch("src.main.Scheduler")
+@patch("src.main.migrate")
+def test_main_migrates_once_before_the_runs(
+    mock_migrate, mock_scheduler, mock_close_executor, mock_close_executors
+):
+    # Mock the scheduler, recording when the runs start
+    calls = []
+
+    def run(max_runs):
+        calls.append("runs")
+        return {
+            "finished": 3,
+            "failed": 0,
+            "missed": 0,
+            "duration_mean": 1.0,
+            "lag_max": 0.0,
+        }
+
+    mock_migrate.side_effect = lambda: calls.append("migrate")
+    mock_scheduler.return_value.run.side_effect = run
+
+    # Call the function
+    main()
+
+    # Assert that the schema was migrated once, before any run started
+    assert calls == ["migrate", "runs"]
+
+    # Assert that the worker pools of the runs and of PII hashing were shut down
+    mock_close_executor.assert_called_once()
+    mock_close_executors.assert_called_once()
+
+
+@patch("src.main.quarantine_rows")
+@patch("src.main.add_user_to_redis")
+@patch("src.main.load_users_bulk")
+def test_drain_spool_quarantines_a_retried_chunk_once(
+    mock_load, mock_redis, mock_quarantine, tmp_path
+):
+    # Input data: a chunk with one invalid user, whose load fails once
+    spool = Spool(str(tmp_path / "spool.sqlite3"))
+    data = fake_api_users(2)
+    data[1]["email"] = None
+    spool.append([data])
+    mock_redis.return_value = {"keys": 1, "chunk_times": [0.0]}
+    mock_quarantine.return_value = 1
+    mock_load.side_effect = [
+        psycopg2.OperationalError("connection refused"),
+        {
+            "users": {"inserted": 1, "updated": 0, "skipped": 0},
+            "users_address": {"inserted": 1, "updated": 0, "skipped": 0},
+        },
+    ]
+
+    # Call the function during the outage, then once Postgres is back
+    drain_spool(spool)
+    after = drain_spool(spool)
+    spool.close()
+
+    # Assert that the invalid user was quarantined on the first attempt only
+    mock_quarantine.assert_called_once()
+    assert after["loaded"] == 1
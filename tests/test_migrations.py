@@ -0,0 +1,100 @@
+from unittest.mock import patch
+
+import psycopg2
+import pytest
+
+from src.migrations import MIGRATIONS, migrate, schema_version
+
+# Migrations of a test schema
+TEST_MIGRATIONS = (
+    (1, "first", "CREATE TABLE a ();"),
+    (2, "second", "CREATE TABLE b ();"),
+    (3, "third", "CREATE TABLE c ();"),
+)
+
+
+def cursor_of(mock_get_connection):
+    return (
+        mock_get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+    )
+
+
+def executed(mock_cursor) -> list:
+    return [c.args[0] for c in mock_cursor.execute.call_args_list]
+
+
+@patch("src.migrations.get_connection")
+def test_migrate_applies_pending_migrations_in_order(mock_get_connection):
+    # Mock a database where the first migration is already applied
+    mock_cursor = cursor_of(mock_get_connection)
+    mock_cursor.fetchone.side_effect = [(1,), None, None]
+
+    # Call the function
+    applied = migrate(migrations=TEST_MIGRATIONS)
+
+    # Assert that only the pending migrations ran, each recorded under the lock
+    assert applied == [2, 3]
+    sql = executed(mock_cursor)
+    assert "CREATE TABLE a ();" not in sql
+    assert sql.index("CREATE TABLE b ();") < sql.index("CREATE TABLE c ();")
+    recorded = [
+        c.args[1]
+        for c in mock_cursor.execute.call_args_list
+        if "INSERT INTO schema_migrations" in c.args[0]
+    ]
+    assert recorded == [(2, "second"), (3, "third")]
+    assert sum("pg_advisory_xact_lock" in s for s in sql) == 4
+
+
+@patch("src.migrations.get_connection")
+def test_migrate_stops_at_target(mock_get_connection):
+    # Mock an empty database
+    mock_cursor = cursor_of(mock_get_connection)
+    mock_cursor.fetchone.return_value = None
+
+    # Call the function
+    applied = migrate(target=2, migrations=TEST_MIGRATIONS)
+
+    # Assert that the migrations after the target were left for later
+    assert applied == [1, 2]
+    assert "CREATE TABLE c ();" not in executed(mock_cursor)
+
+
+@patch("src.migrations.get_connection")
+def test_migrate_stops_at_a_failed_migration(mock_get_connection):
+    # Mock an empty database where the second migration fails
+    mock_cursor = cursor_of(mock_get_connection)
+    mock_cursor.fetchone.return_value = None
+
+    def execute(sql, *args):
+        if sql == "CREATE TABLE b ();":
+            raise psycopg2.ProgrammingError("syntax error")
+
+    mock_cursor.execute.side_effect = execute
+
+    # Call the function and assert that the error is raised
+    with pytest.raises(psycopg2.ProgrammingError):
+        migrate(migrations=TEST_MIGRATIONS)
+
+    # Assert that the migrations after it were not attempted
+    assert "CREATE TABLE c ();" not in executed(mock_cursor)
+
+
+def test_migrate_rejects_unordered_versions():
+    with pytest.raises(ValueError):
+        migrate(migrations=TEST_MIGRATIONS[::-1])
+
+
+@patch("src.migrations.get_connection")
+def test_schema_version_of_an_empty_database(mock_get_connection):
+    # Mock a database without the schema_migrations table
+    cursor_of(mock_get_connection).fetchone.return_value = (False,)
+
+    # Call the function and assert that nothing is applied
+    assert schema_version() == 0
+
+
+def test_migrations_are_numbered_from_one():
+    assert [version for version, _, _ in MIGRATIONS] == list(
+        range(1, len(MIGRATIONS) + 1)
+    )
@@ -0,0 +1,156 @@
+import os
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+import pytest
+
+from src.parallel import close_executor, partition_sizes, run_parallel
+
+# Partitions and stages are module-level so spawned workers can import them
+
+
+def numbered_pages(size: int) -> list:
+    return [[{"uid": str(i)} for i in range(size)]]
+
+
+def count_users(pages) -> dict:
+    users = sum(len(page) for page in pages)
+    return {
+        "chunks": 1,
+        "skipped": 0,
+        "users": users,
+        "rejected": 0,
+        "cached": users,
+        "loaded": users,
+    }
+
+
+def flaky_pages(partition: tuple) -> list:
+    """Fail the first attempt of a partition marked "flaky", always fail "broken"
+    and kill the worker on the first attempt of "crash"."""
+    size, kind, marker = partition
+    if kind == "broken":
+        raise ConnectionError("Postgres is down")
+    if kind in ("flaky", "crash") and not os.path.exists(marker):
+        open(marker, "w").close()
+        if kind == "crash":
+            os._exit(1)
+        raise ConnectionError("Connection reset")
+    return numbered_pages(size)
+
+
+@pytest.fixture
+def workers():
+    yield 2
+    close_executor()
+
+
+def test_partition_sizes():
+    # Assert that users are split as evenly as possible, without empty partitions
+    assert partition_sizes(10, 3) == [4, 3, 3]
+    assert partition_sizes(2, 4) == [1, 1]
+    with pytest.raises(ValueError):
+        partition_sizes(0, 2)
+
+
+def test_run_parallel_aggregates_partition_stats(workers):
+    # Call the function with three partitions across two worker processes
+    totals = run_parallel([3, 5, 2], count_users, numbered_pages, workers=workers)
+
+    # Assert that the stats of every partition were summed and kept in order
+    assert totals["users"] == 10
+    assert totals["loaded"] == 10
+    assert totals["chunks"] == 3
+    assert totals["failed"] == {}
+    assert [stats["partition"] for stats in totals["per_partition"]] == [0, 1, 2]
+    assert [stats["users"] for stats in totals["per_partition"]] == [3, 5, 2]
+    assert all(stats["worker"] != os.getpid() for stats in totals["per_partition"])
+
+
+def test_run_parallel_inline_with_one_worker():
+    # Call the function with a single worker, which needs no picklable callables
+    totals = run_parallel([1, 2], count_users, lambda size: [[{}] * size], workers=1)
+
+    # Assert that the partitions ran in this process
+    assert totals["users"] == 3
+    assert {stats["worker"] for stats in totals["per_partition"]} == {os.getpid()}
+
+
+@pytest.mark.parametrize("workers_count", [1, 2])
+def test_run_parallel_retries_failed_partitions(tmp_path, workers_count):
+    # Input data: a healthy, a flaky and a permanently broken partition
+    partitions = [
+        (2, "ok", None),
+        (3, "flaky", str(tmp_path / "flaky")),
+        (4, "broken", None),
+    ]
+
+    # Call the function
+    try:
+        totals = run_parallel(
+            partitions, count_users, flaky_pages, workers=workers_count, retries=1
+        )
+    finally:
+        close_executor()
+
+    # Assert that the flaky partition was retried and the broken one reported,
+    # without losing the work of the others
+    assert totals["users"] == 5
+    assert [stats["partition"] for stats in totals["per_partition"]] == [0, 1]
+    assert list(totals["failed"]) == [2]
+    assert "Postgres is down" in totals["failed"][2]
+
+
+def test_run_parallel_survives_a_dead_worker(tmp_path, workers):
+    # Input data: a partition whose worker dies on its first attempt
+    partitions = [(2, "ok", None), (3, "crash", str(tmp_path / "crash"))]
+
+    # Call the function
+    totals = run_parallel(partitions, count_users, flaky_pages, workers=workers)
+
+    # Assert that the pool was replaced and every partition was processed
+    assert totals["users"] == 5
+    assert totals["failed"] == {}
+
+
+class BreaksOnce:
+    """Executor failing the first submission of each partition as if a worker died."""
+
+    def __init__(self):
+        self.partitions = set()
+
+    def submit(self, fn, index, *args):
+        future = Future()
+        if index in self.partitions:
+            future.set_result(fn(index, *args))
+        else:
+            self.partitions.add(index)
+            future.set_exception(BrokenProcessPool("A worker died"))
+        return future
+
+
+def test_run_parallel_charges_one_partition_per_dead_worker():
+    # Input data: three partitions, all left unfinished by one dead worker
+    executor = BreaksOnce()
+
+    # Call the function without retries
+    with patch("src.parallel._get_executor", return_value=executor):
+        totals = run_parallel(
+            [1, 2, 3], count_users, numbered_pages, workers=2, retries=0
+        )
+
+    # Assert that only one partition was charged for the dead worker, and the
+    # others were processed on the next pool
+    assert len(totals["failed"]) == 1
+    assert "BrokenProcessPool" in next(iter(totals["failed"].values()))
+    assert len(totals["per_partition"]) == 2
+
+
+def test_run_parallel_rejects_invalid_arguments():
+    # Assert that invalid arguments raise a ValueError
+    with pytest.raises(ValueError):
+        run_parallel([1], count_users, numbered_pages, workers=0)
+    with pytest.raises(ValueError):
+        run_parallel([1], count_users, numbered_pages, retries=-1)
+
@@ -1,6 +1,9 @@
+import random
+
+import pandas as pd
 import pytest
 
-from src.salt import hash_pii
+from src.salt import close_executors, hash_pii, hash_pii_batch
 
 
 def test_hash_pii_valid_input():
@@ -31,3 +34,85 @@ def test_hash_pii_invalid_input():
     # Call the function and assert that it raises a ValueError
     with pytest.raises(ValueError):
         hash_pii(pii)
+
+
+def test_hash_pii_batch_matches_hash_pii():
+    # Input data as a column
+    values = pd.Series([f"{i:09d}" for i in range(25)])
+
+    # Expected output: one hash_pii call per value from the same random state
+    random.seed(7)
+    expected_output = [hash_pii(value) for value in values]
+
+    # Call the function in chunks, in the calling thread
+    random.seed(7)
+    result = hash_pii_batch(values, workers=1, chunk_size=10)
+
+    # Assert that the salts and hashes are the same
+    assert result == expected_output
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_hash_pii_batch_in_pool(executor):
+    # Input data spread over several chunks
+    values = [f"{i:09d}" for i in range(100)]
+
+    # Call the function with a pool of two workers
+    try:
+        result = hash_pii_batch(values, workers=2, chunk_size=10, executor=executor)
+    finally:
+        close_executors()
+
+    # Assert that every value was hashed, and salted hashes do not repeat
+    assert len(result) == 100
+    assert all(hashed.isdigit() for hashed in result)
+    assert len(set(result)) == 100
+
+
+def test_hash_pii_batch_invalid_value():
+    # Input data with an empty value in the second chunk
+    values = ["123456789", "987654321", ""]
+
+    # Call the function and assert that it raises a ValueError
+    with pytest.raises(ValueError):
+        hash_pii_batch(values, workers=2, chunk_size=2, executor="thread")
+    close_executors()
+
+
+def test_hash_pii_keyed_is_deterministic():
+    # Input data
+    pii = "123-45-6789"
+
+    # Call the function twice with one key and once with another
+    first = hash_pii(pii, mode="keyed", key="secret")
+    second = hash_pii(pii, mode="keyed", key="secret")
+    other_key = hash_pii(pii, mode="keyed", key="another secret")
+
+    # Assert that the same key gives the same hash, and another key a different one
+    assert first == second
+    assert first != other_key
+    assert len(first) == 32
+
+
+def test_hash_pii_keyed_requires_key():
+    # Call the function in keyed mode without a key and assert that it raises
+    with pytest.raises(ValueError):
+        hash_pii("123-45-6789", mode="keyed", key="")
+
+
+def test_hash_pii_invalid_mode():
+    # Call the function with an unknown mode and assert that it raises a ValueError
+    with pytest.raises(ValueError):
+        hash_pii("123-45-6789", mode="plain")
+
+
+def test_hash_pii_batch_keyed_matches_hash_pii():
+    # Input data with a repeated value
+    values = ["111111111", "222222222", "111111111"]
+
+    # Call the function in keyed mode
+    result = hash_pii_batch(values, workers=1, mode="keyed", key="secret")
+
+    # Assert that each value hashes as it does alone, so repeats can be deduplicated
+    assert result == [hash_pii(v, mode="keyed", key="secret") for v in values]
+    assert result[0] == result[2]
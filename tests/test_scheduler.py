@@ -0,0 +1,190 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from src.scheduler import Cron, FakeClock, FixedRate, Scheduler
+
+
+def sleeping_stage(clock, seconds, events=None, name=None):
+    """A stage that takes `seconds` of virtual time, recording when it ran."""
+
+    def stage(*_):
+        start = clock.now()
+        clock.sleep(seconds)
+        if events is not None:
+            events.append((name, start, clock.now()))
+        return name
+
+    return stage
+
+
+def test_fixed_rate_runs_on_schedule_without_sleeping():
+    # Runs taking 10s every 120s, on virtual time
+    clock = FakeClock()
+    scheduler = Scheduler(
+        [("run", sleeping_stage(clock, 10))], FixedRate(120), clock=clock
+    )
+
+    # Call the function
+    start = time.perf_counter()
+    metrics = scheduler.run(max_runs=3)
+
+    # Assert that runs started when due, with no lag, and no real time passed
+    assert [r["scheduled"] for r in scheduler.history] == [0, 120, 240]
+    assert [r["started"] for r in scheduler.history] == [0, 120, 240]
+    assert [r["duration"] for r in scheduler.history] == [10, 10, 10]
+    assert clock.now() == 250
+    assert metrics["finished"] == 3
+    assert metrics["lag_max"] == 0
+    assert time.perf_counter() - start < 1
+
+
+@pytest.mark.parametrize(
+    "catch_up, expected_scheduled, expected_started, expected_missed",
+    [
+        ("all", [0, 100, 200], [0, 250, 500], 0),
+        ("latest", [0, 200, 500], [0, 250, 500], 3),
+    ],
+)
+def test_catch_up_of_missed_runs(
+    catch_up, expected_scheduled, expected_started, expected_missed
+):
+    # Runs taking 250s every 100s, one at a time
+    clock = FakeClock()
+    scheduler = Scheduler(
+        [("run", sleeping_stage(clock, 250))],
+        FixedRate(100),
+        max_in_flight=1,
+        catch_up=catch_up,
+        clock=clock,
+    )
+
+    # Call the function
+    metrics = scheduler.run(max_runs=3)
+
+    # Assert that missed runs were all run late, or coalesced into the latest one
+    assert [r["scheduled"] for r in scheduler.history] == expected_scheduled
+    assert [r["started"] for r in scheduler.history] == expected_started
+    assert metrics["missed"] == expected_missed
+    assert metrics["lag_last"] == expected_started[-1] - expected_scheduled[-1]
+
+
+def test_extract_overlaps_load_of_previous_run():
+    # Extracts of 30s and loads of 100s every 60s, two runs in flight
+    clock = FakeClock()
+    events = []
+    scheduler = Scheduler(
+        [
+            ("extract", sleeping_stage(clock, 30, events, "extract")),
+            ("load", sleeping_stage(clock, 100, events, "load")),
+        ],
+        FixedRate(60),
+        max_in_flight=2,
+        clock=clock,
+    )
+
+    # Call the function
+    scheduler.run(max_runs=3)
+
+    # Assert that each run extracted while the one before it loaded, that loads ran
+    # one at a time in order, and that the third run waited for a free slot
+    assert sorted(events, key=lambda e: (e[1], e[0])) == [
+        ("extract", 0, 30),
+        ("load", 30, 130),
+        ("extract", 60, 90),
+        ("extract", 130, 160),
+        ("load", 130, 230),
+        ("load", 230, 330),
+    ]
+    assert [r["lag"] for r in scheduler.history] == [0, 0, 10]
+    assert [r["stages"] for r in scheduler.history][0] == {"extract": 30, "load": 100}
+    assert scheduler.history[2]["duration"] == 200
+
+
+def test_failed_run_does_not_stop_the_schedule():
+    # A run whose first stage fails once
+    clock = FakeClock()
+    calls = []
+
+    def extract():
+        calls.append(clock.now())
+        if len(calls) == 1:
+            raise ConnectionError("API down")
+        return [1, 2]
+
+    scheduler = Scheduler(
+        [("extract", extract), ("load", len)], FixedRate(60), clock=clock
+    )
+
+    # Call the function
+    metrics = scheduler.run(max_runs=2)
+
+    # Assert that the failure is recorded and the next run still loads
+    assert scheduler.history[0]["error"].startswith("extract: ConnectionError")
+    assert "load" not in scheduler.history[0]["stages"]
+    assert scheduler.history[1]["result"] == 2
+    assert metrics["failed"] == 1
+    assert metrics["finished"] == 2
+
+
+def test_stop_ends_an_unbounded_schedule():
+    # A schedule without a run limit, on a fake clock moved forward by the test
+    clock = FakeClock()
+    clock.enter()
+    scheduler = Scheduler([("run", lambda: None)], FixedRate(60), clock=clock)
+    runner = threading.Thread(target=scheduler.run)
+    runner.start()
+
+    # Let a few runs fall due, then stop
+    for _ in range(3):
+        clock.advance(60)
+    scheduler.stop()
+    clock.leave()
+    runner.join(timeout=5)
+
+    # Assert that the scheduler returned and no run was left in flight
+    assert not runner.is_alive()
+    assert scheduler.metrics()["in_flight"] == 0
+    assert 1 <= scheduler.metrics()["started"] <= 4
+
+
+def test_cron_next_fire_time():
+    # Every 15 minutes during office hours on weekdays
+    cron = Cron("*/15 9-17 * * 1-5")
+
+    # Friday 2024-01-05 17:50 UTC
+    friday = datetime(2024, 1, 5, 17, 50, tzinfo=timezone.utc).timestamp()
+
+    # Assert that the next fire time is Monday 09:00, then 09:15
+    monday = cron.next_after(friday)
+    assert monday == datetime(2024, 1, 8, 9, 0, tzinfo=timezone.utc).timestamp()
+    assert cron.next_after(monday) == monday + 15 * 60
+
+
+def test_cron_either_day_field_matches():
+    # The 1st of the month or any Sunday, at midnight
+    cron = Cron("0 0 1 * 0")
+
+    # Tuesday 2024-01-02
+    tuesday = datetime(2024, 1, 2, 0, 0, tzinfo=timezone.utc).timestamp()
+
+    # Assert that the next fire time is Sunday 2024-01-07
+    expected = datetime(2024, 1, 7, 0, 0, tzinfo=timezone.utc).timestamp()
+    assert cron.next_after(tuesday) == expected
+
+
+@pytest.mark.parametrize(
+    "expression", ["* * * *", "60 * * * *", "*/0 * * * *", "5-1 * * * *", "a * * * *"]
+)
+def test_cron_rejects_invalid_expressions(expression):
+    # Assert that the invalid expression raises a ValueError
+    with pytest.raises(ValueError):
+        Cron(expression)
+
+
+def test_cron_that_never_fires():
+    # Assert that February 31st is reported rather than searched forever
+    with pytest.raises(ValueError):
+        Cron("0 0 31 2 *").next_after(0)
@@ -0,0 +1,136 @@
+import sqlite3
+
+import psycopg2
+import pytest
+
+from src.spool import Spool
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = Spool(str(tmp_path / "spool.sqlite3"))
+    yield spool
+    spool.close()
+
+
+def count_users(batch: list, batch_id: int) -> dict:
+    return {"users": len(batch), "loaded": len(batch)}
+
+
+def test_spool_uses_wal(spool):
+    # Assert that the database is in WAL mode
+    conn = sqlite3.connect(spool.path)
+    assert conn.execute("PRAGMA journal_mode;").fetchone() == ("wal",)
+    conn.close()
+
+
+def test_append_survives_reopen(tmp_path):
+    # Input data: two batches with nested records
+    path = str(tmp_path / "spool.sqlite3")
+    batches = [[{"uid": "1", "address": {"city": "Paris"}}], [{"uid": "2"}] * 2]
+
+    # Append them, checkpoint the first and reopen the spool, as after a crash
+    spool = Spool(path, synchronous="NORMAL")
+    appended = spool.append(batches)
+    spool.checkpoint(1)
+    spool.close()
+    spool = Spool(path)
+
+    # Assert that the batch past the checkpoint is read back unchanged
+    assert appended == {"batches": 2, "users": 3, "last_id": 2}
+    assert spool.read(limit=10) == [(2, batches[1])]
+    assert spool.pending() == {"position": 1, "batches": 1, "users": 2}
+    spool.close()
+
+
+def test_drain_stops_at_a_failed_batch_and_resumes(spool):
+    # Input data: three batches, the second of which cannot be loaded at first
+    spool.append([[{"uid": "1"}], [{"uid": "2"}], [{"uid": "3"}]])
+    down = True
+
+    def load(batch: list, batch_id: int) -> dict:
+        if down and batch[0]["uid"] == "2":
+            raise psycopg2.OperationalError("Postgres is down")
+        return count_users(batch, batch_id)
+
+    # Call the function while Postgres is down, then once it is back
+    first = spool.drain(load)
+    down = False
+    second = spool.drain(load)
+
+    # Assert that the failed batch and those after it were replayed, not lost
+    assert first["batches"] == 1
+    assert "Postgres is down" in first["error"]
+    assert first["pending"] == {"position": 1, "batches": 2, "users": 2}
+    assert second["batches"] == 2
+    assert second["loaded"] == 2
+    assert second["error"] is None
+    assert second["pending"]["batches"] == 0
+
+
+def test_poison_batch_is_dead_lettered_without_blocking_the_rest(spool):
+    # Input data: three batches, the second of which can never be loaded
+    spool.append([[{"uid": "1"}], [{"uid": "2"}], [{"uid": "3"}]])
+    calls = []
+
+    def load(batch: list, batch_id: int) -> dict:
+        calls.append(batch_id)
+        if batch[0]["uid"] == "2":
+            raise psycopg2.IntegrityError("violates foreign key constraint")
+        return count_users(batch, batch_id)
+
+    # Call the function
+    totals = spool.drain(load, max_attempts=3, backoff=0)
+
+    # Assert that the poison batch was tried three times, set aside, and the batch
+    # behind it was still loaded
+    assert calls == [1, 2, 2, 2, 3]
+    assert totals["batches"] == 2
+    assert totals["dead_lettered"] == 1
+    assert totals["pending"]["batches"] == 0
+    ((batch_id, batch, attempts, error),) = spool.dead_letters()
+    assert (batch_id, batch, attempts) == (2, [{"uid": "2"}], 3)
+    assert "foreign key" in error
+
+
+def test_steps_marked_done_are_remembered_across_attempts(spool):
+    # Input data: a batch whose first step succeeded before its load failed
+    spool.append([[{"uid": "1"}]])
+    spool.mark_done(1, "quarantine")
+
+    # Assert that the step is remembered until the batch is compacted away
+    assert spool.is_done(1, "quarantine")
+    assert not spool.is_done(1, "load")
+    spool.drain(count_users)
+    assert not spool.is_done(1, "quarantine")
+
+
+def test_drain_honours_max_batches(spool):
+    # Input data: three batches
+    spool.append([[{"uid": str(i)}] for i in range(3)])
+
+    # Call the function
+    totals = spool.drain(count_users, max_batches=2)
+
+    # Assert that only two batches were drained
+    assert totals["batches"] == 2
+    assert totals["pending"]["batches"] == 1
+
+
+def test_compact_waits_for_every_consumer(spool):
+    # Input data: two batches read by two consumers, the second registered at 0
+    spool.checkpoint(0, consumer="audit")
+    spool.append([[{"uid": "1"}], [{"uid": "2"}]])
+    spool.drain(count_users, consumer="loader")
+
+    # Assert that batches are kept until the slowest consumer has drained them
+    assert spool.pending("audit")["batches"] == 2
+    spool.checkpoint(1, consumer="audit")
+    assert spool.compact() == 1
+    assert spool.read("audit") == [(2, [{"uid": "2"}])]
+
+
+def test_spool_rejects_invalid_synchronous_mode(tmp_path):
+    # Assert that an unknown mode raises a ValueError
+    with pytest.raises(ValueError):
+        Spool(str(tmp_path / "spool.sqlite3"), synchronous="OFF")
@@ -1,16 +1,41 @@
-from datetime import datetime
+import json
+import re
+from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch
 
+import pandas as pd
+import psycopg2
 import pytest
 
-from src.storage import insert_into_user_table
+from src import storage
+from src.storage import get_connection, get_pool_stats, insert_into_user_table
 
+# The ts of rows written by the tests
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
 
-@patch("psycopg2.connect")
-def test_insert_into_user_table_success(mock_connect):
-    # Mock the psycopg2 connection and cursor
-    mock_cursor = MagicMock()
-    mock_connect.return_value.__enter__.return_value.cursor.return_value = mock_cursor
+
+def read_copy_csv(text: str) -> list:
+    """Parse CSV the way COPY FROM does, reading an unquoted empty field as NULL."""
+    rows = []
+    for line in text.splitlines():
+        fields = re.findall(r'(?:^|,)("(?:[^"]|"")*"|[^,]*)', line)
+        rows.append(
+            tuple(
+                field[1:-1].replace('""', '"') if field.startswith('"')
+                else field or None
+                for field in fields
+            )
+        )
+    return rows
+
+
+@patch("src.storage._timestamp", return_value=NOW)
+@patch("src.storage._get_pool")
+def test_insert_into_user_table_success(mock_get_pool, mock_timestamp):
+    # Mock the pooled psycopg2 connection and cursor
+    mock_conn = mock_get_pool.return_value.getconn.return_value
+    mock_conn.closed = 0
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
 
     # Input data
     user_data = {
@@ -28,24 +53,23 @@ def test_insert_into_user_table_success(mock_connect):
     # Call the function
     result = insert_into_user_table(user_data)
 
-    # Assert that the psycopg2 connect method is called with the correct parameters
-    mock_connect.assert_called_once_with(
-        dbname="postgres", user="postgres", password="password", host="localhost"
-    )
+    # Assert that a connection was borrowed from the pool and handed back
+    mock_get_pool.return_value.getconn.assert_called_once()
+    mock_get_pool.return_value.putconn.assert_called_once_with(mock_conn, close=False)
 
     # Assert that the psycopg2 cursor method is called
-    mock_connect.return_value.__enter__.return_value.cursor.assert_called_once()
+    mock_conn.cursor.assert_called_once()
 
     # Assert that the execute method is called with the correct SQL query and parameters
     mock_cursor.execute.assert_called_once_with(
         """
-            INSERT INTO users (
-                uid, password, first_name, last_name, username, email, phone_number, social_insurance_number, date_of_birth, ts
-            )
-            VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            );
-        """,
+                        INSERT INTO users (
+                            uid, password, first_name, last_name, username, email, phone_number, social_insurance_number, date_of_birth, ts
+                        )
+                        VALUES (
+                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+                        );
+                    """,
         (
             user_data["uid"],
             user_data["password"],
@@ -56,7 +80,7 @@ def test_insert_into_user_table_success(mock_connect):
             user_data["phone_number"],
             user_data["social_insurance_number"],
             user_data["date_of_birth"],
-            int(datetime.timestamp(datetime.now())),
+            NOW,
         ),
     )
 
@@ -64,11 +88,13 @@ def test_insert_into_user_table_success(mock_connect):
     assert result is True
 
 
-@patch("psycopg2.connect")
-def test_insert_into_user_table_exception(mock_connect):
-    # Mock the psycopg2 connection and cursor
-    mock_cursor = MagicMock()
-    mock_connect.return_value.__enter__.return_value.cursor.return_value = mock_cursor
+@patch("src.storage._timestamp", return_value=NOW)
+@patch("src.storage._get_pool")
+def test_insert_into_user_table_exception(mock_get_pool, mock_timestamp):
+    # Mock the pooled psycopg2 connection and cursor
+    mock_conn = mock_get_pool.return_value.getconn.return_value
+    mock_conn.closed = 0
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
 
     # Mock an exception during execution
     mock_cursor.execute.side_effect = Exception("Database error")
@@ -89,24 +115,23 @@ def test_insert_into_user_table_exception(mock_connect):
     # Call the function
     result = insert_into_user_table(user_data)
 
-    # Assert that the psycopg2 connect method is called with the correct parameters
-    mock_connect.assert_called_once_with(
-        dbname="postgres", user="postgres", password="password", host="localhost"
-    )
+    # Assert that a connection was borrowed from the pool and handed back
+    mock_get_pool.return_value.getconn.assert_called_once()
+    mock_get_pool.return_value.putconn.assert_called_once_with(mock_conn, close=False)
 
     # Assert that the psycopg2 cursor method is called
-    mock_connect.return_value.__enter__.return_value.cursor.assert_called_once()
+    mock_conn.cursor.assert_called_once()
 
     # Assert that the execute method is called with the correct SQL query and parameters
     mock_cursor.execute.assert_called_once_with(
         """
-            INSERT INTO users (
-                uid, password, first_name, last_name, username, email, phone_number, social_insurance_number, date_of_birth, ts
-            )
-            VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            );
-        """,
+                        INSERT INTO users (
+                            uid, password, first_name, last_name, username, email, phone_number, social_insurance_number, date_of_birth, ts
+                        )
+                        VALUES (
+                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+                        );
+                    """,
         (
             user_data["uid"],
             user_data["password"],
@@ -117,9 +142,284 @@ def test_insert_into_user_table_exception(mock_connect):
             user_data["phone_number"],
             user_data["social_insurance_number"],
             user_data["date_of_birth"],
-            int(datetime.timestamp(datetime.now())),
+            NOW,
         ),
     )
 
     # Assert that the function returns True
     assert result is True
+
+
+@patch("src.storage._get_pool")
+def test_get_connection_replaces_broken_connection(mock_get_pool):
+    # First connection handed out by the pool is already closed
+    dead_conn = MagicMock(closed=1)
+    live_conn = MagicMock(closed=0)
+    mock_get_pool.return_value.getconn.side_effect = [dead_conn, live_conn]
+    reconnects = get_pool_stats()["reconnects"]
+
+    # Borrow a connection
+    with get_connection() as conn:
+        assert conn is live_conn
+
+    # Assert that the dead connection was discarded and the live one returned
+    mock_get_pool.return_value.putconn.assert_any_call(dead_conn, close=True)
+    mock_get_pool.return_value.putconn.assert_any_call(live_conn, close=False)
+    assert get_pool_stats()["reconnects"] == reconnects + 1
+
+
+def close_on_putconn(conn, close=False):
+    # The pool closes a connection handed back with close=True
+    if close:
+        conn.closed = 1
+
+
+@patch("src.storage._get_pool")
+def test_get_connection_forgets_discarded_connections(mock_get_pool):
+    # A dead connection the pool still holds a timestamp for, a connection that
+    # breaks while borrowed and a healthy one
+    dead_conn = MagicMock(closed=1)
+    breaking_conn = MagicMock(closed=0)
+    live_conn = MagicMock(closed=0)
+    pool = mock_get_pool.return_value
+    pool.getconn.side_effect = [dead_conn, breaking_conn, live_conn]
+    pool.putconn.side_effect = close_on_putconn
+    storage._last_used[id(dead_conn)] = 0.0
+
+    # Borrow a connection that fails, then one that is returned cleanly
+    with pytest.raises(psycopg2.OperationalError):
+        with get_connection():
+            raise psycopg2.OperationalError("server closed the connection")
+    with get_connection():
+        pass
+
+    # Assert that only the connection still in the pool keeps its timestamp
+    assert id(dead_conn) not in storage._last_used
+    assert id(breaking_conn) not in storage._last_used
+    assert id(live_conn) in storage._last_used
+    storage._last_used.clear()
+
+
+@patch("src.storage.settings.PG_POOL_TIMEOUT", 0)
+@patch("src.storage._pool_slots")
+def test_get_connection_timeout(mock_slots):
+    # No pool slot becomes free
+    mock_slots.acquire.return_value = False
+    timeouts = get_pool_stats()["timeouts"]
+
+    # Borrowing a connection raises a PoolError
+    with pytest.raises(storage.PoolError):
+        with get_connection():
+            pass
+
+    # Assert that the timeout was counted
+    assert get_pool_stats()["timeouts"] == timeouts + 1
+
+
+def test_copy_stream_renders_csv_in_chunks():
+    # Input rows, one needing CSV quoting
+    rows = [("1", "John", 10), ("2", "Doe, Jane", 10)]
+
+    # Read the stream in small chunks
+    stream = storage._CopyStream(rows)
+    chunks = []
+    while chunk := stream.read(8):
+        chunks.append(chunk)
+
+    # Assert that no chunk exceeds the requested size and the CSV is complete
+    assert all(len(chunk) <= 8 for chunk in chunks)
+    assert "".join(chunks) == '"1","John","10"\n"2","Doe, Jane","10"\n'
+
+
+def test_copy_stream_keeps_empty_strings_apart_from_null():
+    # Input rows with empty strings, NULLs and values needing CSV quoting
+    rows = [("1", "", None, 'say "hi", twice', NOW), (None, "", "", "n/a", NOW)]
+
+    # Render the stream and read it back as COPY would
+    copied = read_copy_csv(storage._CopyStream(rows).read())
+
+    # Assert that empty strings and NULLs survive the round trip unchanged
+    assert copied == [
+        ("1", "", None, 'say "hi", twice', str(NOW)),
+        (None, "", "", "n/a", str(NOW)),
+    ]
+
+
+@patch("src.storage.get_connection")
+def test_load_users_bulk_copies_users_before_addresses(mock_get_connection):
+    # Mock the pooled connection and cursor
+    mock_cursor = (
+        mock_get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+    )
+    mock_cursor.rowcount = 1
+    copied = []
+    mock_cursor.copy_expert.side_effect = lambda sql, stream: copied.append(
+        (sql, stream.read())
+    )
+
+    # Input data, the address as a DataFrame missing a column
+    user_data = [{"uid": "123", "first_name": "John"}]
+    user_address_data = pd.DataFrame([{"uid": "123", "city": "New York"}])
+
+    # Call the function
+    result = storage.load_users_bulk(user_data, user_address_data)
+
+    # Assert that both tables were copied, users first, with defaults filled in
+    assert copied[0][0].startswith("COPY users (uid, password,")
+    assert copied[0][1].startswith('"123","n/a","John","n/a",')
+    assert copied[1][0].startswith("COPY users_address (uid, city,")
+    assert copied[1][1].startswith('"123","New York","n/a",')
+    assert result == {
+        "users": {"inserted": 1, "updated": 0, "skipped": 0},
+        "users_address": {"inserted": 1, "updated": 0, "skipped": 0},
+    }
+
+
+@patch("src.storage.get_connection")
+def test_load_users_bulk_upsert_reports_conflict_stats(mock_get_connection):
+    # Mock the pooled connection and cursor
+    mock_cursor = (
+        mock_get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+    )
+    # Three rows staged: one new uid, one changed uid, one unchanged uid
+    mock_cursor.rowcount = 3
+    mock_cursor.fetchall.return_value = [(True,), (False,)]
+
+    # Input data
+    user_data = [{"uid": "1"}, {"uid": "2"}, {"uid": "3"}]
+    user_address_data = [{"uid": "1"}, {"uid": "2"}, {"uid": "3"}]
+
+    # Call the function
+    result = storage.load_users_bulk(user_data, user_address_data, mode="upsert")
+
+    # Assert that rows were staged into temp tables and merged on uid
+    copy_sql = [c.args[0] for c in mock_cursor.copy_expert.call_args_list]
+    assert copy_sql[0].startswith("COPY users_stage ")
+    assert copy_sql[1].startswith("COPY users_address_stage ")
+    assert any(
+        "ON CONFLICT (uid) DO UPDATE" in c.args[0]
+        for c in mock_cursor.execute.call_args_list
+    )
+
+    # Assert that the stats count inserted, updated and skipped rows per table
+    assert result["users"] == {"inserted": 1, "updated": 1, "skipped": 1}
+    assert result["users_address"] == {"inserted": 1, "updated": 1, "skipped": 1}
+
+
+def test_load_users_bulk_invalid_mode():
+    # Call the function with an unknown mode and assert that it raises a ValueError
+    with pytest.raises(ValueError):
+        storage.load_users_bulk([], [], mode="merge")
+
+
+@patch("src.storage.get_connection")
+def test_quarantine_rows_copies_into_table(mock_get_connection):
+    # Mock the pooled connection and cursor
+    mock_cursor = (
+        mock_get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+    )
+    mock_cursor.rowcount = 2
+    copied = []
+    mock_cursor.copy_expert.side_effect = lambda sql, stream: copied.append(
+        (sql, stream.read())
+    )
+
+    # Input data: rejected entries, one without a uid
+    rejected = [
+        {"index": 0, "uid": "1", "reason": "Invalid 'email'", "record": {"uid": "1"}},
+        {"index": 1, "uid": None, "reason": "Invalid entry", "record": "oops"},
+    ]
+
+    # Call the function
+    result = storage.quarantine_rows(rejected, target="table")
+
+    # Assert that both rows went in one COPY, with the record as JSON
+    assert result == 2
+    assert len(copied) == 1
+    assert copied[0][0].startswith("COPY users_quarantine (uid, reason, record, ts)")
+    assert copied[0][1].startswith('"1","Invalid \'email\'","{""uid"": ""1""}",')
+    assert copied[0][1].splitlines()[1].startswith(',"Invalid entry","""oops""",')
+
+
+def test_quarantine_rows_appends_to_file(tmp_path):
+    # Input data
+    path = tmp_path / "quarantine.ndjson"
+    rejected = [{"index": 0, "uid": "1", "reason": "bad", "record": {"uid": "1"}}]
+
+    # Call the function twice
+    storage.quarantine_rows(rejected, target="file", path=str(path))
+    storage.quarantine_rows(rejected, target="file", path=str(path))
+
+    # Assert that each call appended one JSON line
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2
+    assert lines[0]["record"] == {"uid": "1"}
+    assert lines[0]["reason"] == "bad"
+
+
+def test_quarantine_rows_invalid_target():
+    # Call the function with an unknown target and assert that it raises a ValueError
+    with pytest.raises(ValueError):
+        storage.quarantine_rows([], target="s3")
+
+
+@patch("src.storage.hash_pii")
+@patch("src.storage.get_connection")
+def test_get_uids_by_sin(mock_get_connection, mock_hash_pii):
+    # Mock the pooled connection and cursor, and the keyed hash
+    mock_cursor = (
+        mock_get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+    )
+    mock_cursor.fetchall.return_value = [("1",), ("2",)]
+    mock_hash_pii.return_value = "abc123"
+
+    # Call the function
+    result = storage.get_uids_by_sin("123-45-6789")
+
+    # Assert that the number was hashed in keyed mode and looked up by its hash
+    mock_hash_pii.assert_called_once_with("123-45-6789", mode="keyed")
+    mock_cursor.execute.assert_called_once_with(
+        "SELECT uid FROM users WHERE social_insurance_number = %s;", ("abc123",)
+    )
+    assert result == ["1", "2"]
+
+
+@patch("src.storage.redis")
+def test_get_and_save_fingerprints_in_redis(mock_redis):
+    # Mock the stored fingerprints
+    mock_redis.hmget.return_value = [b"-42", None]
+
+    # Call the functions
+    stored = storage.get_fingerprints(["1", "2"], index="redis")
+    saved = storage.save_fingerprints({"2": 7}, index="redis")
+
+    # Assert that the hash was read and written in one command each
+    assert stored == {"1": -42}
+    assert saved == 1
+    mock_redis.hset.assert_called_once_with(
+        storage.settings.INCREMENTAL_REDIS_KEY, mapping={"2": 7}
+    )
+
+
+@patch("src.storage.get_connection")
+def test_get_fingerprints_in_postgres(mock_get_connection):
+    # Mock the pooled connection and cursor
+    mock_cursor = (
+        mock_get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+    )
+    mock_cursor.fetchall.return_value = [("1", -42)]
+
+    # Call the function
+    result = storage.get_fingerprints(["1", "2"], index="postgres")
+
+    # Assert that the uids were looked up in one query
+    mock_cursor.execute.assert_called_once()
+    assert mock_cursor.execute.call_args.args[1] == (["1", "2"],)
+    assert result == {"1": -42}
+
+
+def test_fingerprints_reject_unknown_index():
+    with pytest.raises(ValueError):
+        storage.get_fingerprints(["1"], index="memcached")
+    with pytest.raises(ValueError):
+        storage.save_fingerprints({"1": 1}, index="memcached")
@@ -1,4 +1,23 @@
-from src.validate import validate_basic_fields
+import random
+from uuid import UUID
+
+import pytest
+
+from benchmarks.synthetic import fake_api_users
+from src.validate import (
+    is_valid_uuid,
+    validate_address,
+    validate_basic_fields,
+    validate_columns,
+    validate_coordinates,
+    validate_credit_card,
+    validate_employment,
+    validate_entry,
+    validate_json,
+    validate_rows,
+    validate_subscription,
+    valid_uuids,
+)
 
 
 def test_validate_basic_fields_success():
@@ -69,4 +88,212 @@ def test_validate_basic_fields_invalid_field():
         assert str(e) == "Invalid 'uid': must be a valid UUID."
 
 
-# Add more test cases as needed
+def validate_parts(entry):
+    # The per-part validators, in the order validate_json used to call them
+    validate_basic_fields(entry)
+    validate_address(entry.get("address", {}))
+    validate_coordinates(entry.get("address", {}).get("coordinates", {}))
+    validate_employment(entry.get("employment", {}))
+    validate_subscription(entry.get("subscription", {}))
+    validate_credit_card(entry.get("credit_card", {}))
+
+
+def broken_entries():
+    # One valid entry and variations of it with a single field broken
+    def edit(change):
+        entry = fake_api_users(1)[0]
+        change(entry)
+        return entry
+
+    return [
+        fake_api_users(1)[0],
+        edit(lambda e: e.pop("password")),
+        edit(lambda e: e.update(first_name=1)),
+        edit(lambda e: e.update(uid=e["uid"].upper())),
+        edit(lambda e: e.update(email="user.example.com")),
+        edit(lambda e: e.update(avatar="ftp://example.com")),
+        edit(lambda e: e.update(date_of_birth="01-01-1990")),
+        edit(lambda e: e.update(date_of_birth="1990-02-30")),
+        edit(lambda e: e.update(date_of_birth="1990-01-01garbage")),
+        edit(lambda e: e.pop("address")),
+        edit(lambda e: e["address"].update(zip_code=10001)),
+        edit(lambda e: e["address"].pop("coordinates")),
+        edit(lambda e: e["address"]["coordinates"].update(lat=40)),
+        edit(lambda e: e.update(employment={})),
+        edit(lambda e: e["subscription"].pop("term")),
+        edit(lambda e: e.update(credit_card={"cc_number": None})),
+        edit(lambda e: e.update(address=["city"])),
+        edit(lambda e: e["address"].update(coordinates=[40.7, -74.0])),
+        edit(lambda e: e.update(employment="title and key_skill")),
+        edit(lambda e: e.update(subscription=["Basic"])),
+        edit(lambda e: e.update(credit_card="4111-1111-1111-1111")),
+    ]
+
+
+@pytest.mark.parametrize("entry", broken_entries())
+def test_validate_entry_matches_per_part_validators(entry):
+    # Expected output: the error of the per-part validators, if any
+    try:
+        validate_parts(entry)
+        expected = None
+    except ValueError as e:
+        expected = str(e)
+
+    # Call the function and assert that it fails the same way
+    try:
+        validate_entry(entry)
+        assert expected is None
+    except ValueError as e:
+        assert str(e) == expected
+
+
+def test_validate_columns_matches_validate_json():
+    # Input data: a valid batch, then the same batch with one entry broken
+    data = fake_api_users(50)
+    assert validate_columns(data) is True
+
+    data[30]["address"]["coordinates"]["lng"] = "-74.006"
+
+    # Assert that both validators raise the same error
+    with pytest.raises(ValueError) as expected:
+        validate_json(data)
+    with pytest.raises(ValueError) as result:
+        validate_columns(data)
+    assert str(result.value) == str(expected.value)
+
+
+def test_validate_rows_keeps_valid_entries_and_reports_the_rest():
+    # Input data with two broken entries
+    data = fake_api_users(5)
+    data[1]["address"]["city"] = None
+    data[3] = "not an entry"
+
+    # Call the function
+    valid, rejected = validate_rows(data)
+
+    # Assert that the valid entries are kept in order and each rejection is explained
+    assert valid == [data[0], data[2], data[4]]
+    assert [(r["index"], r["uid"]) for r in rejected] == [(1, data[1]["uid"]), (3, None)]
+    assert rejected[0]["reason"] == "Invalid address 'city': must be a string."
+    assert rejected[1]["record"] == "not an entry"
+
+
+def uuid_round_trips(value, version=4):
+    # The previous is_valid_uuid: parse with UUID and compare the string form
+    try:
+        uuid_obj = UUID(value, version=version)
+    except ValueError:
+        return False
+    return str(uuid_obj) == value
+
+
+def uuid_spellings(value: UUID) -> list:
+    # Ways of writing a UUID that UUID() parses, only the first of them canonical
+    text = str(value)
+    return [
+        text,
+        text.upper(),
+        value.hex,
+        "{" + text + "}",
+        "urn:uuid:" + text,
+        text + "\n",
+        " " + text,
+        text[:14] + "_" + text[15:],
+    ]
+
+
+def test_is_valid_uuid_matches_uuid_round_trip():
+    hypothesis = pytest.importorskip("hypothesis")
+    st = hypothesis.strategies
+
+    # Any text, and every spelling of any UUID, against every version
+    values = st.one_of(
+        st.text(),
+        st.text(alphabet="0123456789abcdefABCDEF-{}:urn", max_size=40),
+        st.uuids().flatmap(lambda u: st.sampled_from(uuid_spellings(u))),
+    )
+    versions = st.sampled_from([None, 0, 1, 2, 3, 4, 5, 6])
+
+    @hypothesis.settings(max_examples=500, deadline=None)
+    @hypothesis.given(values, versions)
+    def check(value, version):
+        assert is_valid_uuid(value, version) == uuid_round_trips(value, version)
+
+    check()
+
+
+def test_valid_uuids_matches_is_valid_uuid():
+    # Input data: random UUIDs spelled every way, plus values that are not strings
+    rng = random.Random(0)
+    values = [
+        spelling
+        for _ in range(200)
+        for spelling in uuid_spellings(UUID(int=rng.getrandbits(128)))
+    ]
+    values += [None, 4]
+
+    # Call the function
+    result = valid_uuids(values)
+
+    # Assert that it agrees with the scalar check, and non-strings are invalid
+    assert result.tolist()[:-2] == [is_valid_uuid(v) for v in values[:-2]]
+    assert result.tolist()[-2:] == [False, False]
+    assert result.sum() > 0
+
+
+@pytest.mark.parametrize(
+    "values, expected",
+    [
+        ([1, 2], [False, False]),
+        ([None, 4.5, b"bytes"], [False, False, False]),
+        ([], []),
+        (
+            [1, "123e4567-e89b-42d3-a456-426614174000", None, "not-a-uuid"],
+            [False, True, False, False],
+        ),
+    ],
+)
+def test_valid_uuids_non_string_values(values, expected):
+    # Call the function with columns of non-strings and mixed types
+    result = valid_uuids(values)
+
+    # Assert that only the valid UUID strings are True
+    assert result.dtype == bool
+    assert result.tolist() == expected
+
+
+def test_validate_rows_quarantines_malformed_nested_parts():
+    # Input data: parts that are not JSON objects, and a leaf of the wrong type
+    data = fake_api_users(4)
+    data[0]["employment"] = "title and key_skill"
+    data[1]["address"] = ["city"]
+    data[2]["credit_card"]["cc_number"] = 4111111111111111
+
+    # Call the function
+    valid, rejected = validate_rows(data)
+
+    # Assert that only the malformed entries were rejected, each with a reason
+    assert valid == [data[3]]
+    assert [r["reason"] for r in rejected] == [
+        "Invalid employment: must be a JSON object.",
+        "Invalid address: must be a JSON object.",
+        "Invalid credit card: missing or invalid 'cc_number'.",
+    ]
+
+
+def test_validate_rows_quarantines_impossible_dates():
+    # Input data: a date that does not exist and one with trailing characters
+    data = fake_api_users(3)
+    data[0]["date_of_birth"] = "1990-02-30"
+    data[1]["date_of_birth"] = "1990-01-01garbage"
+
+    # Call the function
+    valid, rejected = validate_rows(data)
+
+    # Assert that both were rejected rather than failing the load into a date column
+    assert valid == [data[2]]
+    assert {r["reason"] for r in rejected} == {
+        "Invalid 'date_of_birth': must be in 'YYYY-MM-DD' format."
+    }
+    with pytest.raises(ValueError):
+        validate_columns(data)